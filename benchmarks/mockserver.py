@@ -0,0 +1,269 @@
+#!/usr/bin/env python3
+"""A local stand-in for the Archive.org APIs used by iamine.
+
+The server indexes ITEMS synthetic items named ``mock-item-00000000``,
+``mock-item-00000001``, ..., and serves:
+
+- ``/metadata/<identifier>``, including the ``iamine-rate-limiter``
+  item, which reports a rate limit of RATE requests per second, and
+  ``/metadata/<identifier>/<subpath>``
+- ``/advancedsearch.php`` (``q``, ``rows``, ``page`` and ``fl[]`` are
+  honored, the query itself is ignored unless it looks up identifiers,
+  as in ``identifier:("a" OR "b")``)
+- ``/services/search/v1/scrape`` (``count``, ``fields`` and ``cursor``)
+- ``/?check_auth=1``, standing in for the S3 key check, which accepts
+  any keys
+
+Every response is delayed by about LATENCY seconds, a fraction
+ERROR_RATE of them fail with a 503, and item metadata is padded to at
+least PAYLOAD bytes.
+
+Start it with ``python -m benchmarks.mockserver``, and point iamine at
+it with a hosts file containing ``HOST:PORT`` and a config file
+containing::
+
+    [iamine]
+    auth-url = http://HOST:PORT/?check_auth=1
+    rate-limit-url = http://HOST:PORT/metadata/iamine-rate-limiter
+
+For example:
+
+    $ python -m benchmarks.mockserver --port 8080 &
+    $ echo 127.0.0.1:8080 > hosts.txt
+    $ ia-mine --config-file mock.ini --hosts hosts.txt itemlist.txt
+
+usage: mockserver.py [--host HOST] [--port PORT] [--items ITEMS]
+                     [--latency LATENCY] [--error-rate ERROR_RATE]
+                     [--payload-size PAYLOAD] [--rate RATE]
+
+options:
+  --host HOST                The address to listen on. [default: 127.0.0.1]
+  --port PORT                The port to listen on. [default: 8080]
+  --items ITEMS              The number of items to index. [default: 10000]
+  --latency LATENCY          The mean response latency, in seconds. Latencies
+                             are uniformly distributed between half and one
+                             and a half times this. [default: 0]
+  --error-rate ERROR_RATE    The fraction of requests to fail. [default: 0]
+  --payload-size PAYLOAD     The minimum size of item metadata, in bytes.
+                             [default: 0]
+  --rate RATE                The rate limit to report, in requests per second.
+                             [default: 100000]
+
+"""
+import re
+import sys
+import json
+import random
+import asyncio
+
+from aiohttp import web
+from docopt import docopt
+
+
+class MockArchive(object):
+    """The mock Archive.org.
+
+    :param items: (optional) The number of items to index. Defaults to
+                  10000.
+    :type items: int
+
+    :param latency: (optional) The mean response latency, in seconds.
+    :type latency: float
+
+    :param error_rate: (optional) The fraction of requests to fail with
+                       a 503.
+    :type error_rate: float
+
+    :param payload_size: (optional) The minimum size of item metadata,
+                         in bytes.
+    :type payload_size: int
+
+    :param rate: (optional) The rate limit reported by the
+                 ``iamine-rate-limiter`` item. Defaults to 100000.
+    :type rate: int
+    """
+
+    def __init__(self, items=None, latency=None, error_rate=None, payload_size=None,
+                 rate=None):
+        self.items = 10000 if items is None else items
+        self.latency = 0 if not latency else latency
+        self.error_rate = 0 if not error_rate else error_rate
+        self.payload_size = 0 if not payload_size else payload_size
+        self.rate = 100000 if not rate else rate
+        self.requests = 0
+        self.errors = 0
+
+    @asyncio.coroutine
+    def simulate(self):
+        """Delay the response, and decide whether it should fail.
+
+        :rtype: bool
+        :returns: ``True`` if the request should fail.
+        """
+        self.requests += 1
+        if self.latency:
+            yield from asyncio.sleep(self.latency * random.uniform(.5, 1.5))
+        if self.error_rate and (random.random() < self.error_rate):
+            self.errors += 1
+            return True
+        return False
+
+    def identifier(self, i):
+        return 'mock-item-{:08d}'.format(i)
+
+    def index(self, identifier):
+        """Get the number of the item ``identifier``, or ``None`` if it
+        isn't indexed.
+        """
+        prefix, _, i = identifier.rpartition('-')
+        if (prefix != 'mock-item') or (not i.isdigit()) or (int(i) >= self.items):
+            return None
+        return int(i)
+
+    def doc(self, i, fields=None):
+        doc = {
+            'identifier': self.identifier(i),
+            'title': 'Mock item {}'.format(i),
+            'collection': ['mock-collection'],
+            'addeddate': '2015-01-01 00:00:00',
+            'oai_updatedate': ['2015-01-01T00:00:00Z'],
+        }
+        if fields:
+            doc = dict((k, v) for k, v in doc.items() if k in fields)
+        return doc
+
+    def json_response(self, j, status=200):
+        return web.Response(body=json.dumps(j).encode('utf-8'),
+                            status=status,
+                            headers={'Content-Type': 'application/json'})
+
+    def error_response(self):
+        return self.json_response({'error': 'Service Unavailable'}, status=503)
+
+    @asyncio.coroutine
+    def check_auth(self, request):
+        return self.json_response({'authorized': True})
+
+    @asyncio.coroutine
+    def metadata(self, request):
+        identifier = request.match_info['identifier']
+        if identifier == 'iamine-rate-limiter':
+            return self.json_response({'metadata': {'rate_per_second': self.rate}})
+        if (yield from self.simulate()):
+            return self.error_response()
+        if not identifier.startswith('mock-item-'):
+            return self.json_response({})
+        return self.json_response(self.item(identifier))
+
+    def item(self, identifier):
+        i = int(identifier.rsplit('-', 1)[-1])
+        metadata = self.doc(i)
+        if self.payload_size:
+            metadata['description'] = 'x' * self.payload_size
+        return {
+            'created': 1420070400,
+            'files': [{'name': '{}.txt'.format(identifier), 'md5': '{:032x}'.format(i)}],
+            'metadata': metadata,
+        }
+
+    @asyncio.coroutine
+    def metadata_subpath(self, request):
+        if (yield from self.simulate()):
+            return self.error_response()
+        identifier = request.match_info['identifier']
+        if not identifier.startswith('mock-item-'):
+            return self.json_response({})
+        value = self.item(identifier)
+        for key in request.match_info['subpath'].strip('/').split('/'):
+            if isinstance(value, list) and key.isdigit() and int(key) < len(value):
+                value = value[int(key)]
+            elif isinstance(value, dict) and key in value:
+                value = value[key]
+            else:
+                return self.json_response({})
+        return self.json_response({'result': value})
+
+    @asyncio.coroutine
+    def advancedsearch(self, request):
+        if (yield from self.simulate()):
+            return self.error_response()
+        rows = int(request.GET.get('rows', 50))
+        page = int(request.GET.get('page', 1))
+        fields = [v for k, v in request.GET.items() if k.startswith('fl')]
+        start = (page - 1) * rows
+        query = request.GET.get('q', '')
+        if query.startswith('identifier:('):
+            found = [i for i in map(self.index, re.findall(r'"((?:[^"\\]|\\.)*)"', query))
+                     if i is not None]
+            num_found = len(found)
+            docs = [self.doc(i, fields) for i in found[start:start + rows]]
+        else:
+            num_found = self.items
+            docs = [self.doc(i, fields) for i in range(start, min(start + rows, self.items))]
+        return self.json_response({
+            'responseHeader': {'status': 0, 'QTime': 0, 'params': dict(request.GET)},
+            'response': {'numFound': num_found, 'start': start, 'docs': docs},
+        })
+
+    @asyncio.coroutine
+    def scrape(self, request):
+        if (yield from self.simulate()):
+            return self.error_response()
+        count = int(request.GET.get('count', 10000))
+        fields = request.GET.get('fields', 'identifier').split(',')
+        start = int(request.GET.get('cursor', 0))
+        end = min(start + count, self.items)
+        j = {
+            'items': [self.doc(i, fields) for i in range(start, end)],
+            'count': end - start,
+            'total': self.items,
+        }
+        if end < self.items:
+            j['cursor'] = str(end)
+        return self.json_response(j)
+
+    def make_app(self, loop=None):
+        app = web.Application(loop=loop)
+        app.router.add_route('GET', '/metadata/{identifier}', self.metadata)
+        app.router.add_route('GET', '/metadata/{identifier}/{subpath:.+}', self.metadata_subpath)
+        app.router.add_route('GET', '/advancedsearch.php', self.advancedsearch)
+        app.router.add_route('GET', '/services/search/v1/scrape', self.scrape)
+        app.router.add_route('GET', '/', self.check_auth)
+        return app
+
+
+@asyncio.coroutine
+def start_server(archive, host='127.0.0.1', port=8080, loop=None):
+    """Start serving ``archive``.
+
+    :rtype: tuple
+    :returns: The :class:`asyncio.Server` and the aiohttp request
+              handler, which should be finished with
+              ``yield from handler.finish_connections()`` on shutdown.
+    """
+    loop = asyncio.get_event_loop() if not loop else loop
+    handler = archive.make_app(loop).make_handler()
+    server = yield from loop.create_server(handler, host, port)
+    return server, handler
+
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    host, port = args['--host'], int(args['--port'])
+
+    loop = asyncio.get_event_loop()
+    archive = MockArchive(items=int(args['--items']),
+                          latency=float(args['--latency']),
+                          error_rate=float(args['--error-rate']),
+                          payload_size=int(args['--payload-size']),
+                          rate=int(args['--rate']))
+    loop.run_until_complete(start_server(archive, host, port, loop))
+    sys.stderr.write('Serving on {}:{}\n'.format(host, port))
+    try:
+        loop.run_forever()
+    except KeyboardInterrupt:
+        pass
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,305 @@
+#!/usr/bin/env python3
+"""Benchmark iamine against a local mock Archive.org.
+
+The mock server (see ``benchmarks/mockserver.py``) and each benchmark
+run in processes of their own, so that the CPU time and peak memory
+measured for a benchmark are iamine's alone. The benchmarks are:
+
+- ``mine_items``: ``ItemMiner.mine_items`` over every item
+- ``fields``: ``ItemMiner.mine_items`` with ``fields``, one request per
+  item
+- ``batch``: ``ItemMiner.mine_items`` with ``fields`` looked up in
+  batches of ROWS items with search queries
+- ``search``: ``SearchMiner.search``, paging through every item
+- ``search_mine_ids``: ``SearchMiner.search`` with ``mine_ids``
+- ``scrape``: ``SearchMiner.search`` with ``scrape`` and ``mine_ids``
+- ``cli``: ``ia-mine`` over an itemlist of every item
+
+Results are written as a JSON document. Given the results of an
+earlier run with --baseline, the exit status is 1 if any benchmark's
+throughput dropped, or its peak memory grew, by more than --tolerance
+percent.
+
+usage: run.py [--items ITEMS] [--workers WORKERS] [--rows ROWS]
+              [--latency LATENCY] [--error-rate ERROR_RATE]
+              [--payload-size PAYLOAD] [--port PORT] [--output FILE]
+              [--baseline FILE] [--tolerance PCT] [<benchmark>...]
+
+options:
+  --items ITEMS              The number of items to mine. [default: 10000]
+  --workers WORKERS          The number of workers. [default: 100]
+  --rows ROWS                The number of search results per page.
+                             [default: 100]
+  --latency LATENCY          The mean response latency, in seconds.
+                             [default: 0]
+  --error-rate ERROR_RATE    The fraction of requests to fail. [default: 0]
+  --payload-size PAYLOAD     The minimum size of item metadata, in bytes.
+                             [default: 0]
+  --port PORT                The port to run the mock server on.
+                             [default: 8765]
+  -o, --output FILE          Write results to FILE instead of stdout.
+  --baseline FILE            Compare results to those in FILE.
+  --tolerance PCT            The regression allowed, in percent. [default: 10]
+
+"""
+import os
+import sys
+import json
+import time
+import socket
+import asyncio
+import platform
+import resource
+import tempfile
+import subprocess
+import multiprocessing
+
+from docopt import docopt
+
+from iamine import __version__
+from iamine.core import ItemMiner, SearchMiner
+from iamine.output import StreamSink
+
+from .mockserver import MockArchive, start_server
+
+
+BENCHMARKS = ['mine_items', 'fields', 'batch', 'search', 'search_mine_ids', 'scrape', 'cli']
+
+HOST = '127.0.0.1'
+
+
+def max_rss(ru):
+    """Get the peak memory use from ``ru``, in bytes."""
+    # ru_maxrss is in kilobytes on Linux, and in bytes on OS X.
+    return ru.ru_maxrss if sys.platform == 'darwin' else ru.ru_maxrss * 1024
+
+
+def usage(user, system, rss, elapsed, items):
+    return dict(
+        items=items,
+        elapsed=elapsed,
+        items_per_second=items / elapsed if elapsed else None,
+        cpu_user=user,
+        cpu_system=system,
+        cpu_per_item=(user + system) / items if items else None,
+        max_rss=rss,
+    )
+
+
+def summarize_stats(snapshot):
+    return dict((k, snapshot.get(k)) for k in ('requests', 'errors', 'retries', 'failed',
+                                               'bytes', 'latency'))
+
+
+def write_config(path, port):
+    with open(path, 'w') as fh:
+        fh.write('[s3]\n'
+                 'access = mock\n'
+                 'secret = mock\n\n'
+                 '[iamine]\n'
+                 'auth-url = http://{0}:{1}/?check_auth=1\n'
+                 'rate-limit-url = http://{0}:{1}/metadata/iamine-rate-limiter\n'.format(
+                     HOST, port))
+
+
+def serve(archive, port):
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    loop.run_until_complete(start_server(archive, HOST, port, loop))
+    loop.run_forever()
+
+
+def wait_for_server(port, timeout=10):
+    deadline = time.monotonic() + timeout
+    while True:
+        try:
+            socket.create_connection((HOST, port), 1).close()
+            return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(.05)
+
+
+def run_miner(name, opts, results):
+    """Run the library benchmark ``name``, and put its results on the
+    ``results`` queue. Runs in a process of its own.
+    """
+    before = resource.getrusage(resource.RUSAGE_SELF)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    devnull = open(os.devnull, 'wb')
+    kwargs = dict(
+        loop=loop,
+        max_tasks=opts['workers'],
+        hosts=['{}:{}'.format(HOST, opts['port'])],
+        config_file=opts['config'],
+        sink=StreamSink(devnull),
+        # Measure startup as a fresh run would.
+        startup_ttl=0,
+    )
+    params = {'rows': opts['rows']}
+    archive = MockArchive(opts['items'])
+
+    start = time.monotonic()
+    if name in ('mine_items', 'fields', 'batch'):
+        if name != 'mine_items':
+            kwargs['fields'] = ['metadata.title', 'metadata.collection']
+        if name == 'batch':
+            kwargs['batch_size'] = opts['rows']
+        miner = ItemMiner(**kwargs)
+        identifiers = (archive.identifier(i) for i in range(opts['items']))
+        loop.run_until_complete(miner.mine_items(identifiers))
+    else:
+        miner = SearchMiner(**kwargs)
+        loop.run_until_complete(miner.search('mock', params=params,
+                                             mine_ids=(name != 'search'),
+                                             scrape=(name == 'scrape')))
+    elapsed = time.monotonic() - start
+    miner.shutdown()
+    devnull.close()
+
+    after = resource.getrusage(resource.RUSAGE_SELF)
+    result = usage(after.ru_utime - before.ru_utime, after.ru_stime - before.ru_stime,
+                   max_rss(after), elapsed, opts['items'])
+    result.update(summarize_stats(miner.stats.snapshot()))
+    results.put(result)
+
+
+def run_cli(opts):
+    """Run ``ia-mine`` over an itemlist in a child process."""
+    tmpdir = opts['tmpdir']
+    itemlist = os.path.join(tmpdir, 'itemlist.txt')
+    hosts = os.path.join(tmpdir, 'hosts.txt')
+    stats = os.path.join(tmpdir, 'stats.json')
+    archive = MockArchive(opts['items'])
+    with open(itemlist, 'w') as fh:
+        for i in range(opts['items']):
+            fh.write('{}\n'.format(archive.identifier(i)))
+    with open(hosts, 'w') as fh:
+        fh.write('{}:{}\n'.format(HOST, opts['port']))
+
+    cmd = [sys.executable, '-m', 'iamine', itemlist,
+           '--config-file', opts['config'],
+           '--hosts', hosts,
+           '--workers', str(opts['workers']),
+           '--output', os.devnull,
+           '--stats', stats,
+           '--startup-ttl', '0']
+    env = dict(os.environ)
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env['PYTHONPATH'] = os.pathsep.join(p for p in [root, env.get('PYTHONPATH')] if p)
+
+    start = time.monotonic()
+    p = subprocess.Popen(cmd, env=env, stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+    # wait4 gives the resource usage of this child alone.
+    _, status, ru = os.wait4(p.pid, 0)
+    elapsed = time.monotonic() - start
+    p.returncode = os.WEXITSTATUS(status)
+    if p.returncode != 0:
+        raise RuntimeError('ia-mine exited with status {}'.format(p.returncode))
+
+    result = usage(ru.ru_utime, ru.ru_stime, max_rss(ru), elapsed, opts['items'])
+    with open(stats) as fh:
+        result.update(summarize_stats(json.load(fh)))
+    return result
+
+
+def run_benchmark(name, opts):
+    if name == 'cli':
+        return run_cli(opts)
+    results = multiprocessing.Queue()
+    p = multiprocessing.Process(target=run_miner, args=(name, opts, results))
+    p.start()
+    result = results.get()
+    p.join()
+    return result
+
+
+def compare(results, baseline, tolerance):
+    """Compare ``results`` to ``baseline``.
+
+    :rtype: list
+    :returns: A description of each regression found.
+    """
+    previous = dict((r['benchmark'], r) for r in baseline.get('results', []))
+    regressions = list()
+    for r in results:
+        old = previous.get(r['benchmark'])
+        if not old:
+            continue
+        if r['items_per_second'] < old['items_per_second'] * (1 - tolerance / 100.0):
+            regressions.append('{}: throughput dropped from {:.1f} to {:.1f} items/s'.format(
+                r['benchmark'], old['items_per_second'], r['items_per_second']))
+        if r['max_rss'] > old['max_rss'] * (1 + tolerance / 100.0):
+            regressions.append('{}: peak memory grew from {} to {} bytes'.format(
+                r['benchmark'], old['max_rss'], r['max_rss']))
+    return regressions
+
+
+def main(argv=None):
+    args = docopt(__doc__, argv=argv)
+    names = args['<benchmark>'] if args['<benchmark>'] else BENCHMARKS
+    for name in names:
+        if name not in BENCHMARKS:
+            sys.exit('error: unknown benchmark "{}", choose from: {}'.format(
+                name, ', '.join(BENCHMARKS)))
+
+    opts = dict(
+        items=int(args['--items']),
+        workers=int(args['--workers']),
+        rows=int(args['--rows']),
+        latency=float(args['--latency']),
+        error_rate=float(args['--error-rate']),
+        payload_size=int(args['--payload-size']),
+        port=int(args['--port']),
+    )
+    archive = MockArchive(items=opts['items'],
+                          latency=opts['latency'],
+                          error_rate=opts['error_rate'],
+                          payload_size=opts['payload_size'])
+    server = multiprocessing.Process(target=serve, args=(archive, opts['port']))
+    server.daemon = True
+    server.start()
+
+    results = list()
+    try:
+        wait_for_server(opts['port'])
+        with tempfile.TemporaryDirectory() as tmpdir:
+            run_opts = dict(opts, tmpdir=tmpdir, config=os.path.join(tmpdir, 'mock.ini'))
+            write_config(run_opts['config'], opts['port'])
+            for name in names:
+                sys.stderr.write('Running {}...\n'.format(name))
+                result = dict(benchmark=name)
+                result.update(run_benchmark(name, run_opts))
+                results.append(result)
+    finally:
+        server.terminate()
+        server.join()
+
+    report = dict(
+        iamine=__version__,
+        python=platform.python_version(),
+        platform=sys.platform,
+        params=opts,
+        results=results,
+    )
+    data = json.dumps(report, indent=2, sort_keys=True)
+    if args['--output']:
+        with open(args['--output'], 'w') as fh:
+            fh.write('{}\n'.format(data))
+    else:
+        sys.stdout.write('{}\n'.format(data))
+
+    if args['--baseline']:
+        with open(args['--baseline']) as fh:
+            baseline = json.load(fh)
+        regressions = compare(results, baseline, float(args['--tolerance']))
+        for regression in regressions:
+            sys.stderr.write('regression: {}\n'.format(regression))
+        if regressions:
+            sys.exit(1)
+
+
+if __name__ == '__main__':
+    main()
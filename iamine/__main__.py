@@ -3,10 +3,38 @@
 
 usage: ia-mine [--config-file=<FILE>] (<itemlist> | -) [--debug] [--workers WORKERS] [--cache]
                [--retries RETRIES] [--secure] [--hosts HOSTS]
+               [--pool-size POOL] [--per-host LIMIT] [--keepalive SECONDS]
+               [--dns-ttl SECONDS] [--resume JOURNAL] [--cache-db FILE
+               [--cache-size BYTES] [--cache-max-age SECONDS]]
+               [--output FILE] [--compress FORMAT] [--rotate-size BYTES]
+               [--adaptive [--min-workers MIN_WORKERS]]
+               [--progress SECONDS] [--stats FILE] [--metrics-port PORT]
+               [--processes PROCESSES] [--ordered [--window SIZE]]
+               [--no-verify] [--startup-ttl SECONDS]
+               [--fields FIELDS [--batch-size SIZE]]
+               [--dedup [--dedup-size SIZE]]
        ia-mine [--all | --search QUERY] [[--info | --info --field FIELD...]
                |--num-found | --mine-ids | --field FIELD... | --itemlist]
                [--debug] [--rows ROWS] [--workers WORKERS] [--cache]
-               [--retries RETRIES] [--secure] [--hosts HOSTS]
+               [--retries RETRIES] [--secure] [--hosts HOSTS] [--scrape]
+               [--search-workers SEARCH_WORKERS]
+               [--pool-size POOL] [--per-host LIMIT] [--keepalive SECONDS]
+               [--dns-ttl SECONDS] [--resume JOURNAL] [--cache-db FILE
+               [--cache-size BYTES] [--cache-max-age SECONDS]]
+               [--output FILE] [--compress FORMAT] [--rotate-size BYTES]
+               [--adaptive [--min-workers MIN_WORKERS]]
+               [--progress SECONDS] [--stats FILE] [--metrics-port PORT]
+               [--processes PROCESSES] [--ordered [--window SIZE]]
+               [--no-verify] [--startup-ttl SECONDS]
+               [--fields FIELDS] [--dedup [--dedup-size SIZE]]
+               [--incremental STATE]
+               [--partition BY [--partition-size SIZE] [--collections FILE]]
+       ia-mine --daemon (--socket PATH | --port PORT) [--config-file=<FILE>] [--debug]
+               [--workers WORKERS] [--retries RETRIES] [--secure] [--hosts HOSTS]
+               [--pool-size POOL] [--per-host LIMIT] [--keepalive SECONDS]
+               [--dns-ttl SECONDS] [--adaptive [--min-workers MIN_WORKERS]]
+               [--progress SECONDS] [--stats FILE] [--metrics-port PORT]
+               [--no-verify] [--startup-ttl SECONDS] [--fields FIELDS]
        ia-mine [--config-file=<FILE>] [-h | --version | --configure]
 
 positional arguments:
@@ -31,6 +59,9 @@ optional arguments:
   -i, --itemlist             Print identifiers only to stdout. [default: False]
   -n, --num-found            Print the number of items found for the given search
                              query.
+  --scrape                   Page through search results with the Scrape API's
+                             cursors. Much faster than page numbers for large
+                             result sets, such as --all.
   --rows ROWS                The number of rows to return for each request made to
                              the Archive.org Advancedsearch API. On slower networks,
                              it may be useful to use a lower value, and on faster
@@ -38,6 +69,16 @@ optional arguments:
   -w, --workers WORKERS
                              The maximum number of tasks to run at once.
                              [default: 100]
+  --adaptive                 Adjust the number of requests in flight to what the
+                             servers can sustain, based on latency and errors,
+                             up to the number of workers.
+  --min-workers MIN_WORKERS  With --adaptive, the lowest number of requests to
+                             keep in flight. Defaults to a tenth of the workers.
+  --search-workers SEARCH_WORKERS
+                             With --mine-ids, the number of workers to start
+                             fetching search pages with. The rest of the workers
+                             mine items, and the split is adjusted as mining
+                             progresses. Defaults to a tenth of the workers.
   -c, --cache                Cache item metadata on Archive.org. Items are not
                              cached are not cached by default.
   -r, --retries RETRIES
@@ -45,6 +86,86 @@ optional arguments:
                              [default: 10]
   --secure                   Use HTTPS. HTTP is used by default.
   -H, --hosts HOSTS          A file containing a list of hosts to shuffle through.
+  --pool-size POOL           The maximum number of connections in use at once,
+                             across all hosts. Unlimited by default.
+  --per-host LIMIT           The maximum number of concurrent requests to a
+                             single host. Unlimited by default.
+  --keepalive SECONDS        The number of seconds to keep idle connections
+                             open for reuse. [default: 30]
+  --dns-ttl SECONDS          The number of seconds to cache DNS lookups for,
+                             0 disables caching. [default: 60]
+  --resume JOURNAL           Record completed items (or search pages) to JOURNAL,
+                             and skip those already recorded in it. Rerun with
+                             the same JOURNAL to resume an interrupted job.
+  --cache-db FILE            Keep a local cache of item metadata in the SQLite
+                             database FILE. Cached items are revalidated with
+                             conditional requests.
+  --cache-size BYTES         The maximum size of the local cache, least recently
+                             used items are evicted. [default: 1073741824]
+  --cache-max-age SECONDS    Serve cached items younger than SECONDS without
+                             revalidating them.
+  -o, --output FILE          Write results to FILE instead of stdout.
+  --compress FORMAT          Compress output with FORMAT, "gzip" or "zstd" (zstd
+                             requires the zstandard package).
+  --rotate-size BYTES        Start a new output file after BYTES of (uncompressed)
+                             output, numbering the files, e.g. out.00000.jsonl.
+  --progress SECONDS         Write a progress line to stderr every SECONDS.
+  --stats FILE               Write final statistics as JSON to FILE, "-" for
+                             stderr.
+  --metrics-port PORT        Serve live metrics in the Prometheus text format at
+                             http://127.0.0.1:PORT/metrics.
+  -p, --processes PROCESSES  Mine with PROCESSES processes, each with its own
+                             workers and share of the rate limit, to use more
+                             than one CPU. Search pages are split between the
+                             processes, or with --mine-ids, the items found.
+  --ordered                  Write results in the order of the itemlist or of
+                             the search pages, holding back results that
+                             complete early.
+  --window SIZE              With --ordered, the number of items (or pages) that
+                             can be mined ahead of the first unfinished one. Input
+                             is held back while the window is full. [default: 10000]
+  --fields FIELDS            Only mine these comma separated fields of each item's
+                             metadata, e.g. metadata.collection,files[].md5. A
+                             single field is requested on its own from the
+                             Metadata API, more are extracted from each item,
+                             as it streams in if the ijson package is installed.
+  --batch-size SIZE          With --fields, look up the fields of SIZE items at a
+                             time with a single search query, if they are all
+                             top-level metadata fields. Items search doesn't
+                             return are then looked up one by one.
+  --dedup                    Skip identifiers that were already mined in this run,
+                             e.g. duplicates in the itemlist. The number skipped
+                             is reported with the other statistics.
+  --dedup-size SIZE          With --dedup, the number of identifiers to remember
+                             exactly. Beyond that, a Bloom filter is used, which
+                             mistakes about 0.1% of new identifiers for
+                             duplicates. [default: 1000000]
+  --incremental STATE        With --mine-ids, only mine items that are new or
+                             changed since the last run of the same query. The
+                             items' last update dates and the time of each run
+                             are kept in the SQLite database STATE.
+  --partition BY             Split the search into sub-queries, by "date" (added
+                             date ranges), "prefix" (identifier prefixes) or
+                             "collection", sized with count probes, and scrape
+                             them in parallel, up to --search-workers at once.
+  --partition-size SIZE      With --partition, the number of results to aim for
+                             in each sub-query. [default: 500000]
+  --collections FILE         With --partition collection, a file listing the
+                             collections to split by, one per line (lines
+                             starting with "#" are ignored). Items in more than
+                             one of them are mined once per collection, unless
+                             duplicates are dropped with --dedup.
+  --daemon                   Run a mining daemon, which mines the jobs submitted
+                             to it with one shared connection pool and rate
+                             limit, and streams each job's results back. See
+                             iamine.daemon.MiningDaemon for its API.
+  --socket PATH              With --daemon, listen on the Unix socket PATH.
+  --port PORT                With --daemon, listen on http://127.0.0.1:PORT.
+  --no-verify                Don't check your S3 keys, and start mining right away
+                             at the last known rate limit while looking it up.
+  --startup-ttl SECONDS      The number of seconds to cache the results of the key
+                             check and rate limit lookup for, 0 disables caching.
+                             [default: 3600]
 
 """
 from .utils import suppress_interrupt_messages, suppress_brokenpipe_messages, handle_cli_exceptions
@@ -56,13 +177,17 @@ import logging
 import os
 import sys
 import json
+from collections import OrderedDict
 
 from docopt import docopt, DocoptExit
 from schema import Schema, Use, Or, SchemaError
 
-from .api import mine_items, search, configure
+from .api import mine_items, search, configure, run_daemon
 from . import __version__
 from .exceptions import AuthenticationError
+from .cache import MetadataCache
+from .output import get_sink
+from .fields import FieldSet
 
 
 asyncio_logger = logging.getLogger('asyncio')
@@ -71,7 +196,9 @@ asyncio_logger.setLevel(logging.CRITICAL)
 
 def print_itemlist(resp):
     j = yield from resp.json(encoding='utf-8')
-    for doc in j.get('response', {}).get('docs', []):
+    # Scrape API results are in "items", Advancedsearch results in "docs".
+    docs = j.get('items') or j.get('response', {}).get('docs', [])
+    for doc in docs:
         print(doc.get('identifier'))
 
 
@@ -90,10 +217,25 @@ def main(argv=None, session=None):
     # Validate args.
     open_file_or_stdin = lambda f: sys.stdin if (f == '-') or (not f) else open(f)
     parse_hosts = lambda f: [x.strip() for x in open(f) if x.strip()]
+    # Listing a collection twice would mine it twice, so duplicates are
+    # dropped, and lines starting with "#" are comments.
+    parse_collections = lambda f: list(OrderedDict.fromkeys(
+        x.strip() for x in open(f) if x.strip() and not x.strip().startswith('#')))
     schema = Schema({object: bool,
         '--search': Or(None, Use(str)),
         '--field': list,
         '--config-file': Or(None, str),
+        '--resume': Or(None, str),
+        '--cache-db': Or(None, str),
+        '--cache-size': Use(int,
+            error='"{}" should be an integer.'.format(args['--cache-size'])),
+        '--cache-max-age': Or(None, Use(float,
+            error='"{}" should be a number.'.format(args['--cache-max-age']))),
+        '--output': Or(None, str),
+        '--compress': Or(None, 'gzip', 'zstd',
+            error='"{}" should be "gzip" or "zstd".'.format(args['--compress'])),
+        '--rotate-size': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--rotate-size']))),
         '--rows': Use(int,
             error='"{}" should be an integer'.format(args['--rows'])),
         '--hosts': Or(None, Use(parse_hosts,
@@ -103,6 +245,45 @@ def main(argv=None, session=None):
             error='"{}" should be readable'.format(args['<itemlist>'])),
         '--workers': Use(int,
             error='"{}" should be an integer.'.format(args['--workers'])),
+        '--min-workers': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--min-workers']))),
+        '--search-workers': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--search-workers']))),
+        '--pool-size': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--pool-size']))),
+        '--per-host': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--per-host']))),
+        '--keepalive': Use(float,
+            error='"{}" should be a number.'.format(args['--keepalive'])),
+        '--dns-ttl': Use(float,
+            error='"{}" should be a number.'.format(args['--dns-ttl'])),
+        '--progress': Or(None, Use(float,
+            error='"{}" should be a number.'.format(args['--progress']))),
+        '--stats': Or(None, str),
+        '--socket': Or(None, str),
+        '--incremental': Or(None, str),
+        '--partition': Or(None, 'date', 'prefix', 'collection',
+            error='"{}" should be "date", "prefix" or "collection".'.format(args['--partition'])),
+        '--partition-size': Use(int,
+            error='"{}" should be an integer.'.format(args['--partition-size'])),
+        '--collections': Or(None, Use(parse_collections,
+            error='"{}" should be a readable file.'.format(args['--collections']))),
+        '--port': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--port']))),
+        '--metrics-port': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--metrics-port']))),
+        '--processes': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--processes']))),
+        '--fields': Or(None, Use(FieldSet,
+            error='"{}" should be comma separated fields.'.format(args['--fields']))),
+        '--window': Use(int,
+            error='"{}" should be an integer.'.format(args['--window'])),
+        '--dedup-size': Use(int,
+            error='"{}" should be an integer.'.format(args['--dedup-size'])),
+        '--batch-size': Or(None, Use(int,
+            error='"{}" should be an integer.'.format(args['--batch-size']))),
+        '--startup-ttl': Use(float,
+            error='"{}" should be a number.'.format(args['--startup-ttl'])),
     })
     try:
         args = schema.validate(args)
@@ -121,6 +302,55 @@ def main(argv=None, session=None):
             sys.exit(1)
         sys.exit(0)
 
+    # Daemon.
+    if args['--daemon']:
+        run_daemon(args['--socket'], args['--port'],
+                   max_tasks=args['--workers'],
+                   retries=args['--retries'],
+                   secure=args['--secure'],
+                   hosts=args['--hosts'],
+                   config_file=args['--config-file'],
+                   pool_size=args['--pool-size'],
+                   per_host_limit=args['--per-host'],
+                   keepalive_timeout=args['--keepalive'],
+                   dns_cache_ttl=args['--dns-ttl'],
+                   adaptive=args['--adaptive'],
+                   min_tasks=args['--min-workers'],
+                   progress=args['--progress'],
+                   stats_file=args['--stats'],
+                   metrics_port=args['--metrics-port'],
+                   verify=not args['--no-verify'],
+                   startup_ttl=args['--startup-ttl'],
+                   fields=args['--fields'],
+                   debug=args['--debug'])
+        sys.exit(0)
+
+    cache = None
+    if args['--cache-db']:
+        cache = MetadataCache(args['--cache-db'],
+                              max_size=args['--cache-size'],
+                              max_age=args['--cache-max-age'])
+    sink = get_sink(args['--output'], args['--compress'], args['--rotate-size'])
+
+    if args['--processes'] and args['--itemlist']:
+        sys.exit(sys.stderr.write('error: --itemlist can not be used with --processes.\n'))
+    if args['--processes'] and args['--scrape'] and not args['--mine-ids']:
+        sys.exit(sys.stderr.write('error: --scrape requires --mine-ids with --processes.\n'))
+    if args['--processes'] and args['--batch-size']:
+        sys.exit(sys.stderr.write('error: --batch-size can not be used with --processes.\n'))
+    if args['--ordered'] and args['--batch-size']:
+        sys.exit(sys.stderr.write('error: --batch-size can not be used with --ordered.\n'))
+    if args['--ordered'] and args['--mine-ids']:
+        sys.exit(sys.stderr.write('error: --mine-ids can not be used with --ordered.\n'))
+    if args['--incremental'] and not args['--mine-ids']:
+        sys.exit(sys.stderr.write('error: --incremental requires --mine-ids.\n'))
+    if args['--incremental'] and args['--processes']:
+        sys.exit(sys.stderr.write('error: --incremental can not be used with --processes.\n'))
+    if args['--partition'] and args['--processes']:
+        sys.exit(sys.stderr.write('error: --partition can not be used with --processes.\n'))
+    if (args['--partition'] == 'collection') and not args['--collections']:
+        sys.exit(sys.stderr.write('error: --partition collection requires --collections.\n'))
+
     # Search.
     if args['--search'] or args['--all']:
         query = 'all:1' if not args['--search'] else args['--search']
@@ -136,11 +366,37 @@ def main(argv=None, session=None):
                 callback=callback,
                 mine_ids=args['--mine-ids'],
                 info_only=info_only,
+                scrape=args['--scrape'],
+                search_tasks=args['--search-workers'],
                 max_tasks=args['--workers'],
                 retries=args['--retries'],
                 config_file=args['--config-file'],
                 secure=args['--secure'],
                 hosts=args['--hosts'],
+                pool_size=args['--pool-size'],
+                per_host_limit=args['--per-host'],
+                keepalive_timeout=args['--keepalive'],
+                dns_cache_ttl=args['--dns-ttl'],
+                journal=args['--resume'],
+                cache=cache,
+                sink=sink,
+                adaptive=args['--adaptive'],
+                min_tasks=args['--min-workers'],
+                progress=args['--progress'],
+                stats_file=args['--stats'],
+                metrics_port=args['--metrics-port'],
+                processes=args['--processes'],
+                ordered=args['--ordered'],
+                window=args['--window'],
+                verify=not args['--no-verify'],
+                startup_ttl=args['--startup-ttl'],
+                fields=args['--fields'],
+                dedup=args['--dedup'],
+                dedup_size=args['--dedup-size'],
+                state=args['--incremental'],
+                partition=args['--partition'],
+                partition_size=args['--partition-size'],
+                collections=args['--collections'],
                 debug=args['--debug'])
         if args['--info']:
             sys.stdout.write('{}\n'.format(json.dumps(r)))
@@ -161,6 +417,27 @@ def main(argv=None, session=None):
                    secure=args['--secure'],
                    hosts=args['--hosts'],
                    config_file=args['--config-file'],
+                   pool_size=args['--pool-size'],
+                   per_host_limit=args['--per-host'],
+                   keepalive_timeout=args['--keepalive'],
+                   dns_cache_ttl=args['--dns-ttl'],
+                   journal=args['--resume'],
+                   cache=cache,
+                   sink=sink,
+                   adaptive=args['--adaptive'],
+                   min_tasks=args['--min-workers'],
+                   progress=args['--progress'],
+                   stats_file=args['--stats'],
+                   metrics_port=args['--metrics-port'],
+                   processes=args['--processes'],
+                   ordered=args['--ordered'],
+                   window=args['--window'],
+                   verify=not args['--no-verify'],
+                   startup_ttl=args['--startup-ttl'],
+                   fields=args['--fields'],
+                   batch_size=args['--batch-size'],
+                   dedup=args['--dedup'],
+                   dedup_size=args['--dedup-size'],
                    debug=args['--debug'])
 
 
@@ -2,11 +2,15 @@ import signal
 from getpass import getpass
 
 from .core import Miner, ItemMiner, SearchMiner
+from .shard import ShardedMiner
+from .partition import Partitioner
+from .daemon import MiningDaemon
 from .config import write_config_file
 
 
 def search(query=None, params=None, callback=None, mine_ids=None, info_only=None,
-           **kwargs):
+           scrape=None, processes=None, ordered=None, partition=None, partition_size=None,
+           collections=None, **kwargs):
     """Mine Archive.org search results.
 
     :param query: (optional) The Archive.org search query to yield
@@ -33,27 +37,82 @@ def search(query=None, params=None, callback=None, mine_ids=None, info_only=None
                       or search results.
     :type info_only: bool
 
+    :param scrape: (optional) Set to ``True`` to page through results
+                   with the Scrape API's cursors rather than with page
+                   numbers. This is much faster for deep result sets,
+                   such as mining all indexed items.
+    :type scrape: bool
+
+    :param processes: (optional) The number of processes to mine with,
+                      see :class:`iamine.shard.ShardedMiner`. Callbacks
+                      can't be used with more than one process.
+    :type processes: int
+
+    :param ordered: (optional) Write search results in order, holding
+                    back at most ``window`` pages (a keyword argument,
+                    defaulting to 10,000) at a time. Can't be used with
+                    ``mine_ids``.
+    :type ordered: bool
+
+    :param partition: (optional) Split the search into sub-queries by
+                      ``"date"``, ``"prefix"`` or ``"collection"``, and
+                      scrape them in parallel, see
+                      :class:`iamine.partition.Partitioner`.
+    :type partition: str
+
+    :param partition_size: (optional) With ``partition``, the number of
+                           results to aim for in each sub-query.
+    :type partition_size: int
+
+    :param collections: (optional) With ``partition="collection"``, the
+                        collections to split the search by.
+    :type collections: list
+
     :param \*\*kwargs: (optional) Arguments that ``get_miner`` takes.
+                       With ``mine_ids``, a ``state`` store (see
+                       :class:`iamine.state.StateStore`) mines only the
+                       items that changed since the last run. It can't
+                       be used with more than one process.
     """
     query = '(*:*)' if not query else query
     params = params if params else {}
     mine_ids = True if mine_ids else False
     info_only = True if info_only else False
-    miner = SearchMiner(**kwargs)
+
+    if (processes and processes > 1) and not info_only:
+        if callback:
+            raise ValueError('Callbacks can not be used with more than one process.')
+        if kwargs.get('state'):
+            raise ValueError('A state store can not be used with more than one process.')
+        if partition:
+            raise ValueError('Partitioned searches can not be used with more than one process.')
+        miner = ShardedMiner(processes, ordered, **kwargs)
+        _run_sharded(miner, miner.search(query, params, mine_ids, scrape))
+        return
+
+    miner = SearchMiner(ordered=ordered, **kwargs)
 
     if info_only:
         params = miner.get_search_params(query, params)
-        r = miner.get_search_info(params)
+        r = miner.loop.run_until_complete(miner.fetch_search_info(params))
+        miner.shutdown()
         search_info = r.get('responseHeader')
         search_info['numFound'] = r.get('response', {}).get('numFound', 0)
         return search_info
 
+    partitioner = None
+    if partition:
+        partitioner = Partitioner(miner, partition, partition_size, collections=collections)
+
     try:
         miner.loop.add_signal_handler(signal.SIGINT, miner.close)
         miner.loop.run_until_complete(
-                miner.search(query, params=params, callback=callback, mine_ids=mine_ids))
+                miner.search(query, params=params, callback=callback, mine_ids=mine_ids,
+                             scrape=scrape, partitioner=partitioner))
     except RuntimeError:
         pass
+    else:
+        miner.shutdown()
 
 
 def mine_urls(urls, params=None, callback=None, **kwargs):
@@ -77,9 +136,12 @@ def mine_urls(urls, params=None, callback=None, **kwargs):
         miner.loop.run_until_complete(miner.mine_urls(urls, params, callback))
     except RuntimeError:
         pass
+    else:
+        miner.shutdown()
 
 
-def mine_items(identifiers, params=None, callback=None, **kwargs):
+def mine_items(identifiers, params=None, callback=None, processes=None, ordered=None,
+               fields=None, batch_size=None, **kwargs):
     """Concurrently retrieve metadata from Archive.org items.
 
     :param identifiers: A set of Archive.org item identifiers to mine.
@@ -92,13 +154,134 @@ def mine_items(identifiers, params=None, callback=None, **kwargs):
     :param callback: (optional) A callback function to be called on each
                      :py:class:`aiohttp.client.ClientResponse`.
 
+    :param processes: (optional) The number of processes to mine with,
+                      see :class:`iamine.shard.ShardedMiner`. Callbacks
+                      can't be used with more than one process.
+    :type processes: int
+
+    :param ordered: (optional) Write metadata in the order of
+                    ``identifiers``. Results are held back until every
+                    item before them is done, and no more than
+                    ``window`` items (a keyword argument, defaulting to
+                    10,000) are mined ahead of the first unfinished one.
+                    Can't be used with ``batch_size``.
+    :type ordered: bool
+
+    :param fields: (optional) Only mine these fields of each item's
+                   metadata, e.g. ``["metadata.collection",
+                   "files[].md5"]``. See :class:`iamine.fields.FieldSet`.
+    :type fields: list
+
+    :param batch_size: (optional) Look up ``fields`` for this many items
+                       at a time with a single search query, if they are
+                       all top-level metadata fields, e.g.
+                       ``metadata.title``. Items search doesn't return
+                       are then looked up one by one. Can't be used with
+                       more than one process.
+    :type batch_size: int
+
     :param \*\*kwargs: (optional) Arguments that ``get_miner`` takes.
     """
-    miner = ItemMiner(**kwargs)
+    kwargs['fields'] = fields
+    kwargs['batch_size'] = batch_size
+    if processes and processes > 1:
+        if callback:
+            raise ValueError('Callbacks can not be used with more than one process.')
+        if batch_size and batch_size > 1:
+            raise ValueError('Batches can not be used with more than one process.')
+        miner = ShardedMiner(processes, ordered, **kwargs)
+        _run_sharded(miner, miner.mine_items(identifiers, params))
+        return
+    if ordered and batch_size and batch_size > 1:
+        raise ValueError('Batches can not be mined in order.')
+
+    miner = ItemMiner(ordered=ordered, **kwargs)
     try:
+        miner.loop.add_signal_handler(signal.SIGINT, miner.close)
         miner.loop.run_until_complete(miner.mine_items(identifiers, params, callback))
     except RuntimeError:
         miner.loop.close()
+    else:
+        miner.shutdown()
+
+
+def _run_sharded(miner, coro):
+    try:
+        miner.loop.add_signal_handler(signal.SIGINT, miner.close)
+        miner.loop.run_until_complete(coro)
+    except RuntimeError:
+        pass
+    else:
+        miner.shutdown()
+
+
+def iter_items(identifiers, params=None, max_backlog=None, **kwargs):
+    """Mine metadata from Archive.org items on the current event loop,
+    returning an asynchronous iterator over each item's metadata. See
+    :meth:`iamine.core.ItemMiner.iter_items`.
+
+    :param \*\*kwargs: (optional) Arguments that ``get_miner`` takes.
+
+    :rtype: :class:`iamine.iterators.ResultIterator`
+    """
+    results = ItemMiner(**kwargs).iter_items(identifiers, params, max_backlog)
+    results.shutdown = True
+    return results
+
+
+def iter_search(query=None, params=None, mine_ids=None, scrape=None, max_backlog=None,
+                **kwargs):
+    """Mine Archive.org search results on the current event loop,
+    returning an asynchronous iterator over the results. See
+    :meth:`iamine.core.SearchMiner.iter_search`.
+
+    :param \*\*kwargs: (optional) Arguments that ``get_miner`` takes.
+
+    :rtype: :class:`iamine.iterators.ResultIterator`
+    """
+    query = '(*:*)' if not query else query
+    results = SearchMiner(**kwargs).iter_search(query, params, mine_ids, scrape, max_backlog)
+    results.shutdown = True
+    return results
+
+
+def iter_urls(urls, params=None, max_backlog=None, **kwargs):
+    """Retrieve URLs on the current event loop, returning an
+    asynchronous iterator over their JSON responses. See
+    :meth:`iamine.core.Miner.iter_urls`.
+
+    :param \*\*kwargs: (optional) Arguments that ``get_miner`` takes.
+
+    :rtype: :class:`iamine.iterators.ResultIterator`
+    """
+    results = Miner(**kwargs).iter_urls(urls, params, max_backlog)
+    results.shutdown = True
+    return results
+
+
+def run_daemon(path=None, port=None, **kwargs):
+    """Run a mining daemon until it is interrupted or terminated.
+
+    :param path: (optional) The path of the Unix socket to listen on.
+    :type path: str
+
+    :param port: (optional) The local port to listen on, if no ``path``
+                 is given.
+    :type port: int
+
+    :param \*\*kwargs: (optional) Arguments that
+                       :class:`iamine.daemon.MiningDaemon` takes.
+    """
+    daemon = MiningDaemon(path, port, **kwargs)
+    loop = daemon.loop
+    loop.run_until_complete(daemon.start())
+    for sig in (signal.SIGINT, signal.SIGTERM):
+        loop.add_signal_handler(sig, loop.stop)
+    try:
+        loop.run_forever()
+    finally:
+        loop.run_until_complete(daemon.stop())
+        loop.close()
 
 
 def configure(username=None, password=None, overwrite=None, config_file=None):
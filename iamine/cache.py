@@ -0,0 +1,254 @@
+import os
+import time
+import sqlite3
+import asyncio
+from collections import namedtuple
+try:
+    import ujson as json
+except ImportError:
+    import json
+try:
+    from multidict import CIMultiDict
+except ImportError:
+    # Older versions of aiohttp ship their own.
+    from aiohttp.multidict import CIMultiDict
+
+
+DEFAULT_STARTUP_CACHE = os.path.expanduser('~/.cache/iamine/startup.json')
+
+
+CacheEntry = namedtuple('CacheEntry', ['body', 'etag', 'last_modified', 'stored'])
+
+
+class MetadataCache(object):
+    """A persistent, size-bounded cache of item metadata responses,
+    stored in a single SQLite file.
+
+    Responses are stored with their ``ETag`` and ``Last-Modified``
+    validators so that they can be revalidated with a conditional GET.
+    When the cache grows past ``max_size`` bytes, the least recently
+    used entries are evicted.
+
+    :param path: The path to the SQLite database. It is created if it
+                 doesn't exist.
+    :type path: str
+
+    :param max_size: (optional) The maximum total size of cached
+                     bodies, in bytes. Defaults to 1 GiB.
+    :type max_size: int
+
+    :param max_age: (optional) The number of seconds for which an entry
+                    is served without revalidating it. By default,
+                    entries are always revalidated.
+    :type max_age: float
+
+    :param commit_every: (optional) The number of writes to batch into
+                         a single transaction. Defaults to 100.
+    :type commit_every: int
+    """
+
+    def __init__(self, path, max_size=None, max_age=None, commit_every=None):
+        max_size = 2 ** 30 if not max_size else max_size
+        commit_every = 100 if not commit_every else commit_every
+
+        self.path = path
+        self.max_size = max_size
+        self.max_age = max_age
+        self.commit_every = commit_every
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS entries ('
+                        'key TEXT PRIMARY KEY, body BLOB, etag TEXT, '
+                        'last_modified TEXT, size INTEGER, stored REAL, accessed REAL)')
+        self.db.execute('CREATE INDEX IF NOT EXISTS entries_accessed ON entries (accessed)')
+        self.db.commit()
+        self._size = self.db.execute(
+                'SELECT COALESCE(SUM(size), 0) FROM entries').fetchone()[0]
+        self._writes = 0
+
+    @property
+    def size(self):
+        return self._size
+
+    def get(self, key):
+        """Get the cached entry for ``key``.
+
+        :type key: str
+
+        :rtype: :class:`CacheEntry`
+        :returns: The cached entry, or ``None`` if ``key`` isn't cached.
+        """
+        row = self.db.execute('SELECT body, etag, last_modified, stored FROM entries '
+                              'WHERE key = ?', (key,)).fetchone()
+        if not row:
+            return None
+        self.db.execute('UPDATE entries SET accessed = ? WHERE key = ?', (time.time(), key))
+        self._wrote()
+        return CacheEntry(*row)
+
+    def is_fresh(self, entry):
+        """Check whether ``entry`` can be used without revalidation.
+
+        :type entry: :class:`CacheEntry`
+
+        :rtype: bool
+        """
+        if not self.max_age:
+            return False
+        return (time.time() - entry.stored) < self.max_age
+
+    def put(self, key, body, etag=None, last_modified=None):
+        """Cache ``body`` for ``key``, along with its validators.
+
+        :type key: str
+
+        :type body: bytes
+
+        :param etag: (optional) The ``ETag`` header of the response.
+        :type etag: str
+
+        :param last_modified: (optional) The ``Last-Modified`` header of
+                              the response.
+        :type last_modified: str
+        """
+        row = self.db.execute('SELECT size FROM entries WHERE key = ?', (key,)).fetchone()
+        if row:
+            self._size -= row[0]
+        now = time.time()
+        self.db.execute('INSERT OR REPLACE INTO entries VALUES (?, ?, ?, ?, ?, ?, ?)',
+                        (key, body, etag, last_modified, len(body), now, now))
+        self._size += len(body)
+        self._wrote()
+        if self._size > self.max_size:
+            self.evict()
+
+    def touch(self, key):
+        """Mark the entry for ``key`` as revalidated."""
+        now = time.time()
+        self.db.execute('UPDATE entries SET stored = ?, accessed = ? WHERE key = ?',
+                        (now, now, key))
+        self._wrote()
+
+    def evict(self):
+        """Evict least recently used entries until the cache is at most
+        90% of ``max_size``, so that eviction isn't run on every put.
+        """
+        target = self.max_size * .9
+        while self._size > target:
+            rows = self.db.execute('SELECT key, size FROM entries '
+                                   'ORDER BY accessed LIMIT 100').fetchall()
+            if not rows:
+                break
+            for key, size in rows:
+                self.db.execute('DELETE FROM entries WHERE key = ?', (key,))
+                self._size -= size
+                if self._size <= target:
+                    break
+        self.db.commit()
+        self._writes = 0
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes >= self.commit_every:
+            self.db.commit()
+            self._writes = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+class CachedResponse(object):
+    """A stand-in for :py:class:`aiohttp.client.ClientResponse` that
+    serves a cached body, so that callbacks don't need to know whether
+    a response came from the network or the cache.
+    """
+
+    def __init__(self, url, entry):
+        self.url = url
+        self.status = 200
+        # Headers are looked up case-insensitively, as with live responses.
+        self.headers = CIMultiDict()
+        if entry.etag:
+            self.headers['ETag'] = entry.etag
+        if entry.last_modified:
+            self.headers['Last-Modified'] = entry.last_modified
+        self._body = entry.body
+
+    @asyncio.coroutine
+    def read(self):
+        return self._body
+
+    @asyncio.coroutine
+    def text(self, encoding=None):
+        return self._body.decode(encoding if encoding else 'utf-8')
+
+    @asyncio.coroutine
+    def json(self, *, encoding=None, loads=json.loads):
+        return loads(self._body.decode(encoding if encoding else 'utf-8'))
+
+    def release(self):
+        pass
+
+    def close(self, force=False):
+        pass
+
+
+class StartupCache(object):
+    """A small JSON file caching the results of the requests a miner
+    makes before it starts mining, such as the S3 key check and the
+    rate limit lookup, so that short jobs run back to back don't repeat
+    them.
+
+    :param path: (optional) The path to the cache file. Defaults to
+                 ``~/.cache/iamine/startup.json``.
+    :type path: str
+
+    :param ttl: (optional) The number of seconds results are cached for.
+                ``0`` disables the cache. Defaults to 3600.
+    :type ttl: float
+    """
+
+    def __init__(self, path=None, ttl=None):
+        self.path = DEFAULT_STARTUP_CACHE if not path else path
+        self.ttl = 3600 if ttl is None else ttl
+        self._entries = dict()
+        if self.ttl and os.path.isfile(self.path):
+            try:
+                with open(self.path) as fh:
+                    self._entries = json.load(fh)
+            except (OSError, ValueError):
+                # A corrupt cache is as good as an empty one.
+                pass
+
+    def get(self, key):
+        """Get the value cached for ``key``.
+
+        :type key: str
+
+        :returns: The value, or ``None`` if it isn't cached or has
+                  expired.
+        """
+        entry = self._entries.get(key)
+        if (not entry) or (time.time() - entry['stored'] >= self.ttl):
+            return None
+        return entry['value']
+
+    def set(self, key, value):
+        """Cache ``value``, a JSON serializable value, for ``key``."""
+        if not self.ttl:
+            return
+        self._entries[key] = dict(value=value, stored=time.time())
+        tmp_path = '{}.{}.tmp'.format(self.path, os.getpid())
+        try:
+            dirname = os.path.dirname(self.path)
+            if dirname:
+                os.makedirs(dirname, exist_ok=True)
+            with open(tmp_path, 'w') as fh:
+                json.dump(self._entries, fh)
+            os.replace(tmp_path, self.path)
+        except OSError:
+            # Caching is an optimization, mining goes on without it.
+            pass
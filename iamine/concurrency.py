@@ -0,0 +1,148 @@
+import time
+import asyncio
+from collections import deque
+
+
+class AIMDLimiter(object):
+    """Adaptively limit the number of requests in flight.
+
+    The limit is adjusted every ``interval`` seconds from the latency
+    and outcome of the requests completed in that interval, with
+    additive-increase/multiplicative-decrease: while requests are
+    healthy and the limit is in use, it grows by ``increase``; when the
+    error rate passes ``error_threshold``, or latency passes
+    ``latency_factor`` times the baseline latency, it is multiplied by
+    ``decrease``. Until the first decrease, the limit doubles instead of
+    growing additively, so that it converges quickly.
+
+    :param min_limit: The lowest the limit can go.
+    :type min_limit: int
+
+    :param max_limit: The highest the limit can go.
+    :type max_limit: int
+
+    :param increase: (optional) Defaults to 1/50th of ``max_limit``.
+    :type increase: int
+
+    :param decrease: (optional) Defaults to 0.75.
+    :type decrease: float
+
+    :param error_threshold: (optional) Defaults to 0.05.
+    :type error_threshold: float
+
+    :param latency_factor: (optional) Defaults to 2.
+    :type latency_factor: float
+
+    :param interval: (optional) Defaults to 1 second.
+    :type interval: float
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self, min_limit, max_limit,
+                 increase=None,
+                 decrease=None,
+                 error_threshold=None,
+                 latency_factor=None,
+                 interval=None,
+                 loop=None):
+
+        self.loop = asyncio.get_event_loop() if not loop else loop
+        self.min_limit = max(1, int(min_limit))
+        self.max_limit = max(self.min_limit, int(max_limit))
+        self.increase = max(1, self.max_limit // 50) if not increase else increase
+        self.decrease = .75 if not decrease else decrease
+        self.error_threshold = .05 if error_threshold is None else error_threshold
+        self.latency_factor = 2.0 if not latency_factor else latency_factor
+        self.interval = 1.0 if not interval else interval
+
+        self.limit = self.min_limit
+        self.inflight = 0
+        self.baseline = None
+        self._slow_start = True
+        self._waiters = deque()
+        self._reset_window()
+
+    def _reset_window(self):
+        self._window_start = time.monotonic()
+        self._latencies = list()
+        self._errors = 0
+        self._peak = self.inflight
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Wait until a request can be made within the limit."""
+        while self.inflight >= self.limit:
+            waiter = asyncio.Future(loop=self.loop)
+            self._waiters.append(waiter)
+            try:
+                yield from waiter
+            except asyncio.CancelledError:
+                if waiter in self._waiters:
+                    self._waiters.remove(waiter)
+                elif waiter.done():
+                    # Pass the wake up on to another waiter.
+                    self._wake()
+                raise
+        self.inflight += 1
+        self._peak = max(self._peak, self.inflight)
+
+    def release(self):
+        self.inflight -= 1
+        self._wake()
+
+    def _wake(self):
+        free = self.limit - self.inflight
+        while (free > 0) and self._waiters:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                free -= 1
+
+    def record(self, latency, ok):
+        """Record the outcome of a request.
+
+        :param latency: The number of seconds the request took.
+        :type latency: float
+
+        :param ok: ``False`` if the request failed in a way that suggests
+                   the backend is overloaded.
+        :type ok: bool
+        """
+        if ok:
+            self._latencies.append(latency)
+        else:
+            self._errors += 1
+        if time.monotonic() - self._window_start >= self.interval:
+            self.adjust()
+
+    def adjust(self):
+        """Adjust the limit from the requests completed since the last
+        adjustment.
+        """
+        total = len(self._latencies) + self._errors
+        if not total:
+            self._reset_window()
+            return
+        latency = None
+        if self._latencies:
+            latency = sorted(self._latencies)[len(self._latencies) // 2]
+            if self.baseline is None:
+                self.baseline = latency
+            else:
+                # Let the baseline drift up slowly, so that it follows
+                # lasting changes in network conditions.
+                self.baseline = min(latency, self.baseline + (latency - self.baseline) * .01)
+
+        overloaded = (self._errors / total > self.error_threshold) or \
+            ((latency is not None) and (latency > self.baseline * self.latency_factor))
+        if overloaded:
+            self._slow_start = False
+            self.limit = max(self.min_limit, int(self.limit * self.decrease))
+        elif self._peak >= self.limit:
+            if self._slow_start:
+                self.limit = min(self.max_limit, self.limit * 2)
+            else:
+                self.limit = min(self.max_limit, self.limit + self.increase)
+            self._wake()
+        self._reset_window()
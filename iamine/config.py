@@ -130,5 +130,9 @@ def get_config(config=None, config_file=None):
             'logged-in-sig': config.get('cookies', 'logged-in-sig', fallback=None),
         },
     }
+    # Optional overrides for the URLs used to check S3 keys and to look
+    # up the rate limit.
+    if config.has_section('iamine'):
+        config_dict['iamine'] = dict(config.items('iamine'))
 
     return dict((k, v) for k, v in config_dict.items() if v)
@@ -1,24 +1,40 @@
+import time
+import hashlib
 import urllib.request
 try:
     import ujson as json
 except ImportError:
     import json
 import asyncio
-try:
-    from asyncio import JoinableQueue as Queue
-except ImportError:
-    from asyncio import Queue
 from copy import deepcopy
-import time
-
-import aiohttp
+from functools import partial
 
 from .config import get_config
-from .requests import MineRequest
-from .urls import metadata_urls, make_url
+from .requests import MineRequest, RequestTemplate
+from .ratelimit import TokenBucket
+from .session import MineSession
+from .journal import Journal
+from .cache import MetadataCache, StartupCache
+from .pool import WorkerPool
+from .scheduler import Scheduler, PRIORITY_SEARCH
+from .output import StreamSink, OrderedSink
+from .retry import RetryPolicy, RetryBudget
+from .concurrency import AIMDLimiter
+from .hosts import HostPool
+from .stats import Stats
+from .fields import FieldSet
+from .dedup import Deduplicator
+from .state import StateStore, last_updated, updated_query
+from .iterators import ResultIterator, search_docs
 from .exceptions import AuthenticationError
 
 
+RATE_LIMIT_URL = 'https://archive.org/metadata/iamine-rate-limiter'
+
+# The rate limit to use until the global rate limit is known.
+DEFAULT_RATE_LIMIT = 300
+
+
 class Miner(object):
 
     def __init__(self,
@@ -32,7 +48,38 @@ class Miner(object):
                  config_file=None,
                  access=None,
                  secret=None,
-                 debug=None):
+                 debug=None,
+                 rate_limiter=None,
+                 burst=None,
+                 rate_limit_interval=None,
+                 queue_size=None,
+                 pool_size=None,
+                 per_host_limit=None,
+                 keepalive_timeout=None,
+                 dns_cache_ttl=None,
+                 journal=None,
+                 cache=None,
+                 sink=None,
+                 retry_policy=None,
+                 adaptive=None,
+                 min_tasks=None,
+                 stats=None,
+                 progress=None,
+                 stats_file=None,
+                 metrics_port=None,
+                 auth_url=None,
+                 rate_limit_url=None,
+                 rate_share=None,
+                 verify=None,
+                 startup_cache=None,
+                 startup_ttl=None,
+                 fields=None,
+                 batch_size=None,
+                 dedup=None,
+                 dedup_size=None,
+                 ordered=None,
+                 window=None,
+                 state=None):
 
         # Set default values for kwargs.
         loop = asyncio.get_event_loop() if not loop else loop
@@ -43,39 +90,176 @@ class Miner(object):
         access = config.get('s3', {}).get('access', access)
         secret = config.get('s3', {}).get('secret', secret)
         debug = True if debug else False
+        rate_limit_interval = 300 if not rate_limit_interval else rate_limit_interval
+        rate_share = 1.0 if not rate_share else rate_share
+        verify = True if verify is None else verify
+        if not isinstance(startup_cache, StartupCache):
+            startup_cache = StartupCache(startup_cache, startup_ttl)
+        queue_size = 1000 if not queue_size else queue_size
+        # The S3 key check and rate limit lookup can be pointed elsewhere,
+        # e.g. at a mock server, with the config file's [iamine] section.
+        urls = config.get('iamine', {})
+        if not auth_url:
+            auth_url = urls.get('auth-url', '{}s3.us.archive.org?check_auth=1'.format(protocol))
+        if not rate_limit_url:
+            rate_limit_url = urls.get('rate-limit-url', RATE_LIMIT_URL)
+        # A journal is given as a path, or as an object with the same
+        # interface, such as a worker process's ShardJournal.
+        if isinstance(journal, str):
+            journal = Journal(journal)
+        if cache and not isinstance(cache, MetadataCache):
+            cache = MetadataCache(cache)
+        if state and not isinstance(state, StateStore):
+            state = StateStore(state)
+        sink = StreamSink() if not sink else sink
+        ordered = True if ordered else False
+        window = 10000 if not window else window
+        if ordered:
+            # Records are held until every request queued before theirs
+            # has finished, and intake stalls once window requests are
+            # outstanding past the first unfinished one.
+            sink = OrderedSink(sink, window=window, loop=loop)
+        if fields and not isinstance(fields, FieldSet):
+            fields = FieldSet(fields)
+        batch_size = 1 if not batch_size else batch_size
+        if not retry_policy:
+            retry_policy = RetryPolicy(max_retries, budget=RetryBudget())
 
         self.max_tasks = max_tasks
         self.max_retries = max_retries
         self.protocol = protocol
         self.hosts = hosts
+        self.host_pool = HostPool(hosts, protocol)
         self.config = config
         self.access = access
+        self.secret = secret
         self.debug = debug
+        self.auth_url = auth_url
+        self.rate_limit_url = rate_limit_url
         self.cookies = config.get('cookies', {})
+        self.journal = journal
+        self.cache = cache
+        self.state = state
+        # The last-modified indicators of items queued in incremental
+        # mode, recorded in the state store once they are mined.
+        self._updated = dict()
+        self.sink = sink
+        self.fields = fields
+        self.batch_size = batch_size
+        self.ordered = ordered
+        self.window = window
+        self._seq = 0
+        self.retry_policy = retry_policy
+        # With adaptive concurrency, max_tasks workers are started but
+        # the number of requests in flight is limited by the controller.
+        self.controller = None
+        if adaptive:
+            min_tasks = max(1, max_tasks // 10) if not min_tasks else min_tasks
+            self.controller = AIMDLimiter(min_tasks, max_tasks, loop=loop)
+
+        # Instrumentation.
+        self.stats = Stats() if not stats else stats
+        self.stats.host_pool = self.host_pool
+        self.progress = progress
+        self.stats_file = stats_file
+        self.metrics_port = metrics_port
+        self._metrics_server = None
+
+        # Duplicate identifiers in the input are dropped before they are
+        # queued, and counted in the statistics.
+        if dedup and not isinstance(dedup, Deduplicator):
+            dedup = Deduplicator(dedup_size, stats=self.stats)
+        self.dedup = dedup
 
-        # Asyncio/Aiohttp settings.
-        self.connector = aiohttp.TCPConnector(share_cookies=True, loop=loop)
-        self.connector.update_cookies(self.cookies)
+        # Asyncio/Aiohttp settings. One session is shared by all requests
+        # so that connections are reused.
         self.loop = loop
-        self.q = Queue(1000, loop=self.loop)
-        self.q = Queue(loop=self.loop)
+        self.session = MineSession(pool_size=pool_size,
+                                   per_host_limit=per_host_limit,
+                                   keepalive_timeout=keepalive_timeout,
+                                   dns_cache_ttl=dns_cache_ttl,
+                                   cookies=self.cookies,
+                                   loop=loop)
+        self.connector = self.session.connector
 
-        # Require valid access key!
-        self.assert_s3_keys_valid(access, secret)
+        # What requests have in common, including their User-Agent, is
+        # built once and shared between them.
+        common = dict(max_retries=max_retries,
+                      retry_policy=retry_policy,
+                      controller=self.controller,
+                      stats=self.stats,
+                      debug=debug,
+                      session=self.session)
+        self.template = RequestTemplate(access, host_pool=self.host_pool, cache=cache,
+                                        fields=fields, **common)
+        # Search pages aren't cached, and absolute URLs don't go through
+        # the host pool.
+        self.search_template = RequestTemplate(access, host_pool=self.host_pool, **common)
+        self.url_template = RequestTemplate(access, **common)
+        # Requests are queued lazily, the bounded queue applies backpressure.
+        # Requests are handed out by priority, and fairly between jobs.
+        self.queue_size = queue_size
+        self.q = Scheduler(queue_size, loop=self.loop)
+        self.pool = None
 
-        # Rate limiting.
-        self._max_per_second = self.get_global_rate_limit()
-        self._min_interval = 1.0 / float(self._max_per_second)
-        self._last_time_called = 0.0
+        # The S3 key check and rate limit lookup are made by
+        # Miner.startup(), on the event loop.
+        self.verify = verify
+        self.startup_cache = startup_cache
+        self._started = False
+
+        # Rate limiting. A limiter can be passed in to share it between
+        # miners, and miners in separate processes each take a share of
+        # the global rate limit. Until it has been looked up, the last
+        # known global rate limit is used.
+        self.rate_share = rate_share
+        # The configured burst is kept when the rate limit is resized.
+        self.burst = burst
+        self._rate_limit_known = bool(rate_limiter)
+        if not rate_limiter:
+            rate = self.startup_cache.get(self._rate_limit_key)
+            self._rate_limit_known = rate is not None
+            rate = DEFAULT_RATE_LIMIT if rate is None else rate
+            rate_limiter = TokenBucket(rate * rate_share, burst, loop=self.loop)
+        self.rate_limiter = rate_limiter
+        self.rate_limit_interval = rate_limit_interval
+
+        self.stats.add_gauge('q_depth', self.q.qsize)
+        self.stats.add_gauge('q_delayed', lambda: self.q.delayed)
+        self.stats.add_gauge('workers', lambda: len(self.pool) if self.pool else 0)
+        self.stats.add_gauge('workers_busy', lambda: self.pool.busy if self.pool else 0)
+        self.stats.add_gauge('rate_limit', lambda: self.rate_limiter.rate)
+        if self.controller:
+            self.stats.add_gauge('concurrency_limit', lambda: self.controller.limit)
+
+    def shutdown(self):
+        """Release the resources held by the miner without stopping
+        the event loop.
+        """
+        self.session.close()
+        if self.journal:
+            self.journal.close()
+        if self.cache:
+            self.cache.close()
+        if self.state:
+            self.state.close()
+        self.sink.close()
+        if self._metrics_server:
+            self._metrics_server.close()
+            self._metrics_server = None
+        if self.stats_file:
+            self.stats.dump(self.stats_file)
 
     def close(self):
-        self.connector.close()
+        self.shutdown()
         self.loop.stop()
         self.loop.close()
 
     def assert_s3_keys_valid(self, access, secret):
-        url = '{}s3.us.archive.org?check_auth=1'.format(self.protocol)
-        r = urllib.request.Request(url)
+        """Check S3 keys, blocking. Miners check their keys with
+        :meth:`Miner.check_s3_keys` instead.
+        """
+        r = urllib.request.Request(self.auth_url)
         r.add_header('Authorization', 'LOW {0}:{1}'.format(access, secret))
         f = urllib.request.urlopen(r)
         j = json.loads(f.read().decode('utf-8'))
@@ -83,74 +267,320 @@ class Miner(object):
             raise AuthenticationError(j.get('error'))
 
     def get_global_rate_limit(self):
-        """Get the global rate limit per client.
+        """Get the global rate limit per client, blocking. See
+        :meth:`Miner.fetch_global_rate_limit`.
 
         :rtype: int
         :returns: The global rate limit for each client.
         """
-        r = urllib.request.urlopen('https://archive.org/metadata/iamine-rate-limiter')
+        r = urllib.request.urlopen(self.rate_limit_url)
         j = json.loads(r.read().decode('utf-8'))
-        return int(j.get('metadata', {}).get('rate_per_second', 300))
-
-    def _rate_limited():
-        """A rate limit decorator for limiting the number of times the
-        decorated :class:`Miner` method can be called. Limits are set in
-        :attr:`Miner._max_per_second`.
-        """
-        def decorate(func):
-            def rate_limited_func(self, *args, **kwargs):
-                elapsed = time.monotonic() - self._last_time_called
-                self.left_to_wait = self._min_interval - elapsed
-                if self.left_to_wait > 0:
-                    time.sleep(self.left_to_wait)
-                func(self, *args, **kwargs)
-                self._last_time_called = time.monotonic()
-                yield from func(self, *args, **kwargs)
-            return rate_limited_func
-        return decorate
-
-    @_rate_limited()
-    def make_rate_limited_request(self, request):
-        yield from request.make_request()
+        return int(j.get('metadata', {}).get('rate_per_second', DEFAULT_RATE_LIMIT))
+
+    @property
+    def _auth_key(self):
+        # Keys are hashed, rather than stored in the startup cache.
+        h = hashlib.sha1('{} {} {}'.format(self.auth_url, self.access, self.secret).encode('utf-8'))
+        return 'auth:{}'.format(h.hexdigest())
+
+    @property
+    def _rate_limit_key(self):
+        return 'rate-limit:{}'.format(self.rate_limit_url)
+
+    @asyncio.coroutine
+    def _get_json(self, url, **kwargs):
+        resp = yield from self.session.request('GET', url, **kwargs)
+        try:
+            body = yield from resp.read()
+        finally:
+            resp.close()
+        return json.loads(body.decode('utf-8'))
 
     @asyncio.coroutine
-    def work(self):
+    def check_s3_keys(self):
+        """Check that the miner's S3 keys are valid, unless they were
+        found valid within the startup cache's TTL.
+
+        :raises: :class:`AuthenticationError` if they aren't.
+        """
+        if self.startup_cache.get(self._auth_key):
+            return
+        headers = {'Authorization': 'LOW {0}:{1}'.format(self.access, self.secret)}
+        j = yield from self._get_json(self.auth_url, headers=headers)
+        if j.get('authorized') is not True:
+            raise AuthenticationError(j.get('error'))
+        self.startup_cache.set(self._auth_key, True)
+
+    @asyncio.coroutine
+    def fetch_global_rate_limit(self):
+        """Look up the global rate limit per client.
+
+        :rtype: int
+        :returns: The global rate limit for each client.
+        """
+        j = yield from self._get_json(self.rate_limit_url)
+        rate = int(j.get('metadata', {}).get('rate_per_second', DEFAULT_RATE_LIMIT))
+        self.startup_cache.set(self._rate_limit_key, rate)
+        return rate
+
+    @asyncio.coroutine
+    def update_rate_limit(self):
+        """Resize :attr:`Miner.rate_limiter` to the current global rate
+        limit.
+        """
+        try:
+            rate = yield from self.fetch_global_rate_limit()
+        except Exception:
+            return
+        self._rate_limit_known = True
+        rate *= self.rate_share
+        if rate != self.rate_limiter.rate:
+            self.rate_limiter.set_rate(rate, self.burst)
+
+    @asyncio.coroutine
+    def startup(self, *coros):
+        """Make the requests needed before mining starts, concurrently
+        with each other and with ``coros``, e.g. a search's
+        :meth:`SearchMiner.fetch_search_info`.
+
+        The S3 keys are checked, and the global rate limit looked up,
+        unless their results are in the startup cache. With ``verify``
+        off, the keys aren't checked, and mining starts right away at
+        the last known rate limit while it is looked up.
+
+        :returns: A list of the results of ``coros``.
+        """
+        startup = list()
+        if not self._started:
+            self._started = True
+            if self.verify:
+                startup.append(self.check_s3_keys())
+            if not self._rate_limit_known:
+                if self.verify:
+                    startup.append(self.update_rate_limit())
+                else:
+                    asyncio.Task(self.update_rate_limit(), loop=self.loop)
+        results = yield from asyncio.gather(*(startup + list(coros)), loop=self.loop)
+        return results[len(startup):]
+
+    @asyncio.coroutine
+    def refresh_rate_limit(self):
         while True:
-            request = yield from self.q.get()
-            yield from self.make_rate_limited_request(request)
-            self.q.task_done()
+            yield from asyncio.sleep(self.rate_limit_interval, loop=self.loop)
+            yield from self.update_rate_limit()
+
+    @asyncio.coroutine
+    def start_background_tasks(self):
+        """Start the tasks that run alongside mining: refreshing the rate
+        limit, reporting progress and serving metrics.
+
+        :rtype: list
+        :returns: The tasks to cancel once mining is done.
+        """
+        tasks = [asyncio.Task(self.refresh_rate_limit(), loop=self.loop)]
+        if self.progress:
+            tasks.append(asyncio.Task(self.stats.report_progress(self.progress), loop=self.loop))
+        if self.metrics_port and not self._metrics_server:
+            self._metrics_server, _ = yield from self.stats.serve(self.metrics_port,
+                                                                  loop=self.loop)
+        return tasks
+
+    @asyncio.coroutine
+    def make_rate_limited_attempt(self, request):
+        """Make a single attempt at ``request``, once the rate limiter
+        and concurrency controller allow it.
+
+        :rtype: tuple
+        :returns: See :meth:`MineRequest.attempt`.
+        """
+        if self.controller:
+            yield from self.controller.acquire()
+        try:
+            # Responses served from the local cache don't count against
+            # the rate limit.
+            if not request.is_cached():
+                self.stats.rate_limit_wait += yield from self.rate_limiter.acquire()
+            return (yield from request.attempt())
+        finally:
+            if self.controller:
+                self.controller.release()
+
+    def _finish_request(self, request, ok):
+        if ok and self.journal and request.key:
+            self.journal.record(request.key)
+        if self.state and (request.key in self._updated):
+            updated = self._updated.pop(request.key)
+            if ok:
+                self.state.record(request.key, updated)
+        if request.seq is not None:
+            self.sink.finish(request.seq)
 
     @asyncio.coroutine
-    def q_requests(self, requests):
+    def make_rate_limited_request(self, request):
+        """Make ``request``, retrying it until it is done.
+
+        :rtype: bool
+        :returns: ``True`` if the request succeeded.
+        """
+        while True:
+            ok, delay = yield from self.make_rate_limited_attempt(request)
+            if delay is None:
+                break
+            yield from asyncio.sleep(delay, loop=self.loop)
+        self._finish_request(request, ok)
+        return ok
+
+    @asyncio.coroutine
+    def make_scheduled_request(self, request, queue):
+        """Make an attempt at ``request``, the handler of workers. If it
+        has to be retried, it is put back on ``queue`` to be retried
+        after its backoff, so the worker can move on to other requests
+        in the meantime.
+
+        :param queue: The :class:`iamine.scheduler.Scheduler` the
+                      request came from.
+        """
+        ok, delay = yield from self.make_rate_limited_attempt(request)
+        if delay is not None:
+            queue.retry(request, delay)
+        else:
+            self._finish_request(request, ok)
+
+    def worker_pool(self, queue, size):
+        """Start a pool of ``size`` workers making the requests queued
+        on ``queue``.
+
+        :rtype: :class:`iamine.pool.WorkerPool`
+        """
+        return WorkerPool(queue, partial(self.make_scheduled_request, queue=queue), size,
+                          loop=self.loop)
+
+    @asyncio.coroutine
+    def q_requests(self, requests, job=None, priority=None):
+        """Queue requests as workers make room for them.
+
+        :param requests: The requests to queue. They are consumed
+                         lazily, so generators over very large inputs
+                         can be passed without loading them into memory.
+        :type requests: iterable
+
+        :param job: (optional) The job the requests belong to. Workers
+                    are shared fairly between the jobs of a miner.
+
+        :param priority: (optional) The priority to queue the requests
+                         with, see :mod:`iamine.scheduler`.
+        :type priority: int
+        """
+        for req in requests:
+            if job is not None:
+                req.job = job
+            if priority is not None:
+                req.priority = priority
+            yield from self.sink.wait_for_room(req.seq)
+            yield from self.q.put(req)
+
+    def sequence(self, requests):
+        """Number requests in the order they are queued, so that an
+        ordered miner writes their records in that order.
+
+        :type requests: iterable
+
+        :returns: A generator yielding each request.
+        """
         for req in requests:
-            self.q.put_nowait(req)
+            req.seq = self._seq
+            self._seq += 1
+            yield req
 
     @asyncio.coroutine
-    def mine(self, requests):
-        workers = [asyncio.Task(self.work(), loop=self.loop)
-                   for _ in range(self.max_tasks)]
-        yield from self.q_requests(requests)
+    def mine(self, requests, max_tasks=None, job=None, priority=None):
+        """Make requests concurrently, with a pool of workers.
+
+        :param requests: The requests to make.
+        :type requests: iterable
+
+        :param max_tasks: (optional) The number of workers to start with.
+                          Defaults to :attr:`Miner.max_tasks`. The pool
+                          is available as :attr:`Miner.pool` while
+                          mining, and may be resized.
+        :type max_tasks: int
+
+        :param job: (optional) See :meth:`Miner.q_requests`.
+
+        :param priority: (optional) See :meth:`Miner.q_requests`.
+        :type priority: int
+        """
+        max_tasks = self.max_tasks if not max_tasks else max_tasks
+        if self.ordered:
+            requests = self.sequence(requests)
+        yield from self.startup()
+        self.pool = self.worker_pool(self.q, max_tasks)
+        tasks = yield from self.start_background_tasks()
+        yield from self.q_requests(requests, job, priority)
 
         yield from self.q.join()
-        yield from asyncio.sleep(1)
-        while not self.q.empty():
-            yield from asyncio.sleep(1)
+        self.sink.flush()
+        if self.journal:
+            self.journal.sync()
 
-        for w in workers:
-            w.cancel()
+        for task in tasks:
+            task.cancel()
+        self.pool.cancel()
         yield from asyncio.sleep(.5)
 
+    @asyncio.coroutine
+    def mine_urls(self, urls, params=None, callback=None):
+        """Retrieve URLs concurrently.
+
+        :param urls: The absolute URLs to retrieve, read lazily.
+        :type urls: iterable
+
+        :param params: (optional) URL parameters to send with each
+                       request.
+        :type params: dict
+
+        :param callback: (optional) A callback function to be called on
+                         each :py:class:`aiohttp.client.ClientResponse`.
+                         By default, responses are written to
+                         :attr:`Miner.sink`.
+        :type callback: func
+        """
+        if self.dedup:
+            urls = self.dedup.filter(urls)
+        yield from self.mine(url_requests(urls, params, callback, self))
+
+    def iter_urls(self, urls, params=None, max_backlog=None):
+        """Retrieve URLs concurrently, returning their JSON responses as
+        they complete.
+
+        :rtype: :class:`iamine.iterators.ResultIterator`
+        """
+        return ResultIterator(self, lambda: self.mine_urls(urls, params),
+                              max_backlog=max_backlog)
+
 
 class ItemMiner(Miner):
 
     def __init__(self, **kwargs):
         super(ItemMiner, self).__init__(**kwargs)
+        # The identifiers of batch requests in flight, and the list to
+        # add them to if the request fails.
+        self._batches = dict()
+
+    def _finish_request(self, request, ok):
+        super(ItemMiner, self)._finish_request(request, ok)
+        batch = self._batches.pop(request, None)
+        if batch and not ok:
+            # Items of a failed batch are looked up one by one.
+            identifiers, missing = batch
+            missing.extend(identifiers)
 
     @asyncio.coroutine
     def mine_items(self, identifiers, params=None, callback=None):
         """Mine metadata from Archive.org items.
 
-        :param identifiers: Archive.org identifiers to be mined.
+        :param identifiers: Archive.org identifiers to be mined. They
+                            are read lazily, as workers become free.
         :type identifiers: iterable
 
         :param params: URL parameters to send with each metadata
@@ -163,16 +593,137 @@ class ItemMiner(Miner):
         """
         # By default, don't cache item metadata in redis.
         params = {'dontcache': 1} if not params else {}
+        if self.dedup:
+            identifiers = self.dedup.filter(identifiers)
+        if (self.batch_size > 1) and self.fields and self.fields.searchable and not callback:
+            if self.ordered:
+                raise ValueError('Batched requests can not be mined in order.')
+            missing = list()
+            yield from self.mine(self.batch_requests(identifiers, missing))
+            # Items search didn't return, e.g. ones that haven't been
+            # indexed yet, are looked up one by one.
+            if not missing:
+                return
+            identifiers = missing
         requests = metadata_requests(identifiers, params, callback, self)
         yield from self.mine(requests)
 
+    def iter_items(self, identifiers, params=None, max_backlog=None):
+        """Mine metadata from Archive.org items, returning each item's
+        metadata (or fields) as it completes, e.g.::
+
+            async for item in miner.iter_items(identifiers):
+                print(item['metadata']['title'])
+
+        :param max_backlog: (optional) The number of bytes of results to
+                            buffer before mining is held back.
+        :type max_backlog: int
+
+        :rtype: :class:`iamine.iterators.ResultIterator`
+        """
+        return ResultIterator(self, lambda: self.mine_items(identifiers, params),
+                              max_backlog=max_backlog)
+
+    def batch_requests(self, identifiers, missing):
+        """Make requests looking up the fields of items in batches of
+        :attr:`Miner.batch_size`, with a single search query each.
+
+        :param missing: A list to add the identifiers search didn't
+                        return to.
+        :type missing: list
+
+        :returns: A generator yielding a :class:`MineRequest` per batch.
+        """
+        batch = list()
+        for identifier in identifiers:
+            identifier = identifier.strip()
+            if (not identifier) or (self.journal and identifier in self.journal):
+                continue
+            batch.append(identifier)
+            if len(batch) >= self.batch_size:
+                yield self.batch_request(batch, missing)
+                batch = list()
+        if batch:
+            yield self.batch_request(batch, missing)
+
+    def batch_request(self, identifiers, missing):
+        """Make a request looking up the fields of ``identifiers``.
+
+        Records are written, and items journaled, as the response is
+        handled, and identifiers missing from it, or every identifier if
+        the request fails, are added to ``missing``.
+
+        :rtype: :class:`MineRequest`
+        """
+        quoted = ('"{}"'.format(i.replace('\\', '\\\\').replace('"', '\\"'))
+                  for i in identifiers)
+        params = {
+            'q': 'identifier:({})'.format(' OR '.join(quoted)),
+            'rows': len(identifiers),
+            'page': 1,
+            'output': 'json',
+        }
+        for i, field in enumerate(['identifier'] + self.fields.search_fields):
+            params['fl[{}]'.format(i)] = field
+
+        @asyncio.coroutine
+        def handle_batch(resp):
+            j = yield from resp.json(encoding='utf-8')
+            resp.close()
+            wanted = set(identifiers)
+            records = list()
+            for doc in j.get('response', {}).get('docs', []):
+                if doc.get('identifier') in wanted:
+                    wanted.discard(doc['identifier'])
+                    records.append(self.fields.from_search(doc))
+            for record in records:
+                self.sink.write(json.dumps(record).encode('utf-8'))
+                if self.journal:
+                    self.journal.record(record['identifier'])
+            missing.extend(i for i in identifiers if i in wanted)
+
+        req = self.search_template.request('/advancedsearch.php',
+                                           params=params,
+                                           callback=handle_batch,
+                                           sink=self.sink)
+        self._batches[req] = (identifiers, missing)
+        return req
+
 
 class SearchMiner(ItemMiner):
+    """Mine search results, and optionally the items they return.
 
-    def __init__(self, **kwargs):
+    When mining items, search pages and items are mined in two stages,
+    each with its own pool of workers, connected by a bounded queue.
+    The :attr:`Miner.max_tasks` workers are split between the stages,
+    and the split is rebalanced towards whichever stage is the
+    bottleneck.
+
+    :param search_tasks: (optional) The number of search page workers to
+                         start with when mining items. Defaults to a
+                         tenth of :attr:`Miner.max_tasks`, as each page
+                         yields many items.
+    :type search_tasks: int
+
+    :param balance: (optional) Set to ``False`` to keep the split
+                    between search and item workers fixed.
+    :type balance: bool
+
+    :param \*\*kwargs: (optional) Arguments that :class:`Miner` takes.
+    """
+
+    def __init__(self, search_tasks=None, balance=None, **kwargs):
         super(SearchMiner, self).__init__(**kwargs)
-        # Item mining queue.
-        self.iq = Queue(1000, loop=self.loop)
+        search_tasks = max(1, self.max_tasks // 10) if not search_tasks else search_tasks
+        balance = True if balance is None else balance
+
+        self.search_tasks = min(search_tasks, self.max_tasks - 1) if self.max_tasks > 1 else 1
+        self.balance = balance
+        # Item mining queue, fed by search page workers.
+        self.iq = Scheduler(self.queue_size, loop=self.loop)
+        self.item_pool = None
+        self.stats.add_gauge('iq_depth', self.iq.qsize)
+        self.stats.add_gauge('item_workers', lambda: len(self.item_pool) if self.item_pool else 0)
 
     def get_search_params(self, query, params):
         default_rows = 500
@@ -190,7 +741,7 @@ class SearchMiner(ItemMiner):
         return search_params
 
     def get_search_info(self, params):
-        url = make_url('/advancedsearch.php?', self.protocol, self.hosts)
+        url = self.host_pool.url('/advancedsearch.php?')
         p = deepcopy(params)
         p['rows'] = 0
 
@@ -199,19 +750,77 @@ class SearchMiner(ItemMiner):
         f = urllib.request.urlopen(url)
         return json.loads(f.read().decode('utf-8'))
 
+    @asyncio.coroutine
+    def fetch_search_info(self, params):
+        """Get the number of results of a search, and its response
+        header, without blocking the event loop.
+
+        :param params: The search parameters, see
+                       :meth:`SearchMiner.get_search_params`.
+        :type params: dict
+
+        :rtype: dict
+        """
+        p = deepcopy(params)
+        p['rows'] = 0
+        return (yield from self._get_json(self.host_pool.url('/advancedsearch.php'), params=p))
+
+    def get_scrape_params(self, query, params, mine_ids=None):
+        """Translate Advancedsearch API parameters into Scrape API
+        parameters.
+
+        :rtype: dict
+        """
+        params = params if params else {}
+        fields = [v for k, v in sorted(params.items()) if k.startswith('fl')]
+        if mine_ids:
+            fields = ['identifier', 'oai_updatedate'] if self.state else ['identifier']
+        elif fields and ('identifier' not in fields):
+            fields.append('identifier')
+        # The Scrape API returns between 100 and 10,000 results per page.
+        count = int(params.get('rows', 10000))
+        scrape_params = {
+            'q': query if query else 'all:1',
+            'count': min(max(count, 100), 10000),
+        }
+        if fields:
+            scrape_params['fields'] = ','.join(fields)
+        return scrape_params
+
+    @asyncio.coroutine
+    def _queue_identifiers(self, identifiers, params=None, callback=None):
+        if self.dedup:
+            identifiers = self.dedup.filter(identifiers)
+        for req in metadata_requests(identifiers, params, callback, self):
+            yield from self.sink.wait_for_room()
+            yield from self.iq.put(req)
+
+    def _changed_identifiers(self, docs):
+        """Get the identifiers of search results, skipping items that
+        haven't changed since they were last mined, if there is a state
+        store.
+        """
+        for doc in docs:
+            identifier = doc.get('identifier')
+            if not identifier:
+                continue
+            if self.state:
+                updated = last_updated(doc)
+                if not self.state.changed(identifier, updated):
+                    self.stats.unchanged += 1
+                    continue
+                self._updated[identifier] = updated
+            yield identifier
+
     @asyncio.coroutine
     def _handle_search_results(self, resp, params=None, callback=None):
         j = yield from resp.json(encoding='utf-8')
         resp.close()
-        identifiers = []
-        for doc in j.get('response', {}).get('docs', []):
-            if not doc.get('identifier'):
-                continue
-            identifiers.append(doc['identifier'])
-        for req in metadata_requests(identifiers, params, callback, self):
-            self.iq.put_nowait(req)
+        identifiers = list(self._changed_identifiers(j.get('response', {}).get('docs', [])))
+        yield from self._queue_identifiers(identifiers, params, callback)
 
-    def search_requests(self, query=None, params=None, callback=None, mine_ids=None):
+    def search_requests(self, query=None, params=None, callback=None, mine_ids=None,
+                        search_info=None):
         """Mine Archive.org search results.
 
         :param query: The Archive.org search query to yield results for.
@@ -222,14 +831,21 @@ class SearchMiner(ItemMiner):
         :param params: The URL parameters to send with each request sent
                        to the Archive.org Advancedsearch Api.
         :type params: dict
+
+        When resuming from a journal, completed search pages are skipped.
+        If ``mine_ids`` is set, the mined items are journaled instead of
+        the pages, so that items from interrupted pages are not lost.
         """
-        # If mining ids, devote half the workers to search and half to item mining.
-        if mine_ids:
-            self.max_tasks = self.max_tasks/2
-        # When mining id's, the only field we need returned is "identifier".
-        if mine_ids and params:
+        # When mining id's, the only field we need returned is "identifier",
+        # and in incremental mode, the items' last-modified indicator.
+        if mine_ids and (params or self.state):
+            params = params if params else {}
             params = dict((k, v) for k, v in params.items() if 'fl' not in k)
-            params['fl[]'] = 'identifier'
+            if self.state:
+                params['fl[0]'] = 'identifier'
+                params['fl[1]'] = 'oai_updatedate'
+            else:
+                params['fl[]'] = 'identifier'
 
         # Make sure "identifier" is always returned in search results.
         fields = [k for k in params if 'fl' in k]
@@ -240,59 +856,301 @@ class SearchMiner(ItemMiner):
                 i += 1
             params['fl[{}]'.format(i)] = 'identifier'
 
-        search_params = self.get_search_params(query, params)
-        url = make_url('/advancedsearch.php', self.protocol, self.hosts)
+        if not callback and mine_ids:
+            callback = self._handle_search_results
+        for params, key in self.search_pages(query, params, mine_ids, search_info):
+            yield self.page_request(params, key, callback)
 
-        search_info = self.get_search_info(search_params)
+    def search_pages(self, query, params, mine_ids=None, search_info=None):
+        """Get the URL parameters for each page of search results.
+
+        The number of pages is taken from ``search_info``, as returned
+        by :meth:`SearchMiner.fetch_search_info`, or if it isn't given,
+        from :meth:`SearchMiner.get_search_info`.
+
+        :returns: A generator yielding the parameters and journal key of
+                  each page. The key is ``None`` if ``mine_ids`` is set,
+                  and pages already recorded in the journal are skipped.
+        """
+        search_params = self.get_search_params(query, params)
+        if not search_info:
+            search_info = self.get_search_info(search_params)
         total_results = search_info.get('response', {}).get('numFound', 0)
-        total_pages = (int(total_results/search_params['rows']) + 1)
+        rows = int(search_params['rows'])
+        total_pages = (total_results + rows - 1) // rows
 
         for page in range(1, (total_pages + 1)):
             params = deepcopy(search_params)
             params['page'] = page
-            if not callback and mine_ids:
-                callback = self._handle_search_results
-            req = MineRequest('GET', url, self.access,
-                              callback=callback,
-                              max_retries=self.max_retries,
-                              debug=self.debug,
-                              params=params,
-                              connector=self.connector)
-            yield req
+            key = None if mine_ids else urllib.parse.urlencode(sorted(params.items()))
+            if key and self.journal and key in self.journal:
+                continue
+            yield params, key
+
+    def page_request(self, params, key=None, callback=None, seq=None):
+        """Make a request for a page of search results.
+
+        :rtype: :class:`MineRequest`
+        """
+        return self.search_template.request('/advancedsearch.php',
+                                            key=key,
+                                            seq=seq,
+                                            params=params,
+                                            callback=callback,
+                                            sink=self.sink,
+                                            priority=PRIORITY_SEARCH)
+
+    @asyncio.coroutine
+    def scrape(self, query=None, params=None, callback=None, mine_ids=None, partitions=None):
+        """Mine Archive.org search results with the Scrape API.
+
+        Each page is requested with the cursor returned along with the
+        previous page, so the cost of a page does not grow with its
+        depth into the results. Pages of a query are therefore fetched
+        one at a time, and with ``mine_ids`` the items they return are
+        mined concurrently.
+
+        :param query: The Archive.org search query to yield results for.
+        :type query: str
+
+        :param params: Advancedsearch API parameters, as passed to
+                       :meth:`SearchMiner.search`. ``rows`` and ``fl[]``
+                       are translated to the Scrape API's ``count`` and
+                       ``fields``.
+        :type params: dict
+
+        :param partitions: (optional) Disjoint sub-queries to scrape
+                           instead of ``query``, see
+                           :class:`iamine.partition.Partitioner`. Each
+                           has its own cursor, and up to
+                           :attr:`SearchMiner.search_tasks` of them are
+                           scraped at once.
+        :type partitions: list
+
+        When resuming from a journal, the cursor of the last completed
+        page of each query is checkpointed, and the scrape continues
+        from it. If ``mine_ids`` is set, the mined items are journaled
+        instead.
+        """
+        queries = [query] if not partitions else partitions
+        yield from self.startup()
+        if mine_ids:
+            self.item_pool = self.worker_pool(self.iq, self.max_tasks)
+        tasks = yield from self.start_background_tasks()
+
+        semaphore = asyncio.Semaphore(self.search_tasks, loop=self.loop)
+
+        @asyncio.coroutine
+        def scrape_query(q):
+            with (yield from semaphore):
+                yield from self._scrape_cursor(q, params, callback, mine_ids)
+
+        yield from asyncio.gather(*[scrape_query(q) for q in queries], loop=self.loop)
+
+        if mine_ids:
+            yield from self.iq.join()
+            self.item_pool.cancel()
+        self.sink.flush()
+        if self.journal:
+            self.journal.sync()
+        for task in tasks:
+            task.cancel()
+
+    @asyncio.coroutine
+    def _scrape_cursor(self, query, params=None, callback=None, mine_ids=None):
+        # Follow the cursor of a single query to its last page.
+        scrape_params = self.get_scrape_params(query, params, mine_ids)
+        url = '/services/search/v1/scrape'
+
+        checkpoint = None
+        cursor = None
+        if self.journal and not mine_ids:
+            checkpoint = urllib.parse.urlencode(sorted(scrape_params.items()))
+            cursor = self.journal.get_checkpoint(checkpoint)
+            # A checkpoint of False marks a scrape that already completed.
+            if cursor is False:
+                return
+
+        page = dict()
+
+        @asyncio.coroutine
+        def handle_page(resp):
+            j = yield from resp.json(encoding='utf-8')
+            page['cursor'] = j.get('cursor')
+            if mine_ids:
+                identifiers = list(self._changed_identifiers(j.get('items', [])))
+                yield from self._queue_identifiers(identifiers)
+            elif callback:
+                yield from callback(resp)
+            else:
+                self.sink.write((yield from resp.read()))
+
+        while True:
+            params = dict(scrape_params)
+            if cursor:
+                params['cursor'] = cursor
+            page.clear()
+            req = self.search_template.request(url,
+                                               params=params,
+                                               callback=handle_page,
+                                               sink=self.sink)
+            ok = yield from self.make_rate_limited_request(req)
+            if not ok:
+                break
+            cursor = page.get('cursor')
+            if checkpoint:
+                self.journal.set_checkpoint(checkpoint, cursor if cursor else False)
+            if not cursor:
+                break
 
     @asyncio.coroutine
-    def mine_items(self):
+    def balance_workers(self, interval=1):
+        """Periodically move workers between the search page pool and
+        the item pool, towards whichever stage is the bottleneck.
+        """
         while True:
-            request = yield from self.iq.get()
-            yield from self.make_rate_limited_request(request)
-            self.iq.task_done()
+            yield from asyncio.sleep(interval, loop=self.loop)
+            search_pool, item_pool = self.pool, self.item_pool
+            if (not search_pool) or (not item_pool):
+                continue
+            # Once all pages have been fetched, items get every worker.
+            if search_pool.closed:
+                item_pool.resize(self.max_tasks)
+                return
+            if not self.balance:
+                continue
+            step = max(1, self.max_tasks // 20)
+            if self.iq.full() and (search_pool.size > 1):
+                # Search workers are blocked handing off items.
+                step = min(step, search_pool.size - 1)
+                search_pool.resize(search_pool.size - step)
+                item_pool.resize(item_pool.size + step)
+            elif self.iq.empty() and item_pool.idle and (not search_pool.idle):
+                # Item workers are starved for identifiers.
+                step = min(step, item_pool.idle, item_pool.size - 1)
+                if step > 0:
+                    item_pool.resize(item_pool.size - step)
+                    search_pool.resize(search_pool.size + step)
+
+    def iter_search(self, query=None, params=None, mine_ids=None, scrape=None,
+                    max_backlog=None, partitioner=None):
+        """Mine Archive.org search results, returning each search result,
+        or with ``mine_ids`` each item's metadata, as it completes.
+
+        :rtype: :class:`iamine.iterators.ResultIterator`
+        """
+        docs = None if mine_ids else search_docs
+        return ResultIterator(self, lambda: self.search(query, params, mine_ids=mine_ids,
+                                                        scrape=scrape, partitioner=partitioner),
+                              docs=docs, max_backlog=max_backlog)
 
     @asyncio.coroutine
-    def search(self, query=None, params=None, callback=None, mine_ids=None):
-        search_requests = self.search_requests(query, params, callback, mine_ids)
-        if mine_ids:
-            workers = [asyncio.Task(self.mine_items(), loop=self.loop)
-                       for _ in range(self.max_tasks)]
+    def get_partitions(self, partitioner, query=None):
+        """Split ``query`` with ``partitioner``, see
+        :meth:`iamine.partition.Partitioner.partition`.
+
+        Partitions depend on the time and on live counts, so when
+        resuming from a journal, the partitions of the interrupted run
+        are reused, so that their checkpoints still match.
+
+        :rtype: list
+        """
+        key = 'partitions:' + urllib.parse.urlencode(sorted(dict(
+            q=query if query else 'all:1', by=partitioner.by).items()))
+        partitions = self.journal.get_checkpoint(key) if self.journal else None
+        if partitions is None:
+            partitions = yield from partitioner.partition(query)
+            if self.journal:
+                self.journal.set_checkpoint(key, partitions)
+        return partitions
+
+    @asyncio.coroutine
+    def search(self, query=None, params=None, callback=None, mine_ids=None, scrape=None,
+               partitioner=None):
+        """Mine Archive.org search results, or with ``mine_ids``, the
+        items they return.
+
+        With a ``partitioner`` (see :class:`iamine.partition.Partitioner`),
+        the search is split into sub-queries, which are scraped in
+        parallel, each with its own Scrape API cursor.
+
+        With a state store (see :class:`iamine.state.StateStore`) and
+        ``mine_ids``, mining is incremental: only items updated since
+        the last complete run of ``query`` are searched for, and of
+        those, only items that changed since they were last mined are
+        mined. A run is complete if none of its requests failed.
+        """
+        if not (self.state and mine_ids):
+            return (yield from self._search(query, params, callback, mine_ids, scrape,
+                                            partitioner))
+        query = 'all:1' if not query else query
+        started = time.time()
+        failed = self.stats.failed
+        since = self.state.since(query)
+        search_query = query if since is None else updated_query(query, since)
+        yield from self._search(search_query, params, callback, mine_ids, scrape, partitioner)
+        self._updated.clear()
+        if self.stats.failed == failed:
+            self.state.finish_run(query, started)
+        else:
+            self.state.sync()
 
-        yield from self.mine(search_requests)
+    @asyncio.coroutine
+    def _search(self, query=None, params=None, callback=None, mine_ids=None, scrape=None,
+                partitioner=None):
+        if partitioner:
+            partitions = yield from self.get_partitions(partitioner, query)
+            return (yield from self.scrape(query, params, callback, mine_ids, partitions))
+        if scrape:
+            return (yield from self.scrape(query, params, callback, mine_ids))
+        if mine_ids and self.ordered:
+            raise ValueError('Items returned by a search can not be mined in order.')
+        # The search is sized while the miner starts up.
+        search_info, = yield from self.startup(
+            self.fetch_search_info(self.get_search_params(query, params)))
+        search_requests = self.search_requests(query, params, callback, mine_ids, search_info)
+        if not mine_ids:
+            yield from self.mine(search_requests)
+        else:
+            item_tasks = max(1, self.max_tasks - self.search_tasks)
+            self.item_pool = self.worker_pool(self.iq, item_tasks)
+            balancer = asyncio.Task(self.balance_workers(), loop=self.loop)
+            yield from self.mine(search_requests, self.search_tasks)
+            # Every page has been handled, so every item has been queued.
+            yield from self.iq.join()
+            balancer.cancel()
+            self.item_pool.cancel()
         # Wait a bit for all connections to close.
         yield from asyncio.sleep(1)
 
-        if mine_ids:
-            for w in workers:
-                w.cancel()
-
 
 # metadata_requests() ____________________________________________________________________
 def metadata_requests(identifiers, params=None, callback=None, miner=None):
-    protocol = None if not miner else miner.protocol
-    hosts = None if not miner else miner.hosts
-    urls = metadata_urls(identifiers, protocol, hosts)
+    journal = None if not miner else miner.journal
+    template = miner.template
+
+    for identifier in identifiers:
+        identifier = identifier.strip()
+        if (not identifier) or (journal and identifier in journal):
+            continue
+        if miner.fields:
+            # Cached documents have to be whole, so that any fields can
+            # be extracted from them.
+            path = miner.fields.path(identifier, subpath=not miner.cache)
+        else:
+            path = '/metadata/{}'.format(identifier)
+        yield MineRequest(path, template, key=identifier, params=params, callback=callback,
+                          sink=miner.sink)
+
+
+# url_requests() _________________________________________________________________________
+def url_requests(urls, params=None, callback=None, miner=None):
+    journal = miner.journal
+    template = miner.url_template
 
     for url in urls:
-        yield MineRequest('GET', url, miner.access,
-                          callback=callback,
-                          max_retries=miner.max_retries,
-                          debug=miner.debug,
-                          params=params,
-                          connector=miner.connector)
+        url = url.strip()
+        if (not url) or (journal and url in journal):
+            continue
+        yield MineRequest(url, template, key=url, params=params, callback=callback,
+                          sink=miner.sink)
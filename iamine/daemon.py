@@ -0,0 +1,400 @@
+import os
+import time
+import asyncio
+import itertools
+from collections import OrderedDict
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from aiohttp import web
+
+from .core import SearchMiner, metadata_requests
+from .output import QueueSink
+
+
+class Job(object):
+    """A job submitted to a :class:`MiningDaemon`.
+
+    :param spec: The job, as submitted: ``{"identifiers": [...]}`` to
+                 mine items, or ``{"search": "<query>"}`` to mine search
+                 results, with optional ``params`` (Advancedsearch API
+                 parameters) and ``mine_ids`` to mine the items found
+                 instead. ``priority`` and ``weight`` set the job's
+                 priority and share of the workers, see
+                 :mod:`iamine.scheduler`.
+    :type spec: dict
+
+    :param on_end: (optional) A function called with the job once it is
+                   done or cancelled.
+    """
+
+    _ids = itertools.count(1)
+
+    def __init__(self, spec, loop=None, on_end=None):
+        if not isinstance(spec, dict):
+            raise ValueError('A job should be a JSON object.')
+        if ('identifiers' in spec) == ('search' in spec):
+            raise ValueError('A job should have either "identifiers" or "search".')
+        if ('identifiers' in spec) and not isinstance(spec['identifiers'], list):
+            raise ValueError('"identifiers" should be a list.')
+        if not isinstance(spec.get('params', {}), dict):
+            raise ValueError('"params" should be an object.')
+        for key in ('priority', 'weight'):
+            if (spec.get(key) is not None) and not isinstance(spec[key], (int, float)):
+                raise ValueError('"{}" should be a number.'.format(key))
+        if spec.get('weight') is not None and spec['weight'] <= 0:
+            raise ValueError('"weight" should be positive.')
+
+        self.id = next(Job._ids)
+        self.kind = 'items' if 'identifiers' in spec else 'search'
+        self.spec = spec
+        self.priority = spec.get('priority')
+        self.weight = spec.get('weight')
+        # Records wait here until they are streamed to the client.
+        self.sink = QueueSink(loop=loop)
+        self.created = time.time()
+        self.queued = 0
+        self.completed = 0
+        self.failed = 0
+        self.feeding = True
+        self.cancelled = False
+        self.error = None
+        self._on_end = on_end
+
+    @property
+    def pending(self):
+        return self.queued - self.completed - self.failed
+
+    @property
+    def state(self):
+        if self.cancelled:
+            return 'cancelled'
+        if self.error:
+            return 'failed'
+        return 'done' if self.sink.closed else 'running'
+
+    def finish(self, ok):
+        """Record that one of the job's requests is done."""
+        if ok:
+            self.completed += 1
+        else:
+            self.failed += 1
+        self._check_done()
+
+    def done_feeding(self):
+        self.feeding = False
+        self._check_done()
+
+    def _check_done(self):
+        if (not self.feeding) and (not self.pending) and (not self.sink.closed):
+            self.sink.close()
+            self._end()
+
+    def cancel(self):
+        self.cancelled = True
+        self.sink.discard()
+        self._end()
+
+    def _end(self):
+        on_end, self._on_end = self._on_end, None
+        if on_end:
+            on_end(self)
+
+    def as_dict(self):
+        j = dict(
+            id=self.id,
+            kind=self.kind,
+            state=self.state,
+            created=self.created,
+            queued=self.queued,
+            completed=self.completed,
+            failed=self.failed,
+            records=self.sink.records,
+        )
+        if self.kind == 'search':
+            j['search'] = self.spec['search']
+        if self.error:
+            j['error'] = self.error
+        return j
+
+
+class DaemonMiner(SearchMiner):
+    """A miner whose requests belong to daemon jobs."""
+
+    def _finish_request(self, request, ok):
+        super(DaemonMiner, self)._finish_request(request, ok)
+        if isinstance(request.job, Job):
+            request.job.finish(ok)
+
+    @asyncio.coroutine
+    def make_scheduled_request(self, request, queue):
+        job = request.job
+        # Requests of cancelled jobs are dropped, rather than made.
+        if isinstance(job, Job) and job.cancelled:
+            job.finish(False)
+            return
+        yield from super(DaemonMiner, self).make_scheduled_request(request, queue)
+
+
+class MiningDaemon(object):
+    """A long-running miner, mining the jobs submitted to it over a
+    Unix socket or a local HTTP port.
+
+    Every job shares the miner's connection pool, rate limiter and
+    workers, so the S3 keys are checked and the rate limit looked up
+    once, and concurrent jobs stay within the global rate limit
+    together. Jobs share workers fairly, by their ``weight``, and jobs
+    with a lower ``priority`` go first.
+
+    The API:
+
+    - ``POST /jobs`` with a JSON job (see :class:`Job`) mines it, and
+      streams its results back as JSONL as they complete. The job's id
+      is sent in the ``X-Job-Id`` header. Closing the connection
+      cancels the job.
+    - ``GET /jobs`` lists the running and recent jobs, and
+      ``GET /jobs/<id>`` describes one.
+    - ``DELETE /jobs/<id>`` cancels a job.
+    - ``GET /stats`` returns the miner's statistics as JSON, and
+      ``GET /metrics`` in the Prometheus text format.
+
+    For example::
+
+        $ ia-mine --daemon --socket /tmp/iamine.sock &
+        $ curl --unix-socket /tmp/iamine.sock http://localhost/jobs \\
+              -d '{"search": "collection:nasa", "mine_ids": true}'
+
+    :param path: (optional) The path of the Unix socket to listen on.
+    :type path: str
+
+    :param port: (optional) The port to listen on, on ``host``, if
+                 ``path`` isn't given.
+    :type port: int
+
+    :param host: (optional) Defaults to ``127.0.0.1``.
+    :type host: str
+
+    :param history: (optional) The number of finished jobs to keep in
+                    the list of jobs. Defaults to 100.
+    :type history: int
+
+    :param \*\*kwargs: (optional) Arguments that :class:`Miner` takes.
+    """
+
+    def __init__(self, path=None, port=None, host=None, history=None, **kwargs):
+        if (not path) and (not port):
+            raise ValueError('A socket path or a port is required.')
+        self.path = path
+        self.port = port
+        self.host = '127.0.0.1' if not host else host
+        self.history = 100 if not history else history
+        self.miner = DaemonMiner(**kwargs)
+        self.loop = self.miner.loop
+        self.jobs = OrderedDict()
+        self.server = None
+        self.handler = None
+        self._tasks = list()
+
+    @asyncio.coroutine
+    def start(self):
+        """Start the miner's workers, and start listening for jobs."""
+        miner = self.miner
+        yield from miner.startup()
+        miner.pool = miner.worker_pool(miner.q, miner.max_tasks)
+        self._tasks = yield from miner.start_background_tasks()
+
+        app = web.Application(loop=self.loop)
+        app.router.add_route('POST', '/jobs', self.post_job)
+        app.router.add_route('GET', '/jobs', self.get_jobs)
+        app.router.add_route('GET', r'/jobs/{id:\d+}', self.get_job)
+        app.router.add_route('DELETE', r'/jobs/{id:\d+}', self.delete_job)
+        app.router.add_route('GET', '/stats', self.get_stats)
+        app.router.add_route('GET', '/metrics', self.get_metrics)
+        self.handler = app.make_handler()
+        if self.path:
+            if os.path.exists(self.path):
+                os.unlink(self.path)
+            # Only the user running the daemon may submit jobs. The
+            # socket is created without access for anyone else, rather
+            # than restricted once it is already listening.
+            umask = os.umask(0o177)
+            try:
+                self.server = yield from self.loop.create_unix_server(self.handler, self.path)
+            finally:
+                os.umask(umask)
+            os.chmod(self.path, 0o600)
+        else:
+            self.server = yield from self.loop.create_server(self.handler, self.host,
+                                                             self.port)
+
+    @asyncio.coroutine
+    def stop(self):
+        """Stop listening, cancel every job and release the miner's
+        resources.
+        """
+        if self.server:
+            self.server.close()
+            yield from self.server.wait_closed()
+        for job in self.jobs.values():
+            if job.state == 'running':
+                job.cancel()
+        if self.handler:
+            yield from self.handler.finish_connections(1.0)
+        for task in self._tasks:
+            task.cancel()
+        if self.miner.pool:
+            self.miner.pool.cancel()
+        self.miner.shutdown()
+        if self.path and os.path.exists(self.path):
+            os.unlink(self.path)
+
+    def submit(self, spec):
+        """Submit a job, and start queueing its requests.
+
+        :param spec: See :class:`Job`.
+        :type spec: dict
+
+        :rtype: :class:`Job`
+        :raises: :class:`ValueError` if ``spec`` isn't a valid job.
+        """
+        job = Job(spec, loop=self.loop, on_end=self._job_ended)
+        self.jobs[job.id] = job
+        finished = [j for j in self.jobs.values() if j.state != 'running']
+        for old in finished[:max(0, len(finished) - self.history)]:
+            del self.jobs[old.id]
+        if job.weight:
+            self.miner.q.set_weight(job, job.weight)
+        asyncio.Task(self._feed(job), loop=self.loop)
+        return job
+
+    def _job_ended(self, job):
+        # Requests of the job may be queued until it is done, and keep
+        # its weight until then.
+        self.miner.q.weights.pop(job, None)
+
+    @asyncio.coroutine
+    def _queue(self, job, requests):
+        for req in requests:
+            if job.cancelled:
+                return
+            yield from job.sink.wait_for_room()
+            req.job = job
+            req.sink = job.sink
+            if job.priority is not None:
+                req.priority = job.priority
+            job.queued += 1
+            yield from self.miner.q.put(req)
+
+    @asyncio.coroutine
+    def _feed(self, job):
+        miner = self.miner
+        spec = job.spec
+        try:
+            if job.kind == 'items':
+                requests = metadata_requests(spec['identifiers'], {'dontcache': 1}, None, miner)
+                yield from self._queue(job, requests)
+            elif not spec.get('mine_ids'):
+                params = spec.get('params', {})
+                search_info = yield from miner.fetch_search_info(
+                    miner.get_search_params(spec['search'], params))
+                pages = miner.search_pages(spec['search'], params, search_info=search_info)
+                yield from self._queue(job, (miner.page_request(p) for p, _ in pages))
+            else:
+                yield from self._feed_search_results(job)
+        except Exception as exc:
+            job.error = repr(exc)
+        finally:
+            job.done_feeding()
+
+    @asyncio.coroutine
+    def _feed_search_results(self, job):
+        # Pages are fetched by the job itself, one at a time, and the
+        # items they return are queued for the workers.
+        miner = self.miner
+        params = dict((k, v) for k, v in job.spec.get('params', {}).items()
+                      if not k.startswith('fl'))
+        params['fl[]'] = 'identifier'
+        search_info = yield from miner.fetch_search_info(
+            miner.get_search_params(job.spec['search'], params))
+        for page_params, _ in miner.search_pages(job.spec['search'], params, True, search_info):
+            identifiers = list()
+
+            @asyncio.coroutine
+            def handle_page(resp):
+                j = yield from resp.json(encoding='utf-8')
+                del identifiers[:]
+                identifiers.extend(d['identifier'] for d in j.get('response', {}).get('docs', [])
+                                   if d.get('identifier'))
+
+            if job.cancelled:
+                return
+            ok = yield from miner.make_rate_limited_request(
+                miner.page_request(page_params, callback=handle_page))
+            if not ok:
+                raise RuntimeError('Failed to fetch a page of search results.')
+            yield from self._queue(job, metadata_requests(identifiers, {'dontcache': 1}, None,
+                                                          miner))
+
+    def _json_response(self, j, status=200):
+        return web.Response(body=json.dumps(j).encode('utf-8'),
+                            status=status,
+                            headers={'Content-Type': 'application/json'})
+
+    def _get_job(self, request):
+        return self.jobs.get(int(request.match_info['id']))
+
+    @asyncio.coroutine
+    def post_job(self, request):
+        try:
+            spec = yield from request.json()
+            job = self.submit(spec)
+        except ValueError as exc:
+            return self._json_response({'error': str(exc)}, status=400)
+
+        resp = web.StreamResponse(headers={'Content-Type': 'application/x-ndjson',
+                                           'X-Job-Id': str(job.id)})
+        try:
+            yield from resp.prepare(request)
+            while True:
+                data = yield from job.sink.read()
+                if data is None:
+                    break
+                resp.write(data)
+                yield from resp.drain()
+            yield from resp.write_eof()
+        finally:
+            # The client went away before the job was done.
+            if job.state == 'running':
+                job.cancel()
+        return resp
+
+    @asyncio.coroutine
+    def get_jobs(self, request):
+        return self._json_response([job.as_dict() for job in self.jobs.values()])
+
+    @asyncio.coroutine
+    def get_job(self, request):
+        job = self._get_job(request)
+        if not job:
+            return self._json_response({'error': 'No such job.'}, status=404)
+        return self._json_response(job.as_dict())
+
+    @asyncio.coroutine
+    def delete_job(self, request):
+        job = self._get_job(request)
+        if not job:
+            return self._json_response({'error': 'No such job.'}, status=404)
+        if job.state == 'running':
+            job.cancel()
+        return self._json_response(job.as_dict())
+
+    @asyncio.coroutine
+    def get_stats(self, request):
+        return self._json_response(self.miner.stats.snapshot())
+
+    @asyncio.coroutine
+    def get_metrics(self, request):
+        return web.Response(body=self.miner.stats.prometheus().encode('utf-8'),
+                            headers={'Content-Type': 'text/plain; version=0.0.4'})
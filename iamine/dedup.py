@@ -0,0 +1,135 @@
+import math
+import hashlib
+
+
+class BloomFilter(object):
+    """A Bloom filter of strings, in a fixed amount of memory.
+
+    :param capacity: The number of keys the filter is sized for. More
+                     can be added, at a higher false positive rate.
+    :type capacity: int
+
+    :param error_rate: The false positive rate at ``capacity`` keys.
+    :type error_rate: float
+    """
+
+    def __init__(self, capacity, error_rate):
+        size = int(-capacity * math.log(error_rate) / (math.log(2) ** 2))
+        self.size = max(64, size)
+        self.hashes = max(1, int(round(self.size / capacity * math.log(2))))
+        self.bits = bytearray((self.size + 7) // 8)
+        self.count = 0
+
+    def __len__(self):
+        return self.count
+
+    def _positions(self, key):
+        # Double hashing, with both hashes taken from a single digest.
+        digest = hashlib.md5(key.encode('utf-8')).digest()
+        h1 = int.from_bytes(digest[:8], 'little')
+        h2 = int.from_bytes(digest[8:], 'little') | 1
+        for i in range(self.hashes):
+            yield (h1 + i * h2) % self.size
+
+    def __contains__(self, key):
+        return all(self.bits[p >> 3] & (1 << (p & 7)) for p in self._positions(key))
+
+    def add(self, key):
+        """Add ``key`` to the filter.
+
+        :rtype: bool
+        :returns: ``True`` if ``key`` was (probably) already in it.
+        """
+        present = True
+        for p in self._positions(key):
+            byte, bit = p >> 3, 1 << (p & 7)
+            if not self.bits[byte] & bit:
+                present = False
+                self.bits[byte] |= bit
+        if not present:
+            self.count += 1
+        return present
+
+
+class Deduplicator(object):
+    """Drop identifiers that were already seen from an input stream.
+
+    Identifiers are kept in a set until there are ``exact_size`` of
+    them, and are then moved to a :class:`BloomFilter`, so memory stays
+    bounded however long the input is. Past that point, a small fraction
+    (``error_rate``) of unique identifiers are mistaken for duplicates
+    and dropped.
+
+    :param exact_size: (optional) The number of identifiers to keep in
+                       a set. Defaults to 1,000,000.
+    :type exact_size: int
+
+    :param capacity: (optional) The number of identifiers the Bloom
+                     filter is sized for. Defaults to 100,000,000.
+    :type capacity: int
+
+    :param error_rate: (optional) The false positive rate of the Bloom
+                       filter at ``capacity`` identifiers. Defaults to
+                       0.001, taking about 180MB at the default capacity.
+    :type error_rate: float
+
+    :param stats: (optional) The :class:`iamine.stats.Stats` to count
+                  duplicates in.
+    """
+
+    def __init__(self, exact_size=None, capacity=None, error_rate=None, stats=None):
+        exact_size = 1000000 if not exact_size else exact_size
+        capacity = 100000000 if not capacity else capacity
+        error_rate = 0.001 if not error_rate else error_rate
+
+        self.exact_size = exact_size
+        self.capacity = capacity
+        self.error_rate = error_rate
+        self.stats = stats
+        self.duplicates = 0
+        self._seen = set()
+        self._bloom = None
+
+    def __len__(self):
+        return len(self._bloom) if self._bloom is not None else len(self._seen)
+
+    def __bool__(self):
+        # An empty filter is still in use.
+        return True
+
+    def seen(self, identifier):
+        """Check whether ``identifier`` was seen before, and remember it.
+
+        :rtype: bool
+        """
+        if self._bloom is not None:
+            duplicate = self._bloom.add(identifier)
+        elif identifier in self._seen:
+            duplicate = True
+        else:
+            duplicate = False
+            self._seen.add(identifier)
+            if len(self._seen) >= self.exact_size:
+                self._bloom = BloomFilter(max(self.capacity, self.exact_size * 2),
+                                          self.error_rate)
+                for key in self._seen:
+                    self._bloom.add(key)
+                self._seen = set()
+        if duplicate:
+            self.duplicates += 1
+            if self.stats:
+                self.stats.duplicates += 1
+        return duplicate
+
+    def filter(self, identifiers):
+        """Drop duplicates from ``identifiers``, lazily.
+
+        :type identifiers: iterable
+
+        :returns: A generator yielding each identifier the first time it
+                  is seen, stripped of whitespace.
+        """
+        for identifier in identifiers:
+            identifier = identifier.strip()
+            if identifier and not self.seen(identifier):
+                yield identifier
@@ -1,3 +1,28 @@
 class AuthenticationError(Exception):
     """Exception raised when authentication failed for some reason."""
     pass
+
+
+class HTTPStatusError(Exception):
+    """Exception raised when a request returns an unsuccessful HTTP
+    status.
+
+    :param status: The HTTP status code.
+    :type status: int
+
+    :param retry_after: (optional) The number of seconds the server asked
+                        to wait before retrying.
+    :type retry_after: float
+    """
+
+    def __init__(self, status, retry_after=None):
+        super(HTTPStatusError, self).__init__('HTTP status {}'.format(status))
+        self.status = status
+        self.retry_after = retry_after
+
+
+class WorkerError(Exception):
+    """Exception raised when a worker process of a sharded miner
+    failed.
+    """
+    pass
@@ -0,0 +1,316 @@
+import re
+import asyncio
+try:
+    import ujson as json
+except ImportError:
+    import json
+try:
+    import ijson
+    from ijson.common import ObjectBuilder
+except ImportError:
+    ijson = None
+
+
+def _ijson_usable():
+    # Push parsing, and decoding numbers to floats rather than Decimals,
+    # need ijson 3.1 or later.
+    try:
+        events = ijson.sendable_list()
+        parser = ijson.parse_coro(events, use_float=True)
+        parser.send(b'[1.5]')
+        parser.close()
+        return isinstance(events[1][2], float)
+    except Exception:
+        return False
+
+
+if ijson and not _ijson_usable():
+    ijson = None
+
+
+# Dates as the Advancedsearch API returns them.
+SEARCH_DATE = re.compile(r'^(\d{4}-\d{2}-\d{2})T(\d{2}:\d{2}:\d{2})Z$')
+
+
+def normalize_search_value(value):
+    """Convert a value returned by the Advancedsearch API to the shape
+    the Metadata API returns it in: single values of multi-valued fields
+    aren't wrapped in a list, values are strings, and dates are written
+    as ``YYYY-MM-DD HH:MM:SS``.
+
+    Search normalizes free-form dates, such as the ``date`` field, to
+    full timestamps, which can't be undone.
+    """
+    if isinstance(value, list):
+        values = [normalize_search_value(v) for v in value]
+        return values[0] if len(values) == 1 else values
+    if isinstance(value, bool):
+        return 'true' if value else 'false'
+    if isinstance(value, (int, float)):
+        return str(value)
+    if isinstance(value, str):
+        m = SEARCH_DATE.match(value)
+        if m:
+            return '{} {}'.format(*m.groups())
+    return value
+
+
+def parse_field(field):
+    """Parse a field path, such as ``metadata.collection`` or
+    ``files[].md5``. A ``[]`` after a key selects every element of the
+    list at that key.
+
+    :type field: str
+
+    :rtype: list
+    :returns: A list of ``(key, is_list)`` tuples.
+    """
+    segments = list()
+    for key in field.strip().split('.'):
+        is_list = key.endswith('[]')
+        key = key[:-2] if is_list else key
+        if not key:
+            raise ValueError('Invalid field "{}".'.format(field))
+        segments.append((key, is_list))
+    return segments
+
+
+def _walk(value, segments):
+    if not segments:
+        yield value
+        return
+    (key, is_list), rest = segments[0], segments[1:]
+    if not isinstance(value, dict) or (key not in value):
+        return
+    value = value[key]
+    if is_list:
+        for v in (value if isinstance(value, list) else []):
+            for match in _walk(v, rest):
+                yield match
+    else:
+        for match in _walk(value, rest):
+            yield match
+
+
+class Field(object):
+    """A field to extract from item metadata.
+
+    Fields that select list elements (``files[].md5``) are extracted as
+    a flat list of every match, and other fields as their value, or
+    ``None`` if they are missing.
+
+    :param field: The path of the field, see :func:`parse_field`.
+    :type field: str
+    """
+
+    def __init__(self, field):
+        self.name = field.strip()
+        self.segments = parse_field(field)
+        self.is_list = any(is_list for _, is_list in self.segments)
+        # The prefix ijson reports for the field's values.
+        prefix = list()
+        for key, is_list in self.segments:
+            prefix.append(key)
+            if is_list:
+                prefix.append('item')
+        self.prefix = '.'.join(prefix)
+
+    def project(self, doc):
+        """Extract the field from the decoded document ``doc``."""
+        matches = _walk(doc, self.segments)
+        if self.is_list:
+            return list(matches)
+        return next(matches, None)
+
+
+class FieldExtractor(object):
+    """Extract fields from a JSON document fed to it in chunks.
+
+    With ijson 3.1 or later installed (``pip install iamine[stream]``),
+    chunks are parsed as they arrive, and only the values of the
+    requested fields are built, so the document is never held in memory
+    as a whole. Without it, the chunks are joined and decoded once the
+    document is complete.
+
+    :param fields: The fields to extract.
+    :type fields: list of :class:`Field`
+    """
+
+    def __init__(self, fields):
+        self.fields = fields
+        self.result = dict((f.name, [] if f.is_list else None) for f in fields)
+        self._chunks = list()
+        self._parser = None
+        if ijson:
+            self._prefixes = dict()
+            for f in fields:
+                self._prefixes.setdefault(f.prefix, []).append(f)
+            self._events = ijson.sendable_list()
+            self._parser = ijson.parse_coro(self._events, use_float=True)
+            self._building = list()
+            self._found = set()
+            self._fed = False
+
+    def feed(self, chunk):
+        """Parse the next chunk of the document.
+
+        :type chunk: bytes
+        """
+        if not self._parser:
+            self._chunks.append(chunk)
+            return
+        self._fed = self._fed or bool(chunk.strip())
+        self._parser.send(chunk)
+        self._handle_events()
+
+    def _handle_events(self):
+        for prefix, event, value in self._events:
+            # Values being built are nested containers of a field.
+            if self._building:
+                for builder in self._building:
+                    builder[1].event(event, value)
+                    builder[2] += {'start_map': 1, 'start_array': 1,
+                                   'end_map': -1, 'end_array': -1}.get(event, 0)
+                done = [b for b in self._building if b[2] == 0]
+                for fields, builder, _ in done:
+                    self._set(fields, builder.value)
+                self._building = [b for b in self._building if b[2] != 0]
+            fields = self._prefixes.get(prefix)
+            if not fields or event in ('map_key', 'end_map', 'end_array'):
+                continue
+            if event in ('start_map', 'start_array'):
+                builder = ObjectBuilder()
+                builder.event(event, value)
+                self._building.append([fields, builder, 1])
+            else:
+                self._set(fields, value)
+        del self._events[:]
+
+    def _set(self, fields, value):
+        for f in fields:
+            if f.is_list:
+                self.result[f.name].append(value)
+            elif f.name not in self._found:
+                self._found.add(f.name)
+                self.result[f.name] = value
+
+    def close(self):
+        """Finish parsing the document.
+
+        :rtype: dict
+        :returns: The value of each field, by field name.
+        """
+        if self._parser:
+            # An empty body is treated as an empty document.
+            if self._fed:
+                self._parser.close()
+            return self.result
+        body = b''.join(self._chunks)
+        doc = json.loads(body.decode('utf-8')) if body.strip() else {}
+        for f in self.fields:
+            self.result[f.name] = f.project(doc)
+        return self.result
+
+
+class FieldSet(object):
+    """The fields to extract from each item's metadata.
+
+    A single field that doesn't select list elements is fetched with
+    the Metadata API's subpath endpoint, e.g.
+    ``/metadata/<identifier>/metadata/collection``, so that only its
+    value is sent. Otherwise, whole documents are fetched and the fields
+    are extracted as they stream in, see :class:`FieldExtractor`.
+
+    :param fields: The field paths, see :func:`parse_field`.
+    :type fields: list
+    """
+
+    def __init__(self, fields):
+        if isinstance(fields, str):
+            fields = fields.split(',')
+        self.fields = [Field(f) for f in fields if f.strip()]
+        if not self.fields:
+            raise ValueError('No fields given.')
+        self.subpath = None
+        if (len(self.fields) == 1) and (not self.fields[0].is_list):
+            self.subpath = '/'.join(key for key, _ in self.fields[0].segments)
+        # Top-level metadata fields can also be returned by the
+        # Advancedsearch API, so items can be looked up in batches.
+        self.search_fields = list()
+        for f in self.fields:
+            if (len(f.segments) != 2) or f.is_list or (f.segments[0][0] != 'metadata'):
+                self.search_fields = None
+                break
+            self.search_fields.append(f.segments[1][0])
+
+    @property
+    def searchable(self):
+        """``True`` if every field can be returned by the Advancedsearch
+        API.
+        """
+        return self.search_fields is not None
+
+    def path(self, identifier, subpath=True):
+        """Get the Metadata API path to request for ``identifier``.
+
+        :param subpath: (optional) Set to ``False`` to always request the
+                        whole document.
+        :type subpath: bool
+
+        :rtype: str
+        """
+        if subpath and self.subpath:
+            return '/metadata/{}/{}'.format(identifier, self.subpath)
+        return '/metadata/{}'.format(identifier)
+
+    def from_search(self, doc):
+        """Make a record from the search result ``doc``, which was
+        returned with :attr:`FieldSet.search_fields`, with its values
+        in the shape the Metadata API returns them in, see
+        :func:`normalize_search_value`.
+
+        :rtype: dict
+        """
+        record = dict(identifier=doc.get('identifier'))
+        for f, key in zip(self.fields, self.search_fields):
+            record[f.name] = normalize_search_value(doc.get(key))
+        return record
+
+    @asyncio.coroutine
+    def extract(self, resp, identifier, subpath=True, stream=True):
+        """Read ``resp`` and extract the fields from it.
+
+        :param subpath: (optional) Whether ``resp`` is the response to a
+                        subpath request.
+        :type subpath: bool
+
+        :param stream: (optional) Set to ``False`` if the body of
+                       ``resp`` has already been read.
+        :type stream: bool
+
+        :rtype: tuple
+        :returns: The record, a dict with the item's identifier and each
+                  field, and the number of bytes read.
+        """
+        record = dict(identifier=identifier)
+        if subpath and self.subpath:
+            body = yield from resp.read()
+            j = json.loads(body.decode('utf-8')) if body.strip() else {}
+            record[self.fields[0].name] = j.get('result')
+            return record, len(body)
+
+        extractor = FieldExtractor(self.fields)
+        size = 0
+        if stream and hasattr(resp, 'content'):
+            while True:
+                chunk = yield from resp.content.read(2 ** 16)
+                if not chunk:
+                    break
+                size += len(chunk)
+                extractor.feed(chunk)
+        else:
+            body = yield from resp.read()
+            size = len(body)
+            extractor.feed(body)
+        record.update(extractor.close())
+        return record, size
@@ -0,0 +1,140 @@
+import time
+import random
+
+
+class HostStats(object):
+    """Health statistics for a single host."""
+
+    def __init__(self, host):
+        self.host = host
+        self.latency = None
+        self.outstanding = 0
+        self.requests = 0
+        self.errors = 0
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    @property
+    def ejected(self):
+        return self.ejected_until > time.monotonic()
+
+    def cost(self):
+        # Hosts without a latency yet are tried first, so that every
+        # host gets measured.
+        latency = self.latency if self.latency is not None else 0.0
+        return (self.outstanding + 1) * latency
+
+    def as_dict(self):
+        return dict(
+            host=self.host,
+            latency=self.latency,
+            outstanding=self.outstanding,
+            requests=self.requests,
+            errors=self.errors,
+            ejected=self.ejected,
+        )
+
+
+class HostPool(object):
+    """Route requests across a set of hosts by health.
+
+    Each request goes to the better of two randomly chosen hosts, where
+    a host is better if its latency, weighted by its number of
+    outstanding requests, is lower. A host that fails ``eject_after``
+    requests in a row is ejected for ``eject_time`` seconds, doubling
+    each time it is ejected again, up to ``max_eject_time``.
+
+    :param hosts: (optional) The hosts to route requests to. Defaults to
+                  ``["archive.org"]``.
+    :type hosts: iterable
+
+    :param protocol: (optional) The HTTP protocol to use. "https://" is
+                     used by default.
+    :type protocol: str
+
+    :param eject_after: (optional) Defaults to 3.
+    :type eject_after: int
+
+    :param eject_time: (optional) Defaults to 10 seconds.
+    :type eject_time: float
+
+    :param max_eject_time: (optional) Defaults to 300 seconds.
+    :type max_eject_time: float
+    """
+
+    def __init__(self, hosts=None, protocol=None,
+                 eject_after=None,
+                 eject_time=None,
+                 max_eject_time=None):
+        hosts = ['archive.org'] if not hosts else hosts
+        self.protocol = 'https://' if not protocol else protocol
+        self.eject_after = 3 if not eject_after else eject_after
+        self.eject_time = 10.0 if not eject_time else eject_time
+        self.max_eject_time = 300.0 if not max_eject_time else max_eject_time
+        self.hosts = dict((h, HostStats(h)) for h in hosts)
+        self._names = list(self.hosts)
+
+    def __len__(self):
+        return len(self._names)
+
+    def pick(self):
+        """Choose a host for the next request.
+
+        :rtype: str
+        """
+        if len(self._names) == 1:
+            return self._names[0]
+        healthy = [self.hosts[h] for h in self._names if not self.hosts[h].ejected]
+        if not healthy:
+            # Every host is ejected, use the one that will be back first.
+            return min(self.hosts.values(), key=lambda s: s.ejected_until).host
+        if len(healthy) == 1:
+            return healthy[0].host
+        a, b = random.sample(healthy, 2)
+        return a.host if a.cost() <= b.cost() else b.host
+
+    def url(self, path, host=None):
+        """Make an URL for ``path`` on ``host``, or on a host chosen
+        with :meth:`pick`.
+
+        :rtype: str
+        """
+        host = self.pick() if not host else host
+        return self.protocol + host + path.strip()
+
+    def start(self, host):
+        """Record that a request to ``host`` has started."""
+        stats = self.hosts.get(host)
+        if stats:
+            stats.outstanding += 1
+
+    def finish(self, host, latency, ok):
+        """Record the outcome of a request to ``host``.
+
+        :param latency: The number of seconds the request took.
+        :type latency: float
+
+        :param ok: ``False`` if the request failed because of the host.
+        :type ok: bool
+        """
+        stats = self.hosts.get(host)
+        if not stats:
+            return
+        stats.outstanding -= 1
+        stats.requests += 1
+        if stats.latency is None:
+            stats.latency = latency
+        else:
+            stats.latency = (.7 * stats.latency) + (.3 * latency)
+        if ok:
+            stats.failures = 0
+            stats.ejections = 0
+            return
+        stats.errors += 1
+        stats.failures += 1
+        if (stats.failures >= self.eject_after) and (len(self._names) > 1):
+            eject_time = min(self.max_eject_time, self.eject_time * (2 ** stats.ejections))
+            stats.ejected_until = time.monotonic() + eject_time
+            stats.ejections += 1
+            stats.failures = 0
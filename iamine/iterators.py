@@ -0,0 +1,141 @@
+import asyncio
+from collections import deque
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+from .output import QueueSink, OrderedSink
+
+
+class ResultIterator(object):
+    """An asynchronous iterator over the results of a miner, as they
+    complete.
+
+    Mining starts on the first call to :meth:`ResultIterator.next`. The
+    miner's records go to a :class:`iamine.output.QueueSink` rather than
+    to its own sink, so only one iterator can run on a miner at a time.
+    Results of an ordered miner are returned in order.
+    Results that haven't been consumed are buffered, up to
+    ``max_backlog`` bytes, after which mining is held back until the
+    consumer catches up.
+
+    On Python 3.5 and later::
+
+        async for item in miner.iter_items(identifiers):
+            ...
+
+    and on Python 3.4::
+
+        results = miner.iter_items(identifiers)
+        while True:
+            item = yield from results.next()
+            if item is None:
+                break
+
+    If the consumer stops early, :meth:`ResultIterator.close` stops
+    mining.
+
+    :param miner: The miner.
+    :type miner: :class:`iamine.core.Miner`
+
+    :param mine: A function taking no arguments, and returning the
+                 coroutine that mines the results.
+
+    :param docs: (optional) A function splitting each record into
+                 results, e.g. a page of search results into its
+                 documents. Records are results by default.
+
+    :param max_backlog: (optional) The number of bytes of results to
+                        buffer. Defaults to 4 MiB.
+    :type max_backlog: int
+
+    :param shutdown: (optional) Shut the miner down once its results
+                     have been consumed.
+    :type shutdown: bool
+    """
+
+    def __init__(self, miner, mine, docs=None, max_backlog=None, shutdown=None):
+        self.miner = miner
+        self.sink = QueueSink(max_backlog, loop=miner.loop)
+        self.shutdown = True if shutdown else False
+        self._mine = mine
+        self._docs = docs
+        self._results = deque()
+        self._task = None
+        self._sink = None
+
+    def _start(self):
+        miner = self.miner
+        if isinstance(getattr(miner.sink, 'sink', miner.sink), QueueSink):
+            raise RuntimeError('An iterator is already running on this miner.')
+        sink = self.sink
+        if getattr(miner, 'ordered', False):
+            sink = OrderedSink(sink, start=miner._seq, window=miner.window, loop=miner.loop)
+        self._sink, miner.sink = miner.sink, sink
+        self._task = asyncio.Task(self._run(), loop=self.miner.loop)
+
+    @asyncio.coroutine
+    def _run(self):
+        try:
+            yield from self._mine()
+        finally:
+            self.miner.sink = self._sink
+            self.sink.close()
+
+    @asyncio.coroutine
+    def next(self):
+        """Get the next result.
+
+        :rtype: dict
+        :returns: The next result, or ``None`` once every result has
+                  been returned.
+        :raises: The exception mining failed with, if it did.
+        """
+        if not self._task:
+            self._start()
+        while not self._results:
+            data = yield from self.sink.read()
+            if data is None:
+                # Raise the exception mining failed with, if any.
+                yield from self._task
+                if self.shutdown:
+                    self.shutdown = False
+                    self.miner.shutdown()
+                return None
+            for line in data.splitlines():
+                if not line.strip():
+                    continue
+                record = json.loads(line.decode('utf-8'))
+                self._results.extend(self._docs(record) if self._docs else [record])
+        return self._results.popleft()
+
+    def close(self):
+        """Stop mining, and drop the results that haven't been
+        consumed.
+        """
+        if self._task and not self._task.done():
+            self._task.cancel()
+        self.sink.discard()
+        self._results.clear()
+
+    def __aiter__(self):
+        return self
+
+    @asyncio.coroutine
+    def __anext__(self):
+        result = yield from self.next()
+        if result is None:
+            raise StopAsyncIteration
+        return result
+
+
+def search_docs(page):
+    """Get the documents of a page of Advancedsearch or Scrape API
+    results.
+
+    :type page: dict
+
+    :rtype: list
+    """
+    return page.get('items') or page.get('response', {}).get('docs', [])
@@ -0,0 +1,183 @@
+import os
+import time
+import json
+import struct
+import hashlib
+from array import array
+from bisect import bisect_left
+from heapq import merge
+
+
+_HEADER = struct.Struct('<8sQ')
+_MAGIC = b'IAMINE1\n'
+
+
+def _hash(key):
+    """Hash a journal key to an unsigned 64-bit integer."""
+    return int.from_bytes(hashlib.md5(key.encode('utf-8')).digest()[:8], 'little')
+
+
+class Journal(object):
+    """An append-only journal of completed work, used to resume mining.
+
+    Keys (identifiers, search pages, ...) are appended to ``path`` one
+    per line as they complete, and the file is fsynced in batches. On
+    open, previously recorded keys are loaded into a compact index: a
+    sorted array of 64-bit hashes kept in ``<path>.idx``, so that
+    membership checks for tens of millions of keys stay fast and take
+    eight bytes per key. Only the part of the journal written after the
+    index was last saved has to be re-read.
+
+    :param path: The path to the journal file. It is created if it
+                 doesn't exist.
+    :type path: str
+
+    :param sync_every: (optional) The number of records to buffer
+                       before fsyncing. Defaults to 1000.
+    :type sync_every: int
+
+    :param sync_interval: (optional) The maximum number of seconds
+                          between fsyncs. Defaults to 5.
+    :type sync_interval: float
+    """
+
+    def __init__(self, path, sync_every=None, sync_interval=None):
+        sync_every = 1000 if not sync_every else sync_every
+        sync_interval = 5 if not sync_interval else sync_interval
+
+        self.path = path
+        self.index_path = '{}.idx'.format(path)
+        self.checkpoint_path = '{}.ckpt'.format(path)
+        self.sync_every = sync_every
+        self.sync_interval = sync_interval
+
+        self._index = array('Q')
+        self._recent = set()
+        self._checkpoints = dict()
+        self._load()
+
+        self._fh = open(self.path, 'ab')
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def __len__(self):
+        return len(self._index) + len(self._recent)
+
+    def __bool__(self):
+        # An empty journal is still in use.
+        return True
+
+    def __contains__(self, key):
+        h = _hash(key)
+        if h in self._recent:
+            return True
+        i = bisect_left(self._index, h)
+        return (i != len(self._index)) and (self._index[i] == h)
+
+    def _load(self):
+        if os.path.isfile(self.checkpoint_path):
+            with open(self.checkpoint_path) as fh:
+                self._checkpoints = json.load(fh)
+
+        offset = 0
+        if os.path.isfile(self.index_path):
+            with open(self.index_path, 'rb') as fh:
+                header = fh.read(_HEADER.size)
+                if len(header) == _HEADER.size:
+                    magic, offset = _HEADER.unpack(header)
+                    if magic == _MAGIC:
+                        self._index.frombytes(fh.read())
+                    else:
+                        offset = 0
+        if not os.path.isfile(self.path):
+            return
+        # The journal may have been truncated or replaced since the index
+        # was written, in which case the index is rebuilt.
+        if offset > os.path.getsize(self.path):
+            self._index = array('Q')
+            offset = 0
+        with open(self.path, 'rb+') as fh:
+            fh.seek(offset)
+            for line in fh:
+                # A partial last line means the process died mid-write,
+                # drop it so that new records start on a fresh line.
+                if not line.endswith(b'\n'):
+                    fh.truncate(offset)
+                    break
+                offset += len(line)
+                key = line.decode('utf-8').strip()
+                if key:
+                    self._recent.add(_hash(key))
+
+    def record(self, key):
+        """Record ``key`` as completed.
+
+        :type key: str
+        """
+        self._fh.write('{}\n'.format(key).encode('utf-8'))
+        self._recent.add(_hash(key))
+        self._pending += 1
+        if (self._pending >= self.sync_every) \
+                or (time.monotonic() - self._last_sync >= self.sync_interval):
+            self.sync()
+        # Keep the in-memory set of recent keys small, hashes are much
+        # cheaper to hold in the sorted index.
+        if len(self._recent) >= 1000000:
+            self.compact()
+
+    def get_checkpoint(self, name):
+        """Get the value last saved with :meth:`set_checkpoint`.
+
+        :type name: str
+
+        :returns: The saved value, or ``None``.
+        """
+        return self._checkpoints.get(name)
+
+    def set_checkpoint(self, name, value):
+        """Save a position to resume sequential work from, such as a
+        search cursor. Unlike keys, only the latest value is kept.
+
+        :type name: str
+
+        :param value: A JSON serializable value, or ``None`` to clear the
+                      checkpoint.
+        """
+        if value is None:
+            self._checkpoints.pop(name, None)
+        else:
+            self._checkpoints[name] = value
+        tmp_path = '{}.tmp'.format(self.checkpoint_path)
+        with open(tmp_path, 'w') as fh:
+            json.dump(self._checkpoints, fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.checkpoint_path)
+
+    def sync(self):
+        """Flush buffered records and fsync the journal."""
+        self._fh.flush()
+        os.fsync(self._fh.fileno())
+        self._pending = 0
+        self._last_sync = time.monotonic()
+
+    def compact(self):
+        """Merge recently recorded keys into the on-disk index."""
+        self.sync()
+        if self._recent:
+            merged = array('Q', merge(self._index, sorted(self._recent)))
+            self._index = merged
+            self._recent = set()
+        tmp_path = '{}.tmp'.format(self.index_path)
+        with open(tmp_path, 'wb') as fh:
+            fh.write(_HEADER.pack(_MAGIC, self._fh.tell()))
+            self._index.tofile(fh)
+            fh.flush()
+            os.fsync(fh.fileno())
+        os.replace(tmp_path, self.index_path)
+
+    def close(self):
+        if self._fh.closed:
+            return
+        self.compact()
+        self._fh.close()
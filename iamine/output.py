@@ -0,0 +1,371 @@
+import os
+import sys
+import gzip
+import asyncio
+from collections import deque
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+
+def to_line(body):
+    """Make a JSON document safe to write as a single JSONL line.
+
+    Newlines can only appear as whitespace in valid JSON, and some
+    responses from the Metadata API contain them, so they are replaced
+    with spaces instead of decoding and re-encoding the document.
+
+    :type body: bytes
+
+    :rtype: bytes
+    """
+    body = body.strip()
+    if (b'\n' in body) or (b'\r' in body):
+        body = body.replace(b'\r', b' ').replace(b'\n', b' ')
+    return body
+
+
+def compress_stream(fh, compression=None):
+    """Wrap the binary file object ``fh`` to compress what is written
+    to it.
+
+    :param compression: (optional) ``"gzip"``, ``"zstd"``, or ``None``
+                        for no compression.
+    :type compression: str
+    """
+    if not compression:
+        return fh
+    if compression == 'gzip':
+        return gzip.GzipFile(fileobj=fh, mode='wb', compresslevel=6)
+    if compression == 'zstd':
+        if not zstandard:
+            raise ValueError('zstd compression requires the "zstandard" package.')
+        return zstandard.ZstdCompressor().stream_writer(fh)
+    raise ValueError('Unsupported compression "{}", use "gzip" or "zstd".'.format(compression))
+
+
+class OutputSink(object):
+    """A buffered writer of JSONL records.
+
+    Records are raw response bodies, which are passed through without
+    being decoded and re-serialized, and are written in batches of at
+    least ``buffer_size`` bytes.
+
+    :param buffer_size: (optional) The number of bytes to buffer before
+                        writing. Defaults to 1 MiB.
+    :type buffer_size: int
+    """
+
+    def __init__(self, buffer_size=None):
+        self.buffer_size = 2 ** 20 if not buffer_size else buffer_size
+        self.records = 0
+        self.bytes_written = 0
+        self._buffer = list()
+        self._buffered = 0
+
+    def write(self, body, seq=None):
+        """Write ``body`` as a single line.
+
+        :type body: bytes
+
+        :param seq: (optional) The sequence number of the request
+                    ``body`` is the response to. It is ignored unless
+                    the sink keeps records in order.
+        :type seq: int
+        """
+        line = to_line(body) + b'\n'
+        self._buffer.append(line)
+        self._buffered += len(line)
+        self.records += 1
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def finish(self, seq):
+        """Record that the request numbered ``seq`` is done, whether or
+        not it wrote anything.
+        """
+        pass
+
+    @asyncio.coroutine
+    def wait_for_room(self, seq=None):
+        """Wait until the sink can take more records. Miners wait for
+        room before queueing each request, so that sinks handing records
+        to a slower consumer can hold mining back.
+
+        :param seq: (optional) The sequence number of the request about
+                    to be queued.
+        :type seq: int
+        """
+        pass
+
+    def flush(self):
+        if not self._buffer:
+            return
+        data = b''.join(self._buffer)
+        self._buffer = list()
+        self._buffered = 0
+        self._write(data)
+        self.bytes_written += len(data)
+
+    def _write(self, data):
+        raise NotImplementedError
+
+    def close(self):
+        self.flush()
+
+
+class StreamSink(OutputSink):
+    """Write records to a binary stream, stdout by default.
+
+    :param stream: (optional) A binary file object.
+
+    :param compression: (optional) ``"gzip"`` or ``"zstd"``.
+    :type compression: str
+    """
+
+    def __init__(self, stream=None, compression=None, buffer_size=None):
+        super(StreamSink, self).__init__(buffer_size)
+        self.stream = sys.stdout.buffer if not stream else stream
+        self._fh = compress_stream(self.stream, compression)
+
+    def _write(self, data):
+        self._fh.write(data)
+        self._fh.flush()
+
+    def close(self):
+        self.flush()
+        # Finish the compressed stream, but leave the stream itself open.
+        if self._fh is not self.stream:
+            self._fh.close()
+            self.stream.flush()
+
+
+class FileSink(OutputSink):
+    """Write records to a file, optionally compressed and rotated.
+
+    :param path: The file to write to. When rotating, files are numbered
+                 by formatting ``path`` with the file number if it
+                 contains ``{}``, and by adding the number before its
+                 extension otherwise, e.g. ``out.00000.jsonl.gz``.
+    :type path: str
+
+    :param compression: (optional) ``"gzip"`` or ``"zstd"``.
+    :type compression: str
+
+    :param rotate_size: (optional) Start a new file after this many
+                        (uncompressed) bytes have been written.
+    :type rotate_size: int
+    """
+
+    def __init__(self, path, compression=None, rotate_size=None, buffer_size=None):
+        super(FileSink, self).__init__(buffer_size)
+        self.path = path
+        self.compression = compression
+        self.rotate_size = rotate_size
+        self.files = list()
+        self._fh = None
+        self._raw = None
+        self._file_size = 0
+
+    def _path(self, n):
+        if not self.rotate_size:
+            return self.path
+        if '{}' in self.path:
+            return self.path.format(n)
+        dirname, basename = os.path.split(self.path)
+        root, dot, ext = basename.partition('.')
+        return os.path.join(dirname, '{}.{:05d}{}{}'.format(root, n, dot, ext))
+
+    def _open(self):
+        path = self._path(len(self.files))
+        self._raw = open(path, 'wb')
+        self._fh = compress_stream(self._raw, self.compression)
+        self._file_size = 0
+        self.files.append(path)
+
+    def _close_file(self):
+        if self._fh is not self._raw:
+            self._fh.close()
+        self._raw.close()
+        self._fh = None
+
+    def _write(self, data):
+        if not self._fh:
+            self._open()
+        self._fh.write(data)
+        self._file_size += len(data)
+        if self.rotate_size and (self._file_size >= self.rotate_size):
+            self._close_file()
+
+    def close(self):
+        self.flush()
+        if self._fh:
+            self._close_file()
+
+
+class QueueSink(OutputSink):
+    """Hand records to a consumer on the event loop as they are
+    written, e.g. a client of :class:`iamine.daemon.MiningDaemon`, or an
+    :class:`iamine.iterators.ResultIterator`.
+
+    Records are handed over as soon as the consumer is ready for them,
+    and batched while it is busy. Once ``max_backlog`` bytes are waiting
+    for it, :meth:`QueueSink.wait_for_room` blocks until it catches up.
+
+    :param max_backlog: (optional) Defaults to 4 MiB.
+    :type max_backlog: int
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self, max_backlog=None, loop=None):
+        super(QueueSink, self).__init__(2 ** 16)
+        self.max_backlog = 2 ** 22 if not max_backlog else max_backlog
+        self.closed = False
+        self.backlog = 0
+        self._chunks = deque()
+        self._ready = asyncio.Event(loop=loop)
+        self._room = asyncio.Event(loop=loop)
+        self._room.set()
+
+    def write(self, body, seq=None):
+        if self.closed:
+            return
+        super(QueueSink, self).write(body, seq)
+        self._ready.set()
+
+    def _write(self, data):
+        self._chunks.append(data)
+        self.backlog += len(data)
+        if self.backlog >= self.max_backlog:
+            self._room.clear()
+
+    @asyncio.coroutine
+    def wait_for_room(self, seq=None):
+        if self._buffered + self.backlog >= self.max_backlog:
+            self.flush()
+        yield from self._room.wait()
+
+    @asyncio.coroutine
+    def read(self):
+        """Get the next chunk of records, as JSONL.
+
+        :rtype: bytes
+        :returns: The chunk, or ``None`` once the sink is closed and
+                  every record has been read.
+        """
+        while True:
+            if not self._chunks:
+                self.flush()
+            if self._chunks:
+                data = self._chunks.popleft()
+                self.backlog -= len(data)
+                if self.backlog < self.max_backlog:
+                    self._room.set()
+                return data
+            if self.closed:
+                return None
+            self._ready.clear()
+            yield from self._ready.wait()
+
+    def close(self):
+        self.closed = True
+        self._ready.set()
+
+    def discard(self):
+        """Close the sink, dropping the records that haven't been read,
+        and any written from now on.
+        """
+        self.close()
+        self._buffer = list()
+        self._buffered = 0
+        self._chunks.clear()
+        self.backlog = 0
+        self._room.set()
+
+
+class OrderedSink(object):
+    """Write records to ``sink`` in the order of their sequence
+    numbers, rather than in the order they complete.
+
+    Records of the request numbered ``seq`` are written once every
+    request before it has finished, and are held until then. With a
+    ``window``, only requests numbered less than ``window`` past the
+    first unfinished one are let in, see :meth:`OrderedSink.wait_for_room`,
+    so no more than ``window`` requests' records are ever held.
+
+    :param sink: The sink to write to.
+    :type sink: :class:`OutputSink`
+
+    :param start: (optional) The first sequence number. Defaults to 0.
+    :type start: int
+
+    :param window: (optional) The size of the reorder window. Unbounded
+                   by default.
+    :type window: int
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self, sink, start=None, window=None, loop=None):
+        self.sink = sink
+        self.next_seq = 0 if not start else start
+        self.window = window
+        self._pending = dict()
+        self._finished = set()
+        self._advanced = asyncio.Event(loop=loop) if window else None
+
+    @property
+    def records(self):
+        return self.sink.records
+
+    @property
+    def held(self):
+        """The number of requests whose records are being held."""
+        return len(self._pending)
+
+    def write(self, body, seq=None):
+        if (seq is None) or (seq == self.next_seq):
+            self.sink.write(body)
+        else:
+            self._pending.setdefault(seq, []).append(body)
+
+    def finish(self, seq):
+        self._finished.add(seq)
+        start = self.next_seq
+        while self.next_seq in self._finished:
+            self._finished.remove(self.next_seq)
+            self.next_seq += 1
+            for body in self._pending.pop(self.next_seq, ()):
+                self.sink.write(body)
+        if self._advanced and (self.next_seq != start):
+            self._advanced.set()
+
+    @asyncio.coroutine
+    def wait_for_room(self, seq=None):
+        """Wait until the request numbered ``seq`` is within the
+        reorder window, and the wrapped sink has room.
+        """
+        if self.window and (seq is not None):
+            while seq >= self.next_seq + self.window:
+                self._advanced.clear()
+                yield from self._advanced.wait()
+        yield from self.sink.wait_for_room(seq)
+
+    def flush(self):
+        self.sink.flush()
+
+    def close(self):
+        self.sink.close()
+
+
+def get_sink(path=None, compression=None, rotate_size=None):
+    """Get an output sink for ``path``, or for stdout if ``path`` is
+    ``None`` or ``"-"``.
+
+    :rtype: :class:`OutputSink`
+    """
+    if (not path) or (path == '-'):
+        return StreamSink(compression=compression)
+    return FileSink(path, compression, rotate_size)
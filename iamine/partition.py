@@ -0,0 +1,208 @@
+import time
+import string
+import asyncio
+import calendar
+
+
+# The characters identifier prefixes are extended with. Identifiers
+# starting with anything else are mined with the rest of their parent
+# prefix, see Partitioner._split_prefix.
+PREFIX_ALPHABET = string.digits + string.ascii_lowercase
+
+DATE_FORMAT = '%Y-%m-%dT%H:%M:%SZ'
+
+
+def _format_date(t):
+    return time.strftime(DATE_FORMAT, time.gmtime(t))
+
+
+def _parse_date(date):
+    return calendar.timegm(time.strptime(date, DATE_FORMAT))
+
+
+class Partitioner(object):
+    """Split a search into disjoint sub-queries of at most about
+    ``target`` results each, so that they can be enumerated in
+    parallel, each with its own Scrape API cursor.
+
+    Sub-queries are sized with ``rows=0`` count probes, as in
+    :meth:`iamine.core.SearchMiner.fetch_search_info`, and those with
+    too many results are split further:
+
+    - ``"date"`` splits ``field`` (``addeddate`` by default) into
+      halving date ranges, from ``start`` to ``end``. Items without a
+      date in that range form one more partition.
+    - ``"prefix"`` splits by identifier prefix, extending prefixes one
+      character at a time. Identifiers with a prefix followed by any
+      other character form one more partition per prefix.
+    - ``"collection"`` makes one partition per collection in
+      ``collections``, split further by date if they are too large.
+      Items can be in more than one collection, so these partitions
+      may overlap, see ``dedup`` in :class:`iamine.core.Miner`.
+
+    A partition that can't be split any further is mined as it is,
+    whatever its size. So is one whose sub-queries count more results
+    than it has, as they would if the server ignored them.
+
+    :param miner: The miner to probe the search with.
+    :type miner: :class:`iamine.core.SearchMiner`
+
+    :param by: (optional) ``"date"``, ``"prefix"`` or ``"collection"``.
+               Defaults to ``"date"``.
+    :type by: str
+
+    :param target: (optional) The largest number of results to aim for
+                   in each partition. Defaults to 500,000.
+    :type target: int
+
+    :param field: (optional) The date field to split by. Defaults to
+                  ``addeddate``.
+    :type field: str
+
+    :param collections: (optional) With ``by="collection"``, the
+                        collections to split by.
+    :type collections: list
+
+    :param start: (optional) The Unix timestamp to split dates from.
+                  Defaults to the start of 1996.
+    :type start: float
+
+    :param end: (optional) The Unix timestamp to split dates up to.
+                Defaults to a day from now.
+    :type end: float
+
+    :param min_span: (optional) The shortest date range, in seconds, to
+                     split. Defaults to a minute.
+    :type min_span: float
+
+    :param concurrency: (optional) The number of count probes to run at
+                        once. Defaults to 10.
+    :type concurrency: int
+    """
+
+    def __init__(self, miner, by=None, target=None, field=None, collections=None, start=None,
+                 end=None, min_span=None, concurrency=None):
+        by = 'date' if not by else by
+        if by not in ('date', 'prefix', 'collection'):
+            raise ValueError('"{}" is not a way to partition a search.'.format(by))
+        if (by == 'collection') and not collections:
+            raise ValueError('Partitioning by collection requires a list of collections.')
+        target = 500000 if not target else target
+        field = 'addeddate' if not field else field
+        start = _parse_date('1996-01-01T00:00:00Z') if start is None else start
+        end = time.time() + 86400 if end is None else end
+        min_span = 60 if not min_span else min_span
+        concurrency = 10 if not concurrency else concurrency
+
+        self.miner = miner
+        self.by = by
+        self.target = target
+        self.field = field
+        self.collections = collections
+        self.start = start
+        self.end = end
+        self.min_span = min_span
+        self.probes = 0
+        self._semaphore = asyncio.Semaphore(concurrency, loop=miner.loop)
+
+    @asyncio.coroutine
+    def count(self, query):
+        """Get the number of results of ``query``, within the miner's
+        rate limit.
+
+        :type query: str
+
+        :rtype: int
+        """
+        with (yield from self._semaphore):
+            yield from self.miner.rate_limiter.acquire()
+            self.probes += 1
+            j = yield from self.miner.fetch_search_info({'q': query, 'output': 'json'})
+        return j.get('response', {}).get('numFound', 0)
+
+    @asyncio.coroutine
+    def partition(self, query=None):
+        """Split ``query`` into partitions.
+
+        :param query: (optional) The search query. Defaults to every
+                      indexed item.
+        :type query: str
+
+        :rtype: list
+        :returns: The sub-queries, each with at most about ``target``
+                  results where possible. Empty ones are dropped.
+        """
+        query = 'all:1' if not query else query
+        if self.by == 'collection':
+            parts = yield from self._gather(
+                self._split_dates('({}) AND collection:"{}"'.format(query, c.replace('"', '\\"')))
+                for c in self.collections)
+        elif self.by == 'prefix':
+            total = yield from self.count(query)
+            parts = yield from self._split_prefix(query, '', total)
+        else:
+            parts = yield from self._split_dates(query)
+        return parts
+
+    @asyncio.coroutine
+    def _gather(self, coros):
+        results = yield from asyncio.gather(*coros, loop=self.miner.loop)
+        return [q for r in results for q in r]
+
+    @asyncio.coroutine
+    def _split_dates(self, query):
+        # Items outside of [start, end), or without the field, are a
+        # partition of their own.
+        rest = '({}) AND NOT {}:[{} TO {}}}'.format(query, self.field, _format_date(self.start),
+                                                    _format_date(self.end))
+        parts = yield from self._gather([self._split_range(query, self.start, self.end),
+                                         self._probe(rest)])
+        return parts
+
+    def _range_query(self, query, start, end):
+        return '({}) AND {}:[{} TO {}}}'.format(query, self.field, _format_date(start),
+                                                _format_date(end))
+
+    @asyncio.coroutine
+    def _probe(self, query):
+        n = yield from self.count(query)
+        return [query] if n else []
+
+    @asyncio.coroutine
+    def _split_range(self, query, start, end, n=None):
+        q = self._range_query(query, start, end)
+        n = (yield from self.count(q)) if n is None else n
+        if not n:
+            return []
+        if (n <= self.target) or (end - start <= self.min_span):
+            return [q]
+        middle = start + (end - start) // 2
+        counts = yield from asyncio.gather(self.count(self._range_query(query, start, middle)),
+                                           self.count(self._range_query(query, middle, end)),
+                                           loop=self.miner.loop)
+        if sum(counts) > n:
+            return [q]
+        parts = yield from self._gather([self._split_range(query, start, middle, counts[0]),
+                                         self._split_range(query, middle, end, counts[1])])
+        return parts
+
+    @asyncio.coroutine
+    def _split_prefix(self, query, prefix, n):
+        q = '({}) AND identifier:{}*'.format(query, prefix) if prefix else query
+        if not n:
+            return []
+        if (n <= self.target) or (len(prefix) >= 64):
+            return [q]
+        children = ['{}{}'.format(prefix, c) for c in PREFIX_ALPHABET]
+        counts = yield from asyncio.gather(
+            *[self.count('({}) AND identifier:{}*'.format(query, c)) for c in children],
+            loop=self.miner.loop)
+        if sum(counts) > n:
+            return [q]
+        # Identifiers continuing with any other character, or equal to
+        # the prefix itself.
+        rest = '({}) AND NOT identifier:({})'.format(q, ' OR '.join(c + '*' for c in children))
+        parts = yield from self._gather(
+            [self._split_prefix(query, c, count) for c, count in zip(children, counts)]
+            + [self._probe(rest)])
+        return parts
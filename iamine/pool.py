@@ -0,0 +1,79 @@
+import asyncio
+
+
+class WorkerPool(object):
+    """A resizable group of workers processing requests from a queue.
+
+    :param queue: The queue to get requests from.
+    :type queue: :class:`iamine.scheduler.Scheduler` or
+                 :class:`asyncio.Queue`
+
+    :param handler: A coroutine function called with each request.
+
+    :param size: The number of workers to start with.
+    :type size: int
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self, queue, handler, size, loop=None):
+        self.loop = asyncio.get_event_loop() if not loop else loop
+        self.queue = queue
+        self.handler = handler
+        self.size = 0
+        self.busy = 0
+        self.closed = False
+        self.workers = set()
+        self._idle = set()
+        self.resize(size)
+
+    def __len__(self):
+        return len(self.workers)
+
+    @property
+    def idle(self):
+        return len(self._idle)
+
+    def resize(self, size):
+        """Grow or shrink the pool to ``size`` workers.
+
+        New workers are started right away. When shrinking, idle workers
+        are stopped right away, and busy workers stop once they have
+        finished their current request.
+
+        :type size: int
+        """
+        if self.closed:
+            return
+        self.size = max(0, int(size))
+        while len(self.workers) < self.size:
+            self.workers.add(asyncio.Task(self._work(), loop=self.loop))
+        excess = len(self.workers) - self.size
+        for task in list(self._idle)[:max(0, excess)]:
+            task.cancel()
+
+    def cancel(self):
+        """Stop all workers."""
+        self.closed = True
+        self.size = 0
+        for task in list(self.workers):
+            task.cancel()
+
+    @asyncio.coroutine
+    def _work(self):
+        task = asyncio.Task.current_task(loop=self.loop)
+        try:
+            while len(self.workers) <= self.size:
+                self._idle.add(task)
+                try:
+                    request = yield from self.queue.get()
+                finally:
+                    self._idle.discard(task)
+                self.busy += 1
+                try:
+                    yield from self.handler(request)
+                finally:
+                    self.busy -= 1
+                    self.queue.task_done()
+        finally:
+            self.workers.discard(task)
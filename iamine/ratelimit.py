@@ -0,0 +1,86 @@
+import asyncio
+import time
+
+
+class TokenBucket(object):
+    """An asyncio token-bucket rate limiter.
+
+    Tokens are added to the bucket at ``rate`` tokens per second, up to
+    ``burst`` tokens. Each call to :meth:`acquire` takes one token, and
+    waits without blocking the event loop if none are available. A
+    single :class:`TokenBucket` can be shared by any number of workers
+    and miners.
+
+    :param rate: The number of tokens added to the bucket per second.
+    :type rate: float
+
+    :param burst: (optional) The maximum number of tokens the bucket can
+                  hold. Defaults to one second worth of tokens.
+    :type burst: int
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self, rate, burst=None, loop=None):
+        self.loop = asyncio.get_event_loop() if not loop else loop
+        self._burst = None
+        self._tokens = 0.0
+        self._last = time.monotonic()
+        self.set_rate(rate, burst)
+        self._tokens = float(self.burst)
+
+    @property
+    def rate(self):
+        return self._rate
+
+    @property
+    def burst(self):
+        return self._burst
+
+    def set_rate(self, rate, burst=None):
+        """Resize the bucket.
+
+        Tokens that have accrued at the old rate are kept, capped to the
+        new burst size. Callers already waiting for a token are not
+        rescheduled.
+
+        :param rate: The new number of tokens added per second.
+        :type rate: float
+
+        :param burst: (optional) The new burst size. Defaults to one
+                      second worth of tokens.
+        :type burst: int
+        """
+        rate = float(rate)
+        if rate <= 0:
+            raise ValueError('rate must be greater than 0, not {}'.format(rate))
+        self._refill()
+        self._rate = rate
+        self._burst = max(1, int(burst if burst else rate))
+        self._tokens = min(self._tokens, float(self._burst))
+
+    def _refill(self):
+        now = time.monotonic()
+        if self._burst is not None:
+            self._tokens = min(float(self._burst),
+                               self._tokens + (now - self._last) * self._rate)
+        self._last = now
+
+    @asyncio.coroutine
+    def acquire(self):
+        """Take a token from the bucket, waiting until one is available.
+
+        Tokens are reserved in call order: if the bucket is empty, the
+        token is borrowed against the future and the caller sleeps until
+        it has been paid back.
+
+        :rtype: float
+        :returns: The number of seconds spent waiting.
+        """
+        self._refill()
+        self._tokens -= 1.0
+        if self._tokens >= 0:
+            return 0.0
+        wait = -self._tokens / self._rate
+        yield from asyncio.sleep(wait, loop=self.loop)
+        return wait
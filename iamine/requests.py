@@ -1,6 +1,7 @@
 import os
 import locale
 import sys
+import time
 import asyncio
 try:
     import ujson as json
@@ -11,77 +12,406 @@ import traceback
 import aiohttp
 
 from . import __version__
+from .cache import CachedResponse
+from .output import to_line
+from .retry import RetryPolicy, parse_retry_after
+from .exceptions import HTTPStatusError
 
 
-class MineRequest(object):
+_user_agents = dict()
+
+
+def get_user_agent(access_key):
+    """Get the User-Agent header sent with requests made with
+    ``access_key``. It is only built once per key.
+
+    :rtype: str
+    """
+    if access_key not in _user_agents:
+        uname = os.uname()
+        try:
+            lang = locale.getlocale()[0][:2]
+        except:
+            lang = ''
+        py_version = '{0}.{1}.{2}'.format(*sys.version_info)
+        _user_agents[access_key] = 'ia-mine/{0} ({1} {2}; N; {3}; {4}) Python/{5}'.format(
+            __version__, uname.sysname, uname.machine, lang, access_key, py_version)
+    return _user_agents[access_key]
+
+
+class RequestTemplate(object):
+    """What the requests of a miner have in common, shared between them
+    so that each :class:`MineRequest` only carries its own state.
 
-    def __init__(self, method, url, access_key, *,
+    :param access_key: The S3 access key, sent in the User-Agent.
+    :type access_key: str
+
+    :param method: (optional) Defaults to ``"GET"``.
+    :type method: str
+
+    :param \*\*kwargs: (optional) Arguments passed on to
+                       :meth:`aiohttp.ClientSession.request` with every
+                       request, e.g. ``params`` or ``headers``.
+    """
+
+    def __init__(self, access_key=None, method=None, *,
                  callback=None,
                  max_retries=None,
                  debug=None,
+                 session=None,
+                 cache=None,
+                 sink=None,
+                 retry_policy=None,
+                 controller=None,
+                 host_pool=None,
+                 stats=None,
+                 fields=None,
                  **kwargs):
+        retry_policy = RetryPolicy(max_retries) if not retry_policy else retry_policy
+        max_retries = retry_policy.max_retries if not max_retries else max_retries
 
-        max_retries = 10 if not max_retries else max_retries
-
-        self.method = method
-        self.url = url
+        self.access_key = access_key
+        self.method = 'GET' if not method else method
         self.callback = callback
         self.max_retries = max_retries
         self.debug = debug
-        self.request_kwargs = kwargs
-        self.access_key = access_key
+        self.session = session
+        self.cache = cache
+        self.sink = sink
+        self.retry_policy = retry_policy
+        self.controller = controller
+        # With a host pool, the URLs of requests are paths and a host is
+        # chosen for each attempt, so that retries can go to a different
+        # host.
+        self.host_pool = host_pool
+        self.stats = stats
+        self.fields = fields
+        self.user_agent = get_user_agent(access_key)
+        headers = dict((k, v) for k, v in kwargs.get('headers', {}).items()
+                       if k.lower() != 'user-agent')
+        headers['User-Agent'] = self.user_agent
+        self.headers = headers
+        self.request_kwargs = dict(kwargs, headers=headers)
+
+    def request(self, url, **kwargs):
+        """Make a request from the template.
+
+        :param url: The URL, or with a host pool, the path to request.
+        :type url: str
+
+        :param \*\*kwargs: (optional) Arguments that :class:`MineRequest`
+                           takes.
+
+        :rtype: :class:`MineRequest`
+        """
+        return MineRequest(url, self, **kwargs)
+
 
-        self._headers = kwargs.get('headers', {})
-        self._user_agent = self._get_user_agent_string()
+class MineRequest(object):
+    """A request, and the state of its attempts. Everything it shares
+    with other requests is in its :class:`RequestTemplate`.
+
+    :param url: The URL, or with a host pool, the path to request.
+    :type url: str
+
+    :param template: The template of the request.
+    :type template: :class:`RequestTemplate`
+
+    :param key: (optional) The key of the request in the journal and the
+                cache, e.g. an identifier.
+    :type key: str
+
+    :param seq: (optional) The position of the request in its input,
+                used to keep output in order.
+    :type seq: int
+
+    :param params: (optional) URL parameters, instead of the template's.
+    :type params: dict
+
+    :param callback: (optional) A callback, instead of the template's.
+
+    :param sink: (optional) An output sink, instead of the template's.
+
+    :param priority: (optional) The request's priority, see
+                     :class:`iamine.scheduler.Scheduler`.
+    :type priority: int
+
+    :param job: (optional) The job the request belongs to.
+    """
+
+    __slots__ = ('template', 'url', 'path', 'host', 'key', 'seq', 'params', 'callback',
+                 'sink', 'priority', 'job', 'retries', '_cache_entry')
+
+    def __init__(self, url, template, key=None, seq=None, params=None, callback=None,
+                 sink=None, priority=None, job=None):
+        self.template = template
+        self.path = url if template.host_pool else None
+        self.url = url
+        self.host = None
+        self.key = key
+        self.seq = seq
+        self.params = params
+        self.callback = template.callback if callback is None else callback
+        self.sink = template.sink if sink is None else sink
+        self.priority = priority
+        self.job = job
+        self.retries = 0
+        self._cache_entry = None
+
+    @property
+    def method(self):
+        return self.template.method
+
+    @property
+    def access_key(self):
+        return self.template.access_key
 
     @property
     def headers(self):
-        headers = dict((k, v) for k, v in self._headers if k.lower() != 'user-agent')
-        headers['User-agent'] = self._user_agent
-        return headers
+        return self.template.headers
 
-    def _get_user_agent_string(self):
-        uname = os.uname()
-        try:
-            lang = locale.getlocale()[0][:2]
-        except:
-            lang = ''
-        py_version = '{0}.{1}.{2}'.format(*sys.version_info)
-        return 'ia-mine/{0} ({1} {2}; N; {3}; {4}) Python/{5}'.format(
-            __version__, uname.sysname, uname.machine, lang, self.access_key, py_version)
+    @property
+    def request_kwargs(self):
+        if self.params is None:
+            return self.template.request_kwargs
+        return dict(self.template.request_kwargs, params=self.params)
+
+    @property
+    def max_retries(self):
+        return self.template.max_retries
+
+    @property
+    def retry_policy(self):
+        return self.template.retry_policy
+
+    @property
+    def debug(self):
+        return self.template.debug
+
+    @property
+    def session(self):
+        return self.template.session
+
+    @property
+    def cache(self):
+        return self.template.cache if self.key else None
+
+    @property
+    def controller(self):
+        return self.template.controller
+
+    @property
+    def host_pool(self):
+        return self.template.host_pool
+
+    @property
+    def stats(self):
+        return self.template.stats
+
+    @property
+    def fields(self):
+        return self.template.fields
 
     def _handle_response(self, resp):
         if self.callback:
+            if self.stats:
+                self.stats.bytes += int(resp.headers.get('Content-Length', 0))
             yield from self.callback(resp)
             resp.close()
+        elif self.fields:
+            # Cached responses are whole documents, see metadata_requests().
+            record, size = yield from self.fields.extract(resp, self.key,
+                                                          subpath=not self.cache,
+                                                          stream=not self.cache)
+            resp.close()
+            if self.stats:
+                self.stats.bytes += size
+            body = json.dumps(record).encode('utf-8')
+            if self.sink:
+                self.sink.write(body, self.seq)
+            else:
+                print(body.decode('utf-8'))
         else:
-            j = yield from resp.json()
+            # Pass the body through as is, rather than decoding it and
+            # serializing it again.
+            body = yield from resp.read()
             resp.close()
-            print(json.dumps(j))
+            if self.stats:
+                self.stats.bytes += len(body)
+            if self.sink:
+                self.sink.write(body, self.seq)
+            else:
+                print(to_line(body).decode('utf-8'))
+
+    def cache_entry(self):
+        """Get the cached response for this request, if any.
+
+        :rtype: :class:`iamine.cache.CacheEntry`
+        """
+        if self.cache and (self._cache_entry is None):
+            self._cache_entry = self.cache.get(self.key)
+        return self._cache_entry
+
+    def is_cached(self):
+        """Check whether this request can be answered from the cache
+        without going to the network.
+
+        :rtype: bool
+        """
+        entry = self.cache_entry()
+        return bool(entry and self.cache.is_fresh(entry))
 
     @asyncio.coroutine
-    def make_request(self):
-        retries = 0
-        while retries < self.max_retries:
-            try:
-                resp = yield from aiohttp.request(self.method, self.url,
-                                                  **self.request_kwargs)
+    def _fetch(self, **kwargs):
+        if not self.session:
+            return (yield from aiohttp.request(self.method, self.url, **kwargs))
+        return (yield from self.session.request(self.method, self.url, **kwargs))
+
+    @asyncio.coroutine
+    def _fetch_cached(self):
+        entry = self.cache_entry()
+        if not entry:
+            kwargs = self.request_kwargs
+        else:
+            # Revalidate the cached response with a conditional GET.
+            headers = dict(self.request_kwargs.get('headers', {}))
+            if entry.etag:
+                headers['If-None-Match'] = entry.etag
+            if entry.last_modified:
+                headers['If-Modified-Since'] = entry.last_modified
+            kwargs = dict(self.request_kwargs, headers=headers)
+
+        resp = yield from self._fetch(**kwargs)
+        if entry and (resp.status == 304):
+            resp.close()
+            self.cache.touch(self.key)
+            if self.stats:
+                self.stats.cache_hits += 1
+            return CachedResponse(self.url, entry)
+        if resp.status == 200:
+            body = yield from resp.read()
+            self.cache.put(self.key, body,
+                           resp.headers.get('ETag'), resp.headers.get('Last-Modified'))
+        return resp
+
+    def _record(self, host, latency, ok):
+        if self.stats:
+            self.stats.record_response(latency, ok)
+        if self.controller:
+            self.controller.record(latency, ok)
+        if self.host_pool:
+            self.host_pool.finish(host, latency, ok)
+
+    @asyncio.coroutine
+    def _observe(self, fetch):
+        """Fetch a response, reporting its latency and whether it
+        succeeded to :attr:`MineRequest.controller` and
+        :attr:`MineRequest.host_pool`.
+        """
+        if (not self.controller) and (not self.host_pool) and (not self.stats):
+            return (yield from fetch)
+        host = self.host
+        if self.host_pool:
+            self.host_pool.start(host)
+        start = time.monotonic()
+        try:
+            resp = yield from fetch
+        except Exception:
+            self._record(host, time.monotonic() - start, False)
+            raise
+        ok = (resp.status < 500) and (resp.status != 429)
+        self._record(host, time.monotonic() - start, ok)
+        return resp
+
+    def _check_status(self, resp):
+        if resp.status >= 400:
+            retry_after = parse_retry_after(resp.headers.get('Retry-After'))
+            resp.close()
+            raise HTTPStatusError(resp.status, retry_after)
+
+    @asyncio.coroutine
+    def _request(self):
+        if self.host_pool:
+            self.host = self.host_pool.pick()
+            self.url = self.host_pool.url(self.path, self.host)
+        if self.is_cached():
+            if self.stats:
+                self.stats.cache_hits += 1
+            return (yield from self._handle_response(CachedResponse(self.url, self._cache_entry)))
+        fetch = self._fetch_cached() if self.cache else self._fetch(**self.request_kwargs)
+        fetch = self._observe(fetch)
+        if not self.session:
+            resp = yield from fetch
+            self._check_status(resp)
+            return (yield from self._handle_response(resp))
+        # The host's slot is taken first, so that requests waiting for a
+        # busy host don't hold connections other hosts could use.
+        with (yield from self.session.host_semaphore(self.url)):
+            with (yield from self.session.pool_semaphore):
+                resp = yield from fetch
+                self._check_status(resp)
                 return (yield from self._handle_response(resp))
-            except Exception as exc:
-                retries += 1
-                error = dict(
-                    url=self.url,
-                    params=self.request_kwargs.get('params'),
-                    message='Request failed, retrying.',
-                    retries_left=self.max_retries-retries,
-                )
+
+    @asyncio.coroutine
+    def attempt(self):
+        """Make a single attempt at the request.
+
+        :rtype: tuple
+        :returns: Whether the request succeeded, and the number of
+                  seconds to wait before it should be attempted again,
+                  or ``None`` if it is done, either way.
+        """
+        policy = self.retry_policy
+        if not self.retries:
+            policy.on_request()
+        try:
+            yield from self._request()
+            return True, None
+        except Exception as exc:
+            error = dict(
+                url=self.url,
+                params=self.request_kwargs.get('params'),
+                message='Request failed, retrying.',
+                retries_left=self.max_retries-self.retries-1,
+            )
+            if isinstance(exc, HTTPStatusError):
+                error['status'] = exc.status
+            if self.debug:
+                error['callback'] = repr(self.callback)
+                error['exception'] = repr(exc)
+                error['traceback'] = traceback.format_exc()
+
+            if not policy.is_retryable(exc):
+                error['message'] = 'Request failed permanently, giving up.'
+            # max_retries counts every attempt, including the first.
+            elif self.retries + 1 >= self.max_retries:
+                error['message'] = 'Maximum retries exceeded for url, giving up.'
+            elif not policy.allow_retry():
+                error['message'] = 'Retry budget exhausted, giving up.'
+            else:
                 if self.debug:
-                    error['callback'] = repr(self.callback)
-                    error['exception'] = repr(exc)
-                    error['traceback'] = traceback.format_exc()
                     sys.stderr.write('{}\n'.format(json.dumps(error)))
-            yield from asyncio.sleep(1)
-        else:
-            error['message'] = 'Maximum retries exceeded for url, giving up.'
+                delay = policy.delay(self.retries, getattr(exc, 'retry_after', None))
+                self.retries += 1
+                if self.stats:
+                    self.stats.retries += 1
+                return False, delay
+            error['retries_left'] = 0
             sys.stderr.write('{}\n'.format(json.dumps(error)))
-            return
+            if self.stats:
+                self.stats.failed += 1
+            return False, None
+
+    @asyncio.coroutine
+    def make_request(self):
+        """Make the request, retrying it as allowed by
+        :attr:`MineRequest.retry_policy`.
+
+        :rtype: bool
+        :returns: ``True`` if the request succeeded.
+        """
+        while True:
+            ok, delay = yield from self.attempt()
+            if delay is None:
+                return ok
+            yield from asyncio.sleep(delay)
@@ -0,0 +1,174 @@
+import time
+import random
+import asyncio
+from email.utils import parsedate_to_datetime
+
+import aiohttp
+
+from .exceptions import HTTPStatusError
+
+
+# Statuses that mean the request may succeed if it is retried. Other 4xx
+# statuses are permanent failures.
+RETRYABLE_STATUSES = frozenset([408, 429, 500, 502, 503, 504])
+
+# Exceptions raised by failed connections, which may succeed if they are
+# retried. Anything else, e.g. an error in a callback, is permanent.
+# Disconnections aren't client errors in older versions of aiohttp.
+CONNECTION_ERRORS = (aiohttp.ClientError,
+                     getattr(aiohttp, 'DisconnectedError', aiohttp.ClientError),
+                     OSError,
+                     asyncio.TimeoutError)
+
+
+def parse_retry_after(value):
+    """Parse a ``Retry-After`` header, given either in seconds or as an
+    HTTP date.
+
+    :type value: str
+
+    :rtype: float
+    :returns: The number of seconds to wait, or ``None``.
+    """
+    if not value:
+        return None
+    try:
+        return max(0.0, float(value))
+    except ValueError:
+        pass
+    try:
+        return max(0.0, parsedate_to_datetime(value).timestamp() - time.time())
+    except (TypeError, ValueError):
+        return None
+
+
+class RetryBudget(object):
+    """Limits retries to a fraction of requests, shared by all requests
+    of a miner, so that a degraded backend isn't hit with a storm of
+    retries.
+
+    Each request deposits ``ratio`` tokens, and each retry withdraws one.
+    ``min_per_second`` tokens are also added every second, so a few
+    retries are always allowed when there is little traffic.
+
+    :param ratio: (optional) The number of retries allowed per request.
+                  Defaults to 0.2.
+    :type ratio: float
+
+    :param min_per_second: (optional) Defaults to 10.
+    :type min_per_second: float
+
+    :param max_balance: (optional) The maximum number of tokens that can
+                        be saved up. Defaults to 1000.
+    :type max_balance: float
+    """
+
+    def __init__(self, ratio=None, min_per_second=None, max_balance=None):
+        self.ratio = .2 if ratio is None else ratio
+        self.min_per_second = 10 if min_per_second is None else min_per_second
+        self.max_balance = 1000 if not max_balance else max_balance
+        self.exhausted = 0
+        self._balance = float(self.max_balance)
+        self._last = time.monotonic()
+
+    @property
+    def balance(self):
+        self._refill()
+        return self._balance
+
+    def _refill(self):
+        now = time.monotonic()
+        self._add((now - self._last) * self.min_per_second)
+        self._last = now
+
+    def _add(self, tokens):
+        self._balance = min(float(self.max_balance), self._balance + tokens)
+
+    def deposit(self):
+        self._add(self.ratio)
+
+    def withdraw(self):
+        """Take a token for a retry.
+
+        :rtype: bool
+        :returns: ``False`` if the budget is exhausted.
+        """
+        self._refill()
+        if self._balance < 1:
+            self.exhausted += 1
+            return False
+        self._balance -= 1
+        return True
+
+
+class RetryPolicy(object):
+    """Decides whether and when failed requests are retried.
+
+    :data:`CONNECTION_ERRORS` and :data:`RETRYABLE_STATUSES` are
+    retried, other 4xx statuses and other exceptions are not. Retries
+    are delayed with exponential backoff and full jitter, or as asked by
+    a ``Retry-After`` header, up to ``max_retry_after``.
+
+    :param max_retries: (optional) The maximum number of attempts per
+                        request, including the first. Defaults to 10.
+    :type max_retries: int
+
+    :param backoff: (optional) The base delay, in seconds. Defaults to 1.
+    :type backoff: float
+
+    :param max_backoff: (optional) The maximum delay, in seconds.
+                        Defaults to 60.
+    :type max_backoff: float
+
+    :param budget: (optional) A :class:`RetryBudget` shared by all the
+                   requests using this policy.
+    :type budget: :class:`RetryBudget`
+
+    :param max_retry_after: (optional) The longest ``Retry-After`` delay
+                            to follow, in seconds. Defaults to
+                            ``max_backoff``.
+    :type max_retry_after: float
+    """
+
+    def __init__(self, max_retries=None, backoff=None, max_backoff=None, budget=None,
+                 max_retry_after=None):
+        self.max_retries = 10 if not max_retries else max_retries
+        self.backoff = 1.0 if backoff is None else backoff
+        self.max_backoff = 60.0 if not max_backoff else max_backoff
+        self.max_retry_after = self.max_backoff if not max_retry_after else max_retry_after
+        self.budget = budget
+
+    def on_request(self):
+        if self.budget:
+            self.budget.deposit()
+
+    def is_retryable(self, exc):
+        if isinstance(exc, HTTPStatusError):
+            return (exc.status in RETRYABLE_STATUSES) or (exc.status >= 500)
+        return isinstance(exc, CONNECTION_ERRORS)
+
+    def allow_retry(self):
+        """Check whether the retry budget allows another retry, taking a
+        token from it if so.
+
+        :rtype: bool
+        """
+        if self.budget:
+            return self.budget.withdraw()
+        return True
+
+    def delay(self, retries, retry_after=None):
+        """Get the number of seconds to wait before the next retry.
+
+        :param retries: The number of retries made so far.
+        :type retries: int
+
+        :param retry_after: (optional) The delay asked for by the server.
+        :type retry_after: float
+
+        :rtype: float
+        """
+        if retry_after is not None:
+            # Spread out requests that were all told to come back at once.
+            return min(retry_after, self.max_retry_after) + random.uniform(0, self.backoff)
+        return random.uniform(0, min(self.max_backoff, self.backoff * (2 ** retries)))
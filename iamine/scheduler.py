@@ -0,0 +1,270 @@
+import heapq
+import asyncio
+import itertools
+from collections import deque
+
+
+# Priorities of requests, lower ones are handed out first.
+PRIORITY_SEARCH = 10
+PRIORITY_ITEM = 20
+
+# Added to the priority of a request that is being retried.
+RETRY_PENALTY = 5
+
+
+class _Level(object):
+    """The requests of a single priority, queued per job.
+
+    Jobs are served by stride scheduling: each job has a pass value,
+    which advances by ``1 / weight`` every time one of its requests is
+    handed out, and the job with the lowest pass goes next. A job that
+    becomes active starts at the pass of the last request handed out,
+    so it can't build up credit while it's idle.
+    """
+
+    def __init__(self, counter):
+        self.jobs = dict()
+        self.heap = list()
+        self.vtime = 0.0
+        self._counter = counter
+
+    def __bool__(self):
+        return bool(self.heap)
+
+    def push(self, item, job):
+        q = self.jobs.get(job)
+        if q is None:
+            q = self.jobs[job] = deque()
+            heapq.heappush(self.heap, (self.vtime, next(self._counter), job))
+        q.append(item)
+
+    def pop(self, weights):
+        p, _, job = heapq.heappop(self.heap)
+        q = self.jobs[job]
+        item = q.popleft()
+        self.vtime = p
+        if q:
+            p += 1.0 / weights.get(job, 1)
+            heapq.heappush(self.heap, (p, next(self._counter), job))
+        else:
+            del self.jobs[job]
+        return item
+
+
+class Scheduler(object):
+    """A request queue handing out requests by priority, and sharing
+    workers fairly between the jobs of a miner.
+
+    It can be used in place of a :class:`asyncio.Queue`. Requests with
+    a lower ``priority`` attribute are always handed out first, and
+    among requests of the same priority, each job (a request's ``job``
+    attribute) gets a share of the workers in proportion to its weight,
+    see :meth:`Scheduler.set_weight`.
+
+    Requests can also be queued after a delay, with
+    :meth:`Scheduler.put_later`, so retries wait for their backoff on a
+    timer rather than in a worker. Retries, see :meth:`Scheduler.retry`,
+    are queued behind fresh requests of the same priority, but at least
+    one in every ``retry_every`` requests handed out is a retry, if any
+    are waiting, so a steady stream of fresh requests can't starve them.
+
+    :param maxsize: (optional) The number of requests, including delayed
+                    ones, that can be queued before :meth:`Scheduler.put`
+                    blocks. Delayed requests are always queued, but hold
+                    back fresh ones. Unlimited by default.
+    :type maxsize: int
+
+    :param default_priority: (optional) The priority of requests
+                             without a ``priority`` attribute. Defaults
+                             to :data:`PRIORITY_ITEM`.
+    :type default_priority: int
+
+    :param retry_every: (optional) Defaults to 5.
+    :type retry_every: int
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self, maxsize=None, default_priority=None, retry_every=None, loop=None):
+        self.loop = asyncio.get_event_loop() if not loop else loop
+        self.maxsize = 0 if not maxsize else maxsize
+        self.default_priority = PRIORITY_ITEM if default_priority is None else default_priority
+        self.retry_every = 5 if not retry_every else retry_every
+        self.weights = dict()
+        self._levels = dict()
+        self._retry_levels = dict()
+        # The number of fresh requests handed out while retries waited.
+        self._skipped_retries = 0
+        self._size = 0
+        self._counter = itertools.count()
+        self._delayed = list()
+        self._timer = None
+        self._getters = deque()
+        self._putters = deque()
+        self._unfinished = 0
+        self._finished = asyncio.Event(loop=self.loop)
+        self._finished.set()
+
+    def qsize(self):
+        """The number of requests ready to be handed out."""
+        return self._size
+
+    @property
+    def delayed(self):
+        """The number of requests waiting for their delay to pass."""
+        return len(self._delayed)
+
+    def empty(self):
+        return self._size == 0
+
+    def full(self):
+        return (self.maxsize > 0) and (self._size + len(self._delayed) >= self.maxsize)
+
+    def set_weight(self, job, weight):
+        """Give ``job`` a share of the workers in proportion to
+        ``weight``. Jobs have a weight of 1 by default.
+        """
+        self.weights[job] = float(weight)
+
+    def _priority(self, item):
+        priority = getattr(item, 'priority', None)
+        return self.default_priority if priority is None else priority
+
+    def _push(self, item, priority, retry=False):
+        levels = self._retry_levels if retry else self._levels
+        level = levels.get(priority)
+        if level is None:
+            level = levels[priority] = _Level(self._counter)
+        level.push(item, getattr(item, 'job', None))
+        self._size += 1
+        self._wakeup_next(self._getters)
+
+    def _top(self, levels):
+        ready = [p for p, level in levels.items() if level]
+        return min(ready) if ready else None
+
+    def _pop(self):
+        fresh = self._top(self._levels)
+        retry = self._top(self._retry_levels)
+        if (retry is not None) and ((fresh is None) or (retry < fresh) or
+                                    (self._skipped_retries >= self.retry_every - 1)):
+            item = self._retry_levels[retry].pop(self.weights)
+            self._skipped_retries = 0
+        else:
+            item = self._levels[fresh].pop(self.weights)
+            if retry is not None:
+                self._skipped_retries += 1
+        self._size -= 1
+        self._wakeup_next(self._putters)
+        return item
+
+    def _wakeup_next(self, waiters):
+        while waiters:
+            waiter = waiters.popleft()
+            if not waiter.done():
+                waiter.set_result(None)
+                break
+
+    def _add_task(self):
+        self._unfinished += 1
+        self._finished.clear()
+
+    def put_nowait(self, item):
+        if self.full():
+            raise asyncio.QueueFull
+        self._add_task()
+        self._push(item, self._priority(item))
+
+    @asyncio.coroutine
+    def put(self, item):
+        """Queue ``item``, waiting for room if the queue is full."""
+        while self.full():
+            putter = asyncio.Future(loop=self.loop)
+            self._putters.append(putter)
+            try:
+                yield from putter
+            except:
+                putter.cancel()
+                if not self.full() and not putter.cancelled():
+                    self._wakeup_next(self._putters)
+                raise
+        self.put_nowait(item)
+
+    def put_later(self, item, delay, priority=None, retry=False):
+        """Queue ``item`` after ``delay`` seconds, regardless of
+        :attr:`Scheduler.maxsize`.
+
+        :param priority: (optional) The priority to queue ``item`` with.
+                         Defaults to the item's own priority.
+        :type priority: int
+
+        :param retry: (optional) Whether ``item`` is a retry.
+        :type retry: bool
+        """
+        priority = self._priority(item) if priority is None else priority
+        self._add_task()
+        if delay <= 0:
+            self._push(item, priority, retry)
+            return
+        due = self.loop.time() + delay
+        heapq.heappush(self._delayed, (due, next(self._counter), item, priority, retry))
+        # A single timer is kept, for the earliest delayed item.
+        if self._timer and (self._delayed[0][0] < due):
+            return
+        self._set_timer()
+
+    def retry(self, item, delay):
+        """Queue ``item`` to be retried after ``delay`` seconds, behind
+        fresh requests of the same priority.
+        """
+        self.put_later(item, delay, self._priority(item) + RETRY_PENALTY, retry=True)
+
+    def _set_timer(self):
+        if self._timer:
+            self._timer.cancel()
+            self._timer = None
+        if self._delayed:
+            self._timer = self.loop.call_at(self._delayed[0][0], self._release)
+
+    def _release(self):
+        self._timer = None
+        now = self.loop.time()
+        while self._delayed and (self._delayed[0][0] <= now):
+            _, _, item, priority, retry = heapq.heappop(self._delayed)
+            self._push(item, priority, retry)
+        self._set_timer()
+
+    def get_nowait(self):
+        if self.empty():
+            raise asyncio.QueueEmpty
+        return self._pop()
+
+    @asyncio.coroutine
+    def get(self):
+        """Get the next request, waiting for one if there are none."""
+        while self.empty():
+            getter = asyncio.Future(loop=self.loop)
+            self._getters.append(getter)
+            try:
+                yield from getter
+            except:
+                getter.cancel()
+                if not self.empty() and not getter.cancelled():
+                    self._wakeup_next(self._getters)
+                raise
+        return self.get_nowait()
+
+    def task_done(self):
+        if self._unfinished <= 0:
+            raise ValueError('task_done() called too many times')
+        self._unfinished -= 1
+        if self._unfinished == 0:
+            self._finished.set()
+
+    @asyncio.coroutine
+    def join(self):
+        """Wait until every queued request, including delayed ones, has
+        been handled.
+        """
+        if self._unfinished:
+            yield from self._finished.wait()
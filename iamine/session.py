@@ -0,0 +1,105 @@
+import asyncio
+from urllib.parse import urlsplit
+
+import aiohttp
+
+
+class MineSession(object):
+    """A long-lived HTTP session shared by every request a
+    :class:`iamine.core.Miner` makes.
+
+    Connections are pooled and kept alive between requests, so that TCP
+    and TLS handshakes are only paid once per connection rather than
+    once per request.
+
+    :param pool_size: (optional) The maximum number of connections in
+                      use at once, across all hosts. Unlimited by
+                      default.
+    :type pool_size: int
+
+    :param per_host_limit: (optional) The maximum number of concurrent
+                           requests to a single host. Unlimited by
+                           default.
+    :type per_host_limit: int
+
+    :param keepalive_timeout: (optional) The number of seconds an idle
+                              connection is kept open. Defaults to 30.
+    :type keepalive_timeout: float
+
+    :param dns_cache_ttl: (optional) The number of seconds resolved
+                          hosts are cached for. ``0`` disables the DNS
+                          cache. Defaults to 60.
+    :type dns_cache_ttl: float
+
+    :param cookies: (optional) Cookies to send with every request.
+    :type cookies: dict
+
+    :param loop: (optional) The event loop to use.
+    """
+
+    def __init__(self,
+                 pool_size=None,
+                 per_host_limit=None,
+                 keepalive_timeout=None,
+                 dns_cache_ttl=None,
+                 cookies=None,
+                 loop=None):
+
+        # Set default values for kwargs.
+        loop = asyncio.get_event_loop() if not loop else loop
+        keepalive_timeout = 30 if keepalive_timeout is None else keepalive_timeout
+        dns_cache_ttl = 60 if dns_cache_ttl is None else dns_cache_ttl
+
+        self.loop = loop
+        self.pool_size = pool_size
+        self.per_host_limit = per_host_limit
+        self.dns_cache_ttl = dns_cache_ttl
+
+        # The connector's limit only applies per host, the total is
+        # limited by pool_semaphore.
+        self.connector = aiohttp.TCPConnector(limit=pool_size,
+                                              keepalive_timeout=keepalive_timeout,
+                                              use_dns_cache=bool(dns_cache_ttl),
+                                              loop=loop)
+        self.session = aiohttp.ClientSession(connector=self.connector,
+                                             cookies=cookies,
+                                             loop=loop)
+        self.pool_semaphore = asyncio.Semaphore(pool_size if pool_size else 2 ** 31, loop=loop)
+        self._host_semaphores = dict()
+        self._dns_handle = None
+        if dns_cache_ttl:
+            self._schedule_dns_expiry()
+
+    def _schedule_dns_expiry(self):
+        self._dns_handle = self.loop.call_later(self.dns_cache_ttl, self._expire_dns_cache)
+
+    def _expire_dns_cache(self):
+        self.connector.clear_dns_cache()
+        self._schedule_dns_expiry()
+
+    def host_semaphore(self, url):
+        """Get the semaphore limiting concurrent requests to the host
+        of ``url``. Use it as ``with (yield from semaphore): ...``.
+
+        :type url: str
+
+        :rtype: :class:`asyncio.Semaphore`
+        """
+        host = urlsplit(url).netloc
+        semaphore = self._host_semaphores.get(host)
+        if semaphore is None:
+            # Without a per-host limit, a semaphore is still handed out
+            # so that callers don't need to special case it.
+            limit = self.per_host_limit if self.per_host_limit else 2 ** 31
+            semaphore = asyncio.Semaphore(limit, loop=self.loop)
+            self._host_semaphores[host] = semaphore
+        return semaphore
+
+    @asyncio.coroutine
+    def request(self, method, url, **kwargs):
+        return (yield from self.session.request(method, url, **kwargs))
+
+    def close(self):
+        if self._dns_handle:
+            self._dns_handle.cancel()
+        self.session.close()
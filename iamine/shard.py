@@ -0,0 +1,493 @@
+import queue
+import signal
+import asyncio
+import traceback
+import multiprocessing
+from functools import partial
+
+from .core import SearchMiner, metadata_requests
+from .journal import Journal
+from .cache import MetadataCache
+from .output import OutputSink, OrderedSink, StreamSink
+from .stats import merge_snapshots, dump_json
+from .dedup import Deduplicator
+from .exceptions import WorkerError
+
+
+class ShardSink(OutputSink):
+    """The sink of a worker process. Records, finished sequence numbers
+    and completed journal keys are sent to the parent process in
+    batches, in the order they happened.
+
+    :param result_queue: The queue to send batches to.
+    :type result_queue: :class:`multiprocessing.Queue`
+    """
+
+    def __init__(self, result_queue, buffer_size=None, max_events=None):
+        buffer_size = 2 ** 18 if not buffer_size else buffer_size
+        super(ShardSink, self).__init__(buffer_size)
+        self.result_queue = result_queue
+        self.max_events = 1000 if not max_events else max_events
+        self._finished = list()
+        self._keys = list()
+
+    def write(self, body, seq=None):
+        self._buffer.append((seq, body))
+        self._buffered += len(body)
+        self.records += 1
+        if self._buffered >= self.buffer_size:
+            self.flush()
+
+    def finish(self, seq):
+        self._finished.append(seq)
+        if len(self._finished) >= self.max_events:
+            self.flush()
+
+    def record(self, key):
+        self._keys.append(key)
+        if len(self._keys) >= self.max_events:
+            self.flush()
+
+    def flush(self):
+        if not (self._buffer or self._finished or self._keys):
+            return
+        self.result_queue.put(('batch', self._buffer, self._finished, self._keys))
+        self.bytes_written += self._buffered
+        self._buffer = list()
+        self._buffered = 0
+        self._finished = list()
+        self._keys = list()
+
+
+class ShardJournal(object):
+    """Stands in for the journal in a worker process, passing completed
+    keys on to the parent process, which owns the real journal and skips
+    completed work before handing it out.
+    """
+
+    def __init__(self, sink):
+        self.sink = sink
+
+    def __contains__(self, key):
+        return False
+
+    def record(self, key):
+        self.sink.record(key)
+
+    def sync(self):
+        pass
+
+    def close(self):
+        pass
+
+
+class WorkerMiner(SearchMiner):
+    """The miner of a worker process, mining the work the parent
+    process sends it on ``work_queue``.
+
+    :param work_queue: The queue work is sent on.
+    :type work_queue: :class:`multiprocessing.Queue`
+
+    :param params: (optional) The URL parameters to send with each
+                   metadata request.
+    :type params: dict
+
+    :param flush_interval: (optional) The number of seconds between
+                           flushes of the sink, so that the parent
+                           hears of finished work while the worker is
+                           still busy. Defaults to 1.
+    :type flush_interval: float
+    """
+
+    def __init__(self, work_queue, params=None, flush_interval=None, **kwargs):
+        super(WorkerMiner, self).__init__(**kwargs)
+        self.work_queue = work_queue
+        self.params = params
+        self.flush_interval = 1 if not flush_interval else flush_interval
+
+    @asyncio.coroutine
+    def start_background_tasks(self):
+        tasks = yield from super(WorkerMiner, self).start_background_tasks()
+        tasks.append(asyncio.Task(self.flush_periodically(), loop=self.loop))
+        return tasks
+
+    @asyncio.coroutine
+    def flush_periodically(self):
+        while True:
+            yield from asyncio.sleep(self.flush_interval, loop=self.loop)
+            self.sink.flush()
+
+    @asyncio.coroutine
+    def get_work(self):
+        """Get the next chunk of work, without blocking the event loop
+        while the parent has none to hand out.
+
+        :rtype: list
+        :returns: The chunk, or ``None`` once there is no more work.
+        """
+        try:
+            return self.work_queue.get_nowait()
+        except queue.Empty:
+            pass
+        # The parent may be holding work back until it hears that work
+        # handed out earlier is done, see ShardedMiner.add.
+        self.sink.flush()
+        get = partial(self.work_queue.get, True, 1)
+        while True:
+            try:
+                return (yield from self.loop.run_in_executor(None, get))
+            except queue.Empty:
+                continue
+
+    def work_requests(self, chunk):
+        """Turn a chunk of work sent by the parent into requests."""
+        for seq, work in chunk:
+            if isinstance(work, str):
+                for req in metadata_requests([work], self.params, None, self):
+                    req.seq = seq
+                    yield req
+            else:
+                page_params, key = work
+                yield self.page_request(page_params, key, seq=seq)
+
+    @asyncio.coroutine
+    def q_requests(self, requests=None, job=None, priority=None):
+        """Queue the requests of the work sent by the parent, until it
+        sends ``None``. ``requests`` is ignored.
+        """
+        while True:
+            chunk = yield from self.get_work()
+            if chunk is None:
+                return
+            yield from super(WorkerMiner, self).q_requests(self.work_requests(chunk), job,
+                                                           priority)
+
+
+def _work(work_queue, result_queue, kwargs, cache_args, params):
+    """The main function of a worker process."""
+    # Interrupts are handled by the parent, which terminates its workers.
+    signal.signal(signal.SIGINT, signal.SIG_IGN)
+    loop = asyncio.new_event_loop()
+    asyncio.set_event_loop(loop)
+    sink = ShardSink(result_queue)
+    try:
+        cache = MetadataCache(*cache_args) if cache_args else None
+        miner = WorkerMiner(work_queue, params, loop=loop, sink=sink,
+                            journal=ShardJournal(sink), cache=cache, **kwargs)
+        loop.run_until_complete(miner.mine(()))
+        miner.shutdown()
+        result_queue.put(('done', miner.stats.snapshot(), None))
+    except Exception:
+        result_queue.put(('done', None, traceback.format_exc()))
+
+
+class ShardedMiner(object):
+    """Mine with several worker processes, to use more than one CPU.
+
+    Each worker process runs a miner with its own event loop, and a
+    share of the global rate limit. The parent process reads the input
+    and hands it out to workers in chunks as they need it, and merges
+    their output into a single sink, in order if ``ordered`` is set. The
+    journal is kept by the parent, so resuming works the same as with a
+    single process.
+
+    :param processes: The number of worker processes.
+    :type processes: int
+
+    :param ordered: (optional) Write results in the order of the input,
+                    rather than in the order they complete.
+    :type ordered: bool
+
+    :param window: (optional) With ``ordered``, the number of results
+                   that can be outstanding past the first unfinished
+                   one before input is held back. Defaults to 10,000.
+    :type window: int
+
+    :param chunk_size: (optional) The number of identifiers or search
+                       pages to hand out at a time. Defaults to 500.
+    :type chunk_size: int
+
+    :param loop: (optional) The event loop to use.
+
+    :param \*\*kwargs: (optional) Arguments that :class:`Miner` takes,
+                       for the miner of each process. ``max_tasks`` is
+                       the number of workers of each process.
+                       ``metrics_port`` is not supported, and callbacks
+                       can't be used.
+    """
+
+    def __init__(self, processes, ordered=None, chunk_size=None, loop=None, window=None,
+                 **kwargs):
+        loop = asyncio.get_event_loop() if not loop else loop
+        chunk_size = 500 if not chunk_size else chunk_size
+        ordered = True if ordered else False
+        window = 10000 if not window else window
+
+        journal = kwargs.pop('journal', None)
+        if isinstance(journal, str):
+            journal = Journal(journal)
+        cache = kwargs.pop('cache', None)
+        if cache and not isinstance(cache, MetadataCache):
+            cache = MetadataCache(cache)
+        sink = kwargs.pop('sink', None)
+        sink = StreamSink() if not sink else sink
+        kwargs.pop('metrics_port', None)
+        # Input is deduplicated by the parent, before it is handed out.
+        dedup = kwargs.pop('dedup', None)
+        dedup_size = kwargs.pop('dedup_size', None)
+        if dedup and not isinstance(dedup, Deduplicator):
+            dedup = Deduplicator(dedup_size)
+
+        self.loop = loop
+        self.processes = processes
+        self.ordered = ordered
+        self.chunk_size = chunk_size
+        self.journal = journal
+        self.cache = cache
+        self.dedup = dedup
+        self.window = window
+        self.sink = OrderedSink(sink, window=window, loop=loop) if ordered else sink
+        self.stats_file = kwargs.pop('stats_file', None)
+        self.snapshots = list()
+        self.errors = list()
+
+        self.kwargs = kwargs
+        self._burst = kwargs.get('burst')
+        self.share_rate(processes)
+
+        self.work_queue = multiprocessing.Queue(processes * 4)
+        self.result_queue = multiprocessing.Queue()
+        self.workers = list()
+        self.closed = False
+        self._seq = 0
+        self._chunk = list()
+
+    def share_rate(self, shares):
+        """Split the global rate limit (and burst) into ``shares`` equal
+        shares, one for each worker process, and any left for the
+        parent. Takes effect for workers started afterwards.
+
+        :type shares: int
+
+        :rtype: float
+        :returns: The share of each process.
+        """
+        share = 1.0 / shares
+        self.kwargs['rate_share'] = share
+        if self._burst:
+            self.kwargs['burst'] = max(1, self._burst // shares)
+        return share
+
+    def start(self, params=None):
+        """Start the worker processes.
+
+        :param params: (optional) The URL parameters to send with each
+                       metadata request.
+        :type params: dict
+        """
+        cache_args = None
+        if self.cache:
+            cache_args = (self.cache.path, self.cache.max_size, self.cache.max_age)
+        for _ in range(self.processes):
+            p = multiprocessing.Process(target=_work,
+                                        args=(self.work_queue, self.result_queue,
+                                              self.kwargs, cache_args, params))
+            p.daemon = True
+            p.start()
+            self.workers.append(p)
+
+    def _check_workers(self, require_alive=False):
+        for p in self.workers:
+            if p.exitcode not in (None, 0):
+                raise WorkerError('A worker process exited with status {}.'.format(
+                    p.exitcode))
+        if require_alive and not any(p.is_alive() for p in self.workers):
+            raise WorkerError('The worker processes exited before the work was done.')
+
+    def _put(self, chunk):
+        while not self.closed:
+            try:
+                return self.work_queue.put(chunk, True, 1)
+            except queue.Full:
+                self._check_workers(require_alive=True)
+
+    def _get(self):
+        while not self.closed:
+            try:
+                return self.result_queue.get(True, 1)
+            except queue.Empty:
+                self._check_workers()
+
+    @asyncio.coroutine
+    def add(self, work):
+        """Hand out ``work``, an identifier or the parameters and journal
+        key of a search page, to the workers.
+        """
+        if self.ordered and (self._seq >= self.sink.next_seq + self.window):
+            # The work holding back the window may still be in the
+            # current chunk.
+            if self._chunk:
+                chunk, self._chunk = self._chunk, list()
+                yield from self.loop.run_in_executor(None, self._put, chunk)
+            yield from self.sink.wait_for_room(self._seq)
+        self._chunk.append((self._seq, work))
+        self._seq += 1
+        if len(self._chunk) >= self.chunk_size:
+            chunk, self._chunk = self._chunk, list()
+            yield from self.loop.run_in_executor(None, self._put, chunk)
+
+    @asyncio.coroutine
+    def _end_of_work(self):
+        if self._chunk:
+            chunk, self._chunk = self._chunk, list()
+            yield from self.loop.run_in_executor(None, self._put, chunk)
+        for _ in self.workers:
+            yield from self.loop.run_in_executor(None, self._put, None)
+
+    @asyncio.coroutine
+    def merge(self):
+        """Merge the output of the workers until they are all done."""
+        done = 0
+        while done < len(self.workers):
+            msg = yield from self.loop.run_in_executor(None, self._get)
+            if msg is None:
+                return
+            if msg[0] == 'done':
+                done += 1
+                _, snapshot, error = msg
+                if snapshot:
+                    self.snapshots.append(snapshot)
+                if error:
+                    self.errors.append(error)
+                continue
+            _, records, finished, keys = msg
+            for seq, body in records:
+                self.sink.write(body, seq)
+            for seq in finished:
+                self.sink.finish(seq)
+            if self.journal:
+                for key in keys:
+                    self.journal.record(key)
+
+    @asyncio.coroutine
+    def run(self, work, params=None):
+        """Hand out ``work`` and merge the results.
+
+        :param work: A coroutine adding work with :meth:`add`.
+        """
+        self.start(params)
+        merger = asyncio.Task(self.merge(), loop=self.loop)
+        try:
+            yield from work
+            yield from self._end_of_work()
+            yield from merger
+        finally:
+            if not merger.done():
+                merger.cancel()
+        self.sink.flush()
+        if self.journal:
+            self.journal.sync()
+        for p in self.workers:
+            p.join()
+        if self.errors:
+            raise WorkerError('A worker process failed:\n{}'.format(self.errors[0]))
+
+    @asyncio.coroutine
+    def _add_identifiers(self, identifiers):
+        if self.dedup:
+            identifiers = self.dedup.filter(identifiers)
+        for identifier in identifiers:
+            identifier = identifier.strip()
+            if (not identifier) or (self.journal and identifier in self.journal):
+                continue
+            yield from self.add(identifier)
+
+    @asyncio.coroutine
+    def mine_items(self, identifiers, params=None):
+        """Mine metadata from Archive.org items.
+
+        :param identifiers: Archive.org identifiers to be mined.
+        :type identifiers: iterable
+
+        :param params: URL parameters to send with each metadata
+                       request.
+        :type params: dict
+        """
+        # As in ItemMiner.mine_items.
+        params = {'dontcache': 1} if not params else {}
+        yield from self.run(self._add_identifiers(identifiers), params)
+
+    @asyncio.coroutine
+    def search(self, query=None, params=None, mine_ids=None, scrape=None):
+        """Mine Archive.org search results, or with ``mine_ids``, the
+        items they return.
+
+        Pages of search results are handed out to the workers, unless
+        ``mine_ids`` is set, in which case the search is run by the
+        parent and the items it returns are handed out instead. Scrape
+        API cursors have to be followed one page after another, so
+        ``scrape`` requires ``mine_ids``.
+        """
+        params = params if params else {}
+        if scrape and not mine_ids:
+            raise ValueError('Scraping search results can only be sharded with mine_ids.')
+        if self.ordered and mine_ids:
+            raise ValueError('Items returned by a search can not be mined in order.')
+        # With mine_ids, the parent's miner must not journal the pages
+        # it searches, as their items may not have been mined yet. It
+        # searches alongside the workers, within a share of the rate
+        # limit of its own.
+        if mine_ids:
+            self.share_rate(self.processes + 1)
+        kwargs = dict(self.kwargs, loop=self.loop, journal=None if mine_ids else self.journal)
+        miner = SearchMiner(**kwargs)
+        try:
+            if mine_ids:
+                id_params = dict((k, v) for k, v in params.items() if not k.startswith('fl'))
+                id_params['fl[]'] = 'identifier'
+                search = miner.search(query, id_params, self._add_search_results,
+                                      scrape=scrape)
+                yield from self.run(search, {'dontcache': 1})
+            else:
+                yield from self.run(self._add_pages(miner, query, params))
+        finally:
+            miner.session.close()
+
+    @asyncio.coroutine
+    def _add_pages(self, miner, query, params):
+        search_info, = yield from miner.startup(
+            miner.fetch_search_info(miner.get_search_params(query, params)))
+        for page in miner.search_pages(query, params, search_info=search_info):
+            yield from self.add(page)
+
+    @asyncio.coroutine
+    def _add_search_results(self, resp):
+        j = yield from resp.json(encoding='utf-8')
+        resp.close()
+        # Scrape API results are in "items", Advancedsearch results in "docs".
+        docs = j.get('items') or j.get('response', {}).get('docs', [])
+        yield from self._add_identifiers(d['identifier'] for d in docs if d.get('identifier'))
+
+    def shutdown(self):
+        """Release the resources held by the miner, and write its
+        statistics.
+        """
+        self.closed = True
+        if self.journal:
+            self.journal.close()
+        if self.cache:
+            self.cache.close()
+        self.sink.close()
+        if self.stats_file and self.snapshots:
+            j = merge_snapshots(self.snapshots)
+            if self.dedup:
+                j['duplicates'] += self.dedup.duplicates
+            dump_json(j, self.stats_file)
+
+    def close(self):
+        for p in self.workers:
+            if p.is_alive():
+                p.terminate()
+        self.shutdown()
+        self.loop.stop()
+        self.loop.close()
@@ -0,0 +1,143 @@
+import time
+import sqlite3
+
+
+class StateStore(object):
+    """The state of incremental mining, stored in a single SQLite file.
+
+    For each item mined, the store keeps the last-modified indicator it
+    was mined at, such as the latest of its ``oai_updatedate`` search
+    field, and for each search query, the time its last complete run
+    started. The next run of a query only searches for items updated
+    since, see :meth:`StateStore.since`, and of those only mines the
+    ones whose indicator has changed, see :meth:`StateStore.changed`.
+
+    :param path: The path to the SQLite database. It is created if it
+                 doesn't exist.
+    :type path: str
+
+    :param overlap: (optional) The number of seconds before the start of
+                    the last run to search from, so that items the
+                    search index had not caught up with yet are still
+                    found. Defaults to a day.
+    :type overlap: float
+
+    :param commit_every: (optional) The number of writes to batch into
+                         a single transaction. Defaults to 100.
+    :type commit_every: int
+    """
+
+    def __init__(self, path, overlap=None, commit_every=None):
+        overlap = 86400 if overlap is None else overlap
+        commit_every = 100 if not commit_every else commit_every
+
+        self.path = path
+        self.overlap = overlap
+        self.commit_every = commit_every
+
+        self.db = sqlite3.connect(path)
+        self.db.execute('PRAGMA journal_mode=WAL')
+        self.db.execute('PRAGMA synchronous=NORMAL')
+        self.db.execute('CREATE TABLE IF NOT EXISTS items ('
+                        'identifier TEXT PRIMARY KEY, updated TEXT, mined REAL)')
+        self.db.execute('CREATE TABLE IF NOT EXISTS runs ('
+                        'query TEXT PRIMARY KEY, started REAL)')
+        self.db.commit()
+        self._writes = 0
+
+    def get(self, identifier):
+        """Get the indicator ``identifier`` was last mined at.
+
+        :type identifier: str
+
+        :rtype: str
+        :returns: The indicator, or ``None`` if the item wasn't mined
+                  or had no indicator.
+        """
+        row = self.db.execute('SELECT updated FROM items WHERE identifier = ?',
+                              (identifier,)).fetchone()
+        return row[0] if row else None
+
+    def changed(self, identifier, updated):
+        """Check whether ``identifier`` needs to be mined, i.e. it is
+        new, or ``updated`` differs from the indicator it was last mined
+        at. Items without an indicator are always mined.
+
+        :type identifier: str
+
+        :type updated: str
+
+        :rtype: bool
+        """
+        if updated is None:
+            return True
+        return self.get(identifier) != updated
+
+    def record(self, identifier, updated):
+        """Record that ``identifier`` was mined at ``updated``."""
+        self.db.execute('INSERT OR REPLACE INTO items VALUES (?, ?, ?)',
+                        (identifier, updated, time.time()))
+        self._wrote()
+
+    def since(self, query):
+        """Get the time to search for updates to ``query`` from.
+
+        :type query: str
+
+        :rtype: float
+        :returns: A Unix timestamp, ``overlap`` seconds before the start
+                  of the last complete run of ``query``, or ``None`` if
+                  it hasn't been run.
+        """
+        row = self.db.execute('SELECT started FROM runs WHERE query = ?',
+                              (query,)).fetchone()
+        return (row[0] - self.overlap) if row else None
+
+    def finish_run(self, query, started):
+        """Record that a run of ``query`` that started at ``started``
+        completed, and commit.
+        """
+        self.db.execute('INSERT OR REPLACE INTO runs VALUES (?, ?)', (query, started))
+        self.sync()
+
+    def _wrote(self):
+        self._writes += 1
+        if self._writes >= self.commit_every:
+            self.sync()
+
+    def sync(self):
+        self.db.commit()
+        self._writes = 0
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+
+def last_updated(doc):
+    """Get the last-modified indicator of a search result: the latest
+    of its ``oai_updatedate`` values.
+
+    :type doc: dict
+
+    :rtype: str
+    :returns: The indicator, or ``None`` if ``doc`` doesn't have one.
+    """
+    updated = doc.get('oai_updatedate')
+    if isinstance(updated, list):
+        updated = max(updated) if updated else None
+    return updated
+
+
+def updated_query(query, since):
+    """Restrict ``query`` to items updated since ``since``.
+
+    :type query: str
+
+    :param since: A Unix timestamp.
+    :type since: float
+
+    :rtype: str
+    """
+    date = time.strftime('%Y-%m-%dT%H:%M:%SZ', time.gmtime(since))
+    return '({}) AND oai_updatedate:[{} TO null]'.format(query, date)
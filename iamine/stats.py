@@ -0,0 +1,276 @@
+import sys
+import time
+import asyncio
+try:
+    import ujson as json
+except ImportError:
+    import json
+
+
+COUNTERS = ['requests', 'responses', 'errors', 'retries', 'failed', 'cache_hits', 'bytes',
+            'rate_limit_wait', 'duplicates', 'unchanged']
+
+
+def dump_json(j, path):
+    """Write ``j`` as JSON to ``path``, or to stderr if ``path`` is
+    ``"-"``.
+    """
+    data = json.dumps(j)
+    if path == '-':
+        sys.stderr.write('{}\n'.format(data))
+    else:
+        with open(path, 'w') as fh:
+            fh.write('{}\n'.format(data))
+
+
+def merge_snapshots(snapshots):
+    """Combine the snapshots of miners that ran side by side, such as
+    the processes of a :class:`iamine.shard.ShardedMiner`. Counters are
+    summed, and the snapshots themselves are kept in ``"processes"``.
+
+    :type snapshots: list
+
+    :rtype: dict
+    """
+    elapsed = max([s['elapsed'] for s in snapshots] + [1e-9])
+    j = dict((k, sum(s[k] for s in snapshots)) for k in COUNTERS)
+    j['elapsed'] = elapsed
+    j['requests_per_second'] = j['requests'] / elapsed
+    j['bytes_per_second'] = j['bytes'] / elapsed
+    j['processes'] = snapshots
+    return j
+
+
+class Histogram(object):
+    """A histogram with fixed buckets, in seconds.
+
+    :param buckets: (optional) The upper bounds of the buckets.
+    :type buckets: list
+    """
+
+    default_buckets = [.005, .01, .025, .05, .1, .25, .5, 1, 2.5, 5, 10, 30, 60]
+
+    def __init__(self, buckets=None):
+        self.buckets = list(self.default_buckets if not buckets else buckets) + [float('inf')]
+        self.counts = [0] * len(self.buckets)
+        self.count = 0
+        self.sum = 0.0
+
+    def observe(self, value):
+        for i, bound in enumerate(self.buckets):
+            if value <= bound:
+                self.counts[i] += 1
+                break
+        self.count += 1
+        self.sum += value
+
+    def percentile(self, p):
+        """Estimate the ``p``th percentile by interpolating within the
+        bucket it falls in.
+
+        :param p: The percentile, between 0 and 100.
+        :type p: float
+
+        :rtype: float
+        """
+        if not self.count:
+            return None
+        rank = self.count * p / 100.0
+        seen = 0
+        lower = 0.0
+        for bound, count in zip(self.buckets, self.counts):
+            if count and (seen + count >= rank):
+                if bound == float('inf'):
+                    return lower
+                return lower + (bound - lower) * ((rank - seen) / count)
+            seen += count
+            lower = bound
+        return lower
+
+
+class Stats(object):
+    """Counters, latency histogram and gauges for a mining run.
+
+    Gauges are functions returning the current value of something, such
+    as a queue's depth, added with :meth:`add_gauge`.
+    """
+
+    def __init__(self):
+        self.started = time.monotonic()
+        self.requests = 0
+        self.responses = 0
+        self.errors = 0
+        self.retries = 0
+        self.failed = 0
+        self.cache_hits = 0
+        self.bytes = 0
+        self.rate_limit_wait = 0.0
+        self.duplicates = 0
+        self.unchanged = 0
+        self.latency = Histogram()
+        self.gauges = dict()
+        self.host_pool = None
+
+    def add_gauge(self, name, func):
+        self.gauges[name] = func
+
+    def record_response(self, latency, ok):
+        self.requests += 1
+        if ok:
+            self.responses += 1
+            self.latency.observe(latency)
+        else:
+            self.errors += 1
+
+    def snapshot(self):
+        """Get the current statistics.
+
+        :rtype: dict
+        """
+        elapsed = max(time.monotonic() - self.started, 1e-9)
+        j = dict(
+            elapsed=elapsed,
+            requests=self.requests,
+            responses=self.responses,
+            errors=self.errors,
+            retries=self.retries,
+            failed=self.failed,
+            cache_hits=self.cache_hits,
+            bytes=self.bytes,
+            requests_per_second=self.requests / elapsed,
+            bytes_per_second=self.bytes / elapsed,
+            rate_limit_wait=self.rate_limit_wait,
+            duplicates=self.duplicates,
+            unchanged=self.unchanged,
+            latency=dict(
+                p50=self.latency.percentile(50),
+                p90=self.latency.percentile(90),
+                p99=self.latency.percentile(99),
+                mean=(self.latency.sum / self.latency.count) if self.latency.count else None,
+            ),
+            gauges=dict((k, f()) for k, f in self.gauges.items()),
+        )
+        if self.host_pool and (len(self.host_pool) > 1):
+            j['hosts'] = [s.as_dict() for s in self.host_pool.hosts.values()]
+        return j
+
+    def progress_line(self):
+        j = self.snapshot()
+        ms = lambda v: '-' if v is None else '{:.0f}ms'.format(v * 1000)
+        gauges = ' '.join('{}={}'.format(k, v) for k, v in sorted(j['gauges'].items()))
+        return ('[{elapsed:.0f}s] requests={requests} ({rps:.1f}/s) {mbps:.2f}MB/s '
+                'p50={p50} p99={p99} errors={errors} retries={retries} failed={failed} '
+                'cache_hits={cache_hits} duplicates={duplicates} unchanged={unchanged} '
+                'rate_limit_wait={wait:.1f}s {gauges}').format(
+                    elapsed=j['elapsed'],
+                    requests=j['requests'],
+                    rps=j['requests_per_second'],
+                    mbps=j['bytes_per_second'] / 2 ** 20,
+                    p50=ms(j['latency']['p50']),
+                    p99=ms(j['latency']['p99']),
+                    errors=j['errors'],
+                    retries=j['retries'],
+                    failed=j['failed'],
+                    cache_hits=j['cache_hits'],
+                    duplicates=j['duplicates'],
+                    unchanged=j['unchanged'],
+                    wait=j['rate_limit_wait'],
+                    gauges=gauges)
+
+    def dump(self, path):
+        """Write a JSON snapshot to ``path``, or to stderr if ``path``
+        is ``"-"``.
+        """
+        dump_json(self.snapshot(), path)
+
+    def prometheus(self):
+        """Render the statistics in the Prometheus text exposition
+        format.
+
+        :rtype: str
+        """
+        lines = []
+        typed = set()
+
+        def metric(name, kind, value, labels=None):
+            if name not in typed:
+                typed.add(name)
+                lines.append('# TYPE {} {}'.format(name, kind))
+            label_str = ''
+            if labels:
+                label_str = '{' + ','.join('{}="{}"'.format(k, v) for k, v in labels) + '}'
+            lines.append('{}{} {}'.format(name, label_str, value))
+
+        metric('iamine_requests_total', 'counter', self.requests)
+        metric('iamine_responses_total', 'counter', self.responses)
+        metric('iamine_errors_total', 'counter', self.errors)
+        metric('iamine_retries_total', 'counter', self.retries)
+        metric('iamine_failed_total', 'counter', self.failed)
+        metric('iamine_cache_hits_total', 'counter', self.cache_hits)
+        metric('iamine_bytes_total', 'counter', self.bytes)
+        metric('iamine_rate_limit_wait_seconds_total', 'counter', self.rate_limit_wait)
+        metric('iamine_duplicates_total', 'counter', self.duplicates)
+        metric('iamine_unchanged_total', 'counter', self.unchanged)
+
+        name = 'iamine_request_latency_seconds'
+        lines.append('# TYPE {} histogram'.format(name))
+        cumulative = 0
+        for bound, count in zip(self.latency.buckets, self.latency.counts):
+            cumulative += count
+            le = '+Inf' if bound == float('inf') else repr(bound)
+            lines.append('{}_bucket{{le="{}"}} {}'.format(name, le, cumulative))
+        lines.append('{}_sum {}'.format(name, self.latency.sum))
+        lines.append('{}_count {}'.format(name, self.latency.count))
+
+        for gauge, func in sorted(self.gauges.items()):
+            metric('iamine_{}'.format(gauge), 'gauge', func())
+
+        if self.host_pool:
+            hosts = list(self.host_pool.hosts.values())
+            host_metrics = [
+                ('iamine_host_requests_total', 'counter', lambda h: h.requests),
+                ('iamine_host_errors_total', 'counter', lambda h: h.errors),
+                ('iamine_host_outstanding', 'gauge', lambda h: h.outstanding),
+                ('iamine_host_ejected', 'gauge', lambda h: int(h.ejected)),
+                ('iamine_host_latency_seconds', 'gauge', lambda h: h.latency),
+            ]
+            # Samples of a metric have to be grouped together.
+            for name, kind, value in host_metrics:
+                for h in hosts:
+                    if value(h) is not None:
+                        metric(name, kind, value(h), [('host', h.host)])
+        return '\n'.join(lines) + '\n'
+
+    @asyncio.coroutine
+    def report_progress(self, interval, stream=None):
+        """Write a progress line every ``interval`` seconds."""
+        stream = sys.stderr if not stream else stream
+        while True:
+            yield from asyncio.sleep(interval)
+            stream.write('{}\n'.format(self.progress_line()))
+            stream.flush()
+
+    @asyncio.coroutine
+    def serve(self, port, host='127.0.0.1', loop=None):
+        """Serve the statistics in the Prometheus text format at
+        ``http://host:port/metrics``.
+
+        :rtype: tuple
+        :returns: The :class:`asyncio.Server` and the aiohttp request
+                  handler.
+        """
+        # aiohttp.web is only needed for the metrics endpoint.
+        from aiohttp import web
+
+        loop = asyncio.get_event_loop() if not loop else loop
+
+        @asyncio.coroutine
+        def metrics(request):
+            return web.Response(body=self.prometheus().encode('utf-8'),
+                                headers={'Content-Type': 'text/plain; version=0.0.4'})
+
+        app = web.Application(loop=loop)
+        app.router.add_route('GET', '/metrics', metrics)
+        handler = app.make_handler()
+        server = yield from loop.create_server(handler, host, port)
+        return server, handler
@@ -19,7 +19,7 @@ if sys.version_info <= (3,):
     sys.exit(1)
 
 install_requires = [
-    'aiohttp>=0.13.1,<0.21.0',
+    'aiohttp>=0.20.0,<0.21.0',
     'schema>=0.4.0,<0.6.0',
     'docopt>=0.6.0,<0.7.0',
 ]
@@ -27,6 +27,12 @@ install_requires = [
 if sys.version_info <= (3,4):
     install_requires.append('asyncio')
 
+extras_require = {
+    # Fields are extracted from responses as they stream in, rather than
+    # once they have been read in full, see iamine.fields.FieldExtractor.
+    'stream': ['ijson>=3.1'],
+}
+
 setup(
     name = 'iamine',
     version = version,
@@ -38,6 +44,7 @@ setup(
     long_description=readme + '\n\n' + history,
     packages=['iamine'],
     install_requires = install_requires,
+    extras_require = extras_require,
     entry_points = {
         'internetarchive.plugins': [
             'Miner = iamine.core:Miner',
@@ -0,0 +1,24 @@
+import asyncio
+import unittest
+
+
+class LoopTestCase(unittest.TestCase):
+    """A test case with an event loop of its own."""
+
+    def setUp(self):
+        self.loop = asyncio.new_event_loop()
+        asyncio.set_event_loop(self.loop)
+
+    def tearDown(self):
+        self.loop.close()
+        asyncio.set_event_loop(None)
+
+    def run_coro(self, coro, timeout=10):
+        """Run ``coro`` on the test's loop, failing after ``timeout``
+        seconds rather than hanging.
+        """
+        return self.loop.run_until_complete(asyncio.wait_for(coro, timeout, loop=self.loop))
+
+    def spin(self):
+        """Let every task that is ready run."""
+        self.loop.run_until_complete(asyncio.sleep(0, loop=self.loop))
@@ -0,0 +1,203 @@
+"""End-to-end tests of the miners, against the mock Archive.org in
+``benchmarks/mockserver.py``.
+"""
+import io
+import os
+import json
+import shutil
+import asyncio
+import tempfile
+
+from iamine.core import ItemMiner, SearchMiner
+from iamine.output import StreamSink
+from iamine.retry import RetryPolicy
+from iamine.partition import Partitioner, PREFIX_ALPHABET
+
+from benchmarks.mockserver import MockArchive, start_server
+
+from . import LoopTestCase
+
+
+HOST = '127.0.0.1'
+
+
+class MockServerTestCase(LoopTestCase):
+    """A test case with a mock Archive.org of ``items`` items, served
+    on an unused port.
+    """
+
+    items = 50
+
+    def setUp(self):
+        super(MockServerTestCase, self).setUp()
+        self.tmpdir = tempfile.mkdtemp()
+        self.archive = MockArchive(items=self.items)
+        self.server, self.handler = self.run_coro(start_server(self.archive, HOST, 0, self.loop))
+        port = self.server.sockets[0].getsockname()[1]
+        self.host = '{}:{}'.format(HOST, port)
+        self.config_file = os.path.join(self.tmpdir, 'mock.ini')
+        with open(self.config_file, 'w') as fh:
+            fh.write('[s3]\n'
+                     'access = mock\n'
+                     'secret = mock\n\n'
+                     '[iamine]\n'
+                     'auth-url = http://{0}/?check_auth=1\n'
+                     'rate-limit-url = http://{0}/metadata/iamine-rate-limiter\n'.format(
+                         self.host))
+
+    def tearDown(self):
+        self.run_coro(self.handler.finish_connections())
+        self.server.close()
+        self.run_coro(self.server.wait_closed())
+        shutil.rmtree(self.tmpdir)
+        super(MockServerTestCase, self).tearDown()
+
+    def path(self, name):
+        return os.path.join(self.tmpdir, name)
+
+    def identifiers(self, n=None):
+        return [self.archive.identifier(i) for i in range(self.items if n is None else n)]
+
+    def miner(self, cls, **kwargs):
+        """Make a miner of class ``cls`` writing to a stream.
+
+        :rtype: tuple
+        :returns: The miner, and the :class:`io.BytesIO` its records are
+                  written to.
+        """
+        stream = io.BytesIO()
+        kwargs.setdefault('max_tasks', 10)
+        kwargs.setdefault('hosts', [self.host])
+        miner = cls(loop=self.loop,
+                    config_file=self.config_file,
+                    startup_cache=self.path('startup.json'),
+                    startup_ttl=0,
+                    sink=StreamSink(stream),
+                    **kwargs)
+        return miner, stream
+
+    def records(self, stream):
+        return [json.loads(line.decode('utf-8')) for line in stream.getvalue().splitlines()]
+
+
+class ItemMinerTest(MockServerTestCase):
+
+    def mine_items(self, identifiers, **kwargs):
+        miner, stream = self.miner(ItemMiner, **kwargs)
+        self.run_coro(miner.mine_items(identifiers))
+        miner.shutdown()
+        return miner, [r['metadata']['identifier'] for r in self.records(stream)]
+
+    def test_mine_items(self):
+        miner, mined = self.mine_items(self.identifiers())
+        self.assertEqual(sorted(mined), self.identifiers())
+        self.assertEqual(miner.stats.failed, 0)
+
+    def test_ordered(self):
+        # Responses complete out of order.
+        self.archive.latency = .01
+        identifiers = self.identifiers()[::-1]
+        miner, mined = self.mine_items(identifiers, ordered=True, window=5)
+        self.assertEqual(mined, identifiers)
+
+    def test_journal_resume(self):
+        journal = self.path('journal')
+        miner, mined = self.mine_items(self.identifiers(20), journal=journal)
+        self.assertEqual(len(mined), 20)
+
+        miner, mined = self.mine_items(self.identifiers(), journal=journal)
+        self.assertEqual(sorted(mined), self.identifiers()[20:])
+
+    def test_dedup(self):
+        miner, mined = self.mine_items(self.identifiers() * 2, dedup=True)
+        self.assertEqual(sorted(mined), self.identifiers())
+        self.assertEqual(miner.stats.duplicates, self.items)
+
+    def test_pool_size(self):
+        # The archive is served on a second port too, so that the
+        # requests go to two hosts.
+        server, handler = self.run_coro(start_server(self.archive, HOST, 0, self.loop))
+        hosts = [self.host, '{}:{}'.format(HOST, server.sockets[0].getsockname()[1])]
+        self.archive.latency = .02
+        active = [0, 0]
+        simulate = self.archive.simulate
+
+        @asyncio.coroutine
+        def count_active():
+            active[0] += 1
+            active[1] = max(active)
+            try:
+                return (yield from simulate())
+            finally:
+                active[0] -= 1
+
+        self.archive.simulate = count_active
+        try:
+            miner, mined = self.mine_items(self.identifiers(), hosts=hosts, pool_size=3)
+        finally:
+            self.run_coro(handler.finish_connections())
+            server.close()
+        self.assertEqual(sorted(mined), self.identifiers())
+        self.assertLessEqual(active[1], 3)
+
+    def test_retries(self):
+        self.archive.error_rate = .2
+        retry_policy = RetryPolicy(20, backoff=.01, max_backoff=.05)
+        miner, mined = self.mine_items(self.identifiers(), retry_policy=retry_policy)
+        self.assertEqual(sorted(mined), self.identifiers())
+        self.assertGreater(self.archive.errors, 0)
+
+    def test_max_retries(self):
+        self.archive.error_rate = 1
+        retry_policy = RetryPolicy(3, backoff=.01, max_backoff=.01)
+        miner, mined = self.mine_items(self.identifiers(1), retries=3,
+                                       retry_policy=retry_policy)
+        self.assertEqual(mined, [])
+        self.assertEqual(self.archive.requests, 3)
+        self.assertEqual(miner.stats.retries, 2)
+        self.assertEqual(miner.stats.failed, 1)
+
+
+class SearchMinerTest(MockServerTestCase):
+
+    def search(self, *args, **kwargs):
+        miner_kwargs = kwargs.pop('miner_kwargs', dict())
+        miner, stream = self.miner(SearchMiner, **miner_kwargs)
+        self.run_coro(miner.search(*args, **kwargs))
+        miner.shutdown()
+        return miner, self.records(stream)
+
+    def test_search(self):
+        miner, pages = self.search('mock', params={'rows': 10})
+        self.assertEqual(len(pages), 5)
+        identifiers = [d['identifier'] for p in pages for d in p['response']['docs']]
+        self.assertEqual(sorted(identifiers), self.identifiers())
+
+    def test_search_pages(self):
+        miner, pages = self.search('mock', params={'rows': 15})
+        self.assertEqual(sorted(len(p['response']['docs']) for p in pages), [5, 15, 15, 15])
+
+    def test_search_mine_ids(self):
+        miner, items = self.search('mock', params={'rows': 10}, mine_ids=True)
+        self.assertEqual(sorted(r['metadata']['identifier'] for r in items),
+                         self.identifiers())
+
+    def test_partitioned_scrape(self):
+        miner, stream = self.miner(SearchMiner)
+        # The mock server ignores queries, so the search can't be split.
+        partitioner = Partitioner(miner, by='prefix', target=10)
+        self.run_coro(miner.search('mock', params={'rows': 10}, partitioner=partitioner))
+        miner.shutdown()
+        self.assertEqual(partitioner.probes, 1 + len(PREFIX_ALPHABET))
+        identifiers = [d['identifier'] for p in self.records(stream) for d in p['items']]
+        self.assertEqual(sorted(identifiers), self.identifiers())
+
+    def test_incremental(self):
+        state = self.path('state.db')
+        miner, items = self.search('mock', mine_ids=True, miner_kwargs=dict(state=state))
+        self.assertEqual(len(items), self.items)
+
+        # Nothing changed since the last run.
+        miner, items = self.search('mock', mine_ids=True, miner_kwargs=dict(state=state))
+        self.assertEqual(items, [])
+        self.assertEqual(miner.stats.unchanged, self.items)
@@ -0,0 +1,53 @@
+import unittest
+
+from iamine.dedup import BloomFilter, Deduplicator
+from iamine.stats import Stats
+
+
+class BloomFilterTest(unittest.TestCase):
+
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1000, .01)
+        for i in range(1000):
+            bloom.add('item-{}'.format(i))
+        for i in range(1000):
+            self.assertIn('item-{}'.format(i), bloom)
+        self.assertTrue(bloom.add('item-0'))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(10000, .01)
+        for i in range(10000):
+            bloom.add('item-{}'.format(i))
+        false_positives = sum(1 for i in range(10000) if 'other-{}'.format(i) in bloom)
+        self.assertLess(false_positives, 300)
+
+
+class DeduplicatorTest(unittest.TestCase):
+
+    def test_empty_filter_is_true(self):
+        dedup = Deduplicator()
+        self.assertEqual(len(dedup), 0)
+        self.assertTrue(dedup)
+
+    def test_filter(self):
+        dedup = Deduplicator()
+        identifiers = ['a\n', 'b\n', ' a ', '\n', 'c', 'b']
+        self.assertEqual(list(dedup.filter(identifiers)), ['a', 'b', 'c'])
+        self.assertEqual(dedup.duplicates, 2)
+        self.assertEqual(len(dedup), 3)
+
+    def test_switches_to_bloom_filter(self):
+        dedup = Deduplicator(exact_size=10, capacity=1000)
+        identifiers = ['item-{}'.format(i) for i in range(50)]
+        self.assertEqual(list(dedup.filter(identifiers)), identifiers)
+        self.assertIsNotNone(dedup._bloom)
+        self.assertEqual(dedup._seen, set())
+        # Identifiers seen before the switch are still caught.
+        self.assertEqual(list(dedup.filter(identifiers)), [])
+        self.assertEqual(dedup.duplicates, 50)
+
+    def test_stats(self):
+        stats = Stats()
+        dedup = Deduplicator(stats=stats)
+        list(dedup.filter(['a', 'a', 'a']))
+        self.assertEqual(stats.duplicates, 2)
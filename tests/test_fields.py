@@ -0,0 +1,40 @@
+import json
+import unittest
+from unittest import mock
+
+from iamine import fields
+from iamine.fields import Field, FieldExtractor
+
+
+DOC = json.dumps({
+    'metadata': {'title': 'Title', 'collection': ['a', 'b']},
+    'files': [{'name': 'a.txt', 'md5': 'x'}, {'name': 'b.txt', 'md5': 'y'}],
+}).encode('utf-8')
+
+
+class FieldExtractorTest(unittest.TestCase):
+
+    def extract(self, body, names):
+        extractor = FieldExtractor([Field(n) for n in names])
+        for i in range(0, len(body), 7):
+            extractor.feed(body[i:i + 7])
+        return extractor.close()
+
+    def check(self):
+        result = self.extract(DOC, ['metadata.title', 'metadata.collection', 'files[].md5',
+                                    'metadata.missing'])
+        self.assertEqual(result, {
+            'metadata.title': 'Title',
+            'metadata.collection': ['a', 'b'],
+            'files[].md5': ['x', 'y'],
+            'metadata.missing': None,
+        })
+        self.assertEqual(self.extract(b'', ['files[].md5']), {'files[].md5': []})
+
+    @unittest.skipUnless(fields.ijson, 'ijson 3.1 or later is not installed')
+    def test_streaming(self):
+        self.check()
+
+    def test_without_ijson(self):
+        with mock.patch.object(fields, 'ijson', None):
+            self.check()
@@ -0,0 +1,94 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from iamine.journal import Journal
+
+
+class JournalTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'journal')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_resume(self):
+        journal = Journal(self.path)
+        for i in range(100):
+            journal.record('item-{}'.format(i))
+        self.assertIn('item-0', journal)
+        journal.close()
+
+        journal = Journal(self.path)
+        self.assertEqual(len(journal), 100)
+        self.assertIn('item-99', journal)
+        self.assertNotIn('item-100', journal)
+        journal.close()
+
+    def test_empty_journal_is_true(self):
+        journal = Journal(self.path)
+        self.assertEqual(len(journal), 0)
+        self.assertTrue(journal)
+        journal.close()
+
+    def test_records_after_the_index_are_reloaded(self):
+        journal = Journal(self.path)
+        journal.record('indexed')
+        journal.compact()
+        journal.record('recent')
+        # The process dies without closing the journal.
+        journal.sync()
+
+        resumed = Journal(self.path)
+        self.assertIn('indexed', resumed)
+        self.assertIn('recent', resumed)
+        self.assertEqual(len(resumed), 2)
+        resumed.close()
+        journal.close()
+
+    def test_partial_record_is_dropped(self):
+        journal = Journal(self.path)
+        journal.record('complete')
+        journal.close()
+        with open(self.path, 'ab') as fh:
+            fh.write(b'partial')
+
+        journal = Journal(self.path)
+        self.assertNotIn('partial', journal)
+        journal.record('next')
+        journal.close()
+
+        journal = Journal(self.path)
+        self.assertEqual(len(journal), 2)
+        self.assertIn('next', journal)
+        self.assertNotIn('partial', journal)
+        journal.close()
+        with open(self.path, 'rb') as fh:
+            self.assertEqual(fh.read(), b'complete\nnext\n')
+
+    def test_index_is_rebuilt_if_the_journal_shrinks(self):
+        journal = Journal(self.path)
+        journal.record('item')
+        journal.close()
+        open(self.path, 'wb').close()
+
+        journal = Journal(self.path)
+        self.assertNotIn('item', journal)
+        self.assertEqual(len(journal), 0)
+        journal.close()
+
+    def test_checkpoints(self):
+        journal = Journal(self.path)
+        journal.set_checkpoint('scrape:q=all%3A1', 'cursor-1')
+        journal.set_checkpoint('partitions:q=all%3A1', ['a', 'b'])
+        journal.close()
+
+        journal = Journal(self.path)
+        self.assertEqual(journal.get_checkpoint('scrape:q=all%3A1'), 'cursor-1')
+        self.assertEqual(journal.get_checkpoint('partitions:q=all%3A1'), ['a', 'b'])
+        journal.set_checkpoint('scrape:q=all%3A1', None)
+        self.assertIsNone(journal.get_checkpoint('scrape:q=all%3A1'))
+        journal.close()
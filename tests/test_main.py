@@ -0,0 +1,44 @@
+import io
+import re
+import unittest
+from contextlib import redirect_stdout
+
+from docopt import docopt
+
+from iamine import __version__
+from iamine import __main__ as cli
+
+
+class UsageTest(unittest.TestCase):
+
+    def parse(self, *argv):
+        return docopt(cli.__doc__, argv=list(argv))
+
+    def test_descriptions_do_not_start_with_an_option(self):
+        # docopt reads an indented line starting with "-" as the
+        # definition of an option, even in the middle of a description.
+        for line in cli.__doc__.splitlines():
+            self.assertIsNone(re.match(r' {3,}-', line), line)
+
+    def test_version(self):
+        out = io.StringIO()
+        with redirect_stdout(out), self.assertRaises(SystemExit):
+            cli.main(['ia-mine', '--version'])
+        self.assertEqual(out.getvalue().strip(), __version__)
+
+    def test_itemlist(self):
+        args = self.parse('itemlist.txt', '--workers', '5', '--ordered', '--dedup')
+        self.assertEqual(args['<itemlist>'], 'itemlist.txt')
+        self.assertEqual(args['--workers'], '5')
+        self.assertTrue(args['--ordered'])
+        self.assertTrue(args['--dedup'])
+
+    def test_search(self):
+        args = self.parse('--search', 'collection:a', '--mine-ids', '--partition', 'collection',
+                          '--collections', 'collections.txt', '--dedup', '--incremental',
+                          'state.db')
+        self.assertEqual(args['--search'], 'collection:a')
+        self.assertEqual(args['--partition'], 'collection')
+        self.assertEqual(args['--collections'], 'collections.txt')
+        self.assertEqual(args['--incremental'], 'state.db')
+        self.assertTrue(args['--mine-ids'])
@@ -0,0 +1,74 @@
+import io
+import json
+import random
+import asyncio
+import unittest
+
+from iamine.output import StreamSink, OrderedSink, to_line
+
+from . import LoopTestCase
+
+
+def record(n):
+    return json.dumps({'n': n}).encode('utf-8')
+
+
+class OrderedSinkTest(LoopTestCase):
+
+    def setUp(self):
+        super(OrderedSinkTest, self).setUp()
+        self.stream = io.BytesIO()
+        self.sink = StreamSink(self.stream, buffer_size=1)
+
+    def written(self):
+        return [json.loads(line.decode('utf-8'))['n']
+                for line in self.stream.getvalue().splitlines()]
+
+    def test_records_are_written_in_order(self):
+        ordered = OrderedSink(self.sink, loop=self.loop)
+        seqs = list(range(100))
+        random.Random(0).shuffle(seqs)
+        for seq in seqs:
+            ordered.write(record(seq), seq)
+            ordered.finish(seq)
+        self.assertEqual(self.written(), list(range(100)))
+        self.assertEqual(ordered.held, 0)
+
+    def test_records_are_held_until_earlier_requests_finish(self):
+        ordered = OrderedSink(self.sink, start=5, loop=self.loop)
+        ordered.write(record(6), 6)
+        ordered.write(record(7), 7)
+        ordered.finish(7)
+        ordered.finish(6)
+        self.assertEqual(self.written(), [])
+        self.assertEqual(ordered.held, 2)
+        # A request that writes nothing still lets later ones through.
+        ordered.finish(5)
+        self.assertEqual(self.written(), [6, 7])
+        self.assertEqual(ordered.next_seq, 8)
+
+    def test_window(self):
+        ordered = OrderedSink(self.sink, window=2, loop=self.loop)
+        self.run_coro(ordered.wait_for_room(0))
+        self.run_coro(ordered.wait_for_room(1))
+        waiter = asyncio.Task(ordered.wait_for_room(2), loop=self.loop)
+        self.spin()
+        self.assertFalse(waiter.done())
+        # Finishing a later request doesn't move the window.
+        ordered.finish(1)
+        self.spin()
+        self.assertFalse(waiter.done())
+        ordered.finish(0)
+        self.run_coro(waiter)
+        self.assertEqual(ordered.next_seq, 2)
+        self.run_coro(ordered.wait_for_room(3))
+
+    def test_unbounded_without_window(self):
+        ordered = OrderedSink(self.sink, loop=self.loop)
+        self.run_coro(ordered.wait_for_room(10 ** 6))
+
+
+class ToLineTest(unittest.TestCase):
+
+    def test_newlines_are_replaced(self):
+        self.assertEqual(to_line(b' {"a":\n"b"}\r\n'), b'{"a": "b"}')
@@ -0,0 +1,146 @@
+import re
+import random
+import asyncio
+
+from iamine.ratelimit import TokenBucket
+from iamine.partition import Partitioner, PREFIX_ALPHABET, _format_date, _parse_date
+
+from . import LoopTestCase
+
+
+# The clauses of the queries partitions are made of, e.g.
+# ``addeddate:[2001-01-01T00:00:00Z TO 2002-01-01T00:00:00Z}``,
+# ``identifier:ab*``, ``NOT identifier:(a* OR b*)`` and
+# ``collection:"a"``. They are always joined with AND.
+CLAUSE = re.compile(r'(NOT )?(\w+):(\[\S+ TO \S+\}|\([^)]*\)|"[^"]*"|[^\s()*]*\*)')
+
+
+def clause_matches(doc, field, value):
+    if value.startswith('['):
+        start, end = value[1:-1].split(' TO ')
+        v = doc.get(field)
+        return (v is not None) and (start <= v < end)
+    if value.startswith('('):
+        return any(clause_matches(doc, field, v) for v in value[1:-1].split(' OR '))
+    v = doc.get(field)
+    if value.startswith('"'):
+        return value[1:-1] in (v if isinstance(v, list) else [v])
+    return (v is not None) and v.startswith(value[:-1])
+
+
+def matches(doc, query):
+    return all(clause_matches(doc, field, value) != bool(negated)
+               for negated, field, value in CLAUSE.findall(query))
+
+
+class IndexMiner(object):
+    """Counts search results in an in-memory index of ``docs``, in place
+    of a :class:`iamine.core.SearchMiner`.
+
+    :param ignore_query: (optional) Count every document, whatever the
+                         query, as a server that doesn't support it
+                         would.
+    :type ignore_query: bool
+    """
+
+    def __init__(self, docs, loop, ignore_query=False):
+        self.docs = docs
+        self.loop = loop
+        self.ignore_query = ignore_query
+        self.rate_limiter = TokenBucket(10 ** 6, loop=loop)
+
+    @asyncio.coroutine
+    def fetch_search_info(self, params):
+        yield from asyncio.sleep(0, loop=self.loop)
+        if self.ignore_query:
+            n = len(self.docs)
+        else:
+            n = sum(1 for doc in self.docs if matches(doc, params['q']))
+        return {'response': {'numFound': n}}
+
+
+class PartitionerTest(LoopTestCase):
+
+    def setUp(self):
+        super(PartitionerTest, self).setUp()
+        self.random = random.Random(0)
+
+    def partition(self, docs, **kwargs):
+        miner = IndexMiner(docs, self.loop)
+        partitioner = Partitioner(miner, **kwargs)
+        return self.run_coro(partitioner.partition())
+
+    def assertDisjointAndComplete(self, docs, partitions):
+        for doc in docs:
+            found = [q for q in partitions if matches(doc, q)]
+            self.assertEqual(len(found), 1, (doc, found))
+
+    def sizes(self, docs, partitions):
+        return [sum(1 for doc in docs if matches(doc, q)) for q in partitions]
+
+    def test_date(self):
+        start = _parse_date('2000-01-01T00:00:00Z')
+        end = _parse_date('2015-01-01T00:00:00Z')
+        docs = [{'identifier': 'item-{}'.format(i),
+                 'addeddate': _format_date(self.random.uniform(start, end))}
+                for i in range(500)]
+        # Items without a date, and outside of the range split, make up
+        # a partition of their own.
+        docs += [{'identifier': 'undated-{}'.format(i)} for i in range(5)]
+        docs += [{'identifier': 'early-{}'.format(i), 'addeddate': '1990-01-01T00:00:00Z'}
+                 for i in range(5)]
+        partitions = self.partition(docs, by='date', target=20)
+        self.assertDisjointAndComplete(docs, partitions)
+        sizes = self.sizes(docs, partitions)
+        self.assertLessEqual(max(sizes), 20)
+        self.assertNotIn(0, sizes)
+        self.assertGreaterEqual(len(partitions), 500 // 20)
+
+    def test_prefix(self):
+        alphabet = PREFIX_ALPHABET + '_-.'
+        docs = [{'identifier': self.random.choice(PREFIX_ALPHABET) + ''.join(
+                    self.random.choice(alphabet) for j in range(self.random.randint(1, 12)))}
+                for i in range(500)]
+        # Identifiers starting with characters prefixes aren't extended
+        # with, and identifiers equal to a prefix that is split.
+        docs += [{'identifier': '_private'}, {'identifier': 'Upper'}]
+        docs += [{'identifier': c} for c in 'abc']
+        partitions = self.partition(docs, by='prefix', target=10)
+        self.assertDisjointAndComplete(docs, partitions)
+        sizes = self.sizes(docs, partitions)
+        self.assertLessEqual(max(sizes), 10)
+        self.assertNotIn(0, sizes)
+        self.assertGreater(len(partitions), len(PREFIX_ALPHABET))
+
+    def test_collection(self):
+        docs = list()
+        for i in range(300):
+            collections = self.random.sample(['a', 'b', 'c'], self.random.randint(1, 2))
+            docs.append({'identifier': 'item-{}'.format(i),
+                         'collection': collections,
+                         'addeddate': _format_date(self.random.uniform(10 ** 9, 1.4 * 10 ** 9))})
+        partitions = self.partition(docs, by='collection', collections=['a', 'b'], target=20)
+        for doc in docs:
+            found = [q for q in partitions if matches(doc, q)]
+            # Items are found once per collection split by.
+            expected = len(set(doc['collection']) & set(['a', 'b']))
+            self.assertEqual(len(found), expected, (doc, found))
+        self.assertLessEqual(max(self.sizes(docs, partitions)), 20)
+
+    def test_collection_requires_collections(self):
+        miner = IndexMiner([], self.loop)
+        self.assertRaises(ValueError, Partitioner, miner, by='collection')
+        self.assertRaises(ValueError, Partitioner, miner, by='size')
+
+    def test_unsplittable_query(self):
+        docs = [{'identifier': 'item-{}'.format(i)} for i in range(100)]
+        miner = IndexMiner(docs, self.loop, ignore_query=True)
+        partitioner = Partitioner(miner, by='prefix', target=10)
+        partitions = self.run_coro(partitioner.partition('collection:a'))
+        self.assertEqual(partitions, ['collection:a'])
+        # A single level of sub-queries is probed.
+        self.assertEqual(partitioner.probes, 1 + len(PREFIX_ALPHABET))
+
+    def test_empty(self):
+        self.assertEqual(self.partition([], by='prefix'), [])
+        self.assertEqual(self.partition([], by='date'), [])
@@ -0,0 +1,51 @@
+import asyncio
+
+from iamine.ratelimit import TokenBucket
+
+from . import LoopTestCase
+
+
+class TokenBucketTest(LoopTestCase):
+
+    def test_burst(self):
+        bucket = TokenBucket(10, burst=5, loop=self.loop)
+        waits = [self.run_coro(bucket.acquire()) for i in range(5)]
+        self.assertEqual(waits, [0.0] * 5)
+
+    def test_burst_defaults_to_one_second(self):
+        self.assertEqual(TokenBucket(20, loop=self.loop).burst, 20)
+        self.assertEqual(TokenBucket(.5, loop=self.loop).burst, 1)
+
+    def test_waits_when_empty(self):
+        bucket = TokenBucket(20, burst=1, loop=self.loop)
+        self.run_coro(bucket.acquire())
+        start = self.loop.time()
+        wait = self.run_coro(bucket.acquire())
+        self.assertAlmostEqual(wait, .05, delta=.01)
+        self.assertGreaterEqual(self.loop.time() - start, .04)
+
+    def test_waiters_are_served_in_order(self):
+        bucket = TokenBucket(100, burst=1, loop=self.loop)
+        self.run_coro(bucket.acquire())
+        # Each waiter starts before the next one is made.
+        waiters = list()
+        for i in range(3):
+            waiters.append(asyncio.Task(bucket.acquire(), loop=self.loop))
+            self.spin()
+        waits = [self.run_coro(w) for w in waiters]
+        self.assertEqual(waits, sorted(waits))
+        self.assertAlmostEqual(waits[-1], .03, delta=.01)
+
+    def test_set_rate(self):
+        bucket = TokenBucket(10, burst=10, loop=self.loop)
+        bucket.set_rate(100, 2)
+        self.assertEqual((bucket.rate, bucket.burst), (100, 2))
+        # Tokens are capped to the new burst.
+        waits = [self.run_coro(bucket.acquire()) for i in range(3)]
+        self.assertEqual(waits[:2], [0.0, 0.0])
+        self.assertGreater(waits[2], 0)
+
+    def test_invalid_rate(self):
+        self.assertRaises(ValueError, TokenBucket, 0, loop=self.loop)
+        bucket = TokenBucket(1, loop=self.loop)
+        self.assertRaises(ValueError, bucket.set_rate, -1)
@@ -0,0 +1,98 @@
+import asyncio
+from types import SimpleNamespace
+
+from iamine.scheduler import Scheduler, PRIORITY_SEARCH, PRIORITY_ITEM
+
+from . import LoopTestCase
+
+
+def request(name, priority=None, job=None):
+    return SimpleNamespace(name=name, priority=priority, job=job)
+
+
+class SchedulerTest(LoopTestCase):
+
+    def drain(self, q):
+        names = list()
+        while not q.empty():
+            names.append(q.get_nowait().name)
+        return names
+
+    def test_priority(self):
+        q = Scheduler(loop=self.loop)
+        q.put_nowait(request('item-1', PRIORITY_ITEM))
+        q.put_nowait(request('search', PRIORITY_SEARCH))
+        q.put_nowait(request('item-2'))
+        self.assertEqual(self.drain(q), ['search', 'item-1', 'item-2'])
+
+    def test_jobs_share_by_weight(self):
+        q = Scheduler(loop=self.loop)
+        q.set_weight('a', 2)
+        for i in range(12):
+            q.put_nowait(request('a', job='a'))
+            q.put_nowait(request('b', job='b'))
+        first = self.drain(q)[:9]
+        self.assertEqual(first.count('a'), 6)
+        self.assertEqual(first.count('b'), 3)
+
+    def test_retries_are_not_starved(self):
+        q = Scheduler(retry_every=3, loop=self.loop)
+        for i in range(2):
+            q.retry(request('retry'), 0)
+        for i in range(6):
+            q.put_nowait(request('fresh'))
+        self.assertEqual(self.drain(q), ['fresh', 'fresh', 'retry',
+                                         'fresh', 'fresh', 'retry',
+                                         'fresh', 'fresh'])
+
+    def test_retries_of_a_higher_priority_go_first(self):
+        q = Scheduler(loop=self.loop)
+        q.retry(request('retry', PRIORITY_SEARCH), 0)
+        q.put_nowait(request('fresh', PRIORITY_ITEM))
+        self.assertEqual(self.drain(q), ['retry', 'fresh'])
+
+    def test_put_later(self):
+        q = Scheduler(loop=self.loop)
+        q.put_later(request('late'), .05)
+        q.put_later(request('later'), .1)
+        self.assertTrue(q.empty())
+        self.assertEqual(q.delayed, 2)
+        start = self.loop.time()
+        self.assertEqual(self.run_coro(q.get()).name, 'late')
+        self.assertEqual(self.run_coro(q.get()).name, 'later')
+        self.assertGreaterEqual(self.loop.time() - start, .09)
+        self.assertEqual(q.delayed, 0)
+
+    def test_delayed_requests_count_toward_maxsize(self):
+        q = Scheduler(maxsize=2, loop=self.loop)
+        q.put_later(request('late'), 60)
+        q.put_nowait(request('fresh'))
+        self.assertTrue(q.full())
+        self.assertRaises(asyncio.QueueFull, q.put_nowait, request('more'))
+        # Delayed requests are queued regardless.
+        q.retry(request('retry'), 60)
+        self.assertEqual(q.delayed, 2)
+
+    def test_put_waits_for_room(self):
+        q = Scheduler(maxsize=1, loop=self.loop)
+        q.put_nowait(request('first'))
+        putter = asyncio.Task(q.put(request('second')), loop=self.loop)
+        self.spin()
+        self.assertFalse(putter.done())
+        self.assertEqual(q.get_nowait().name, 'first')
+        self.run_coro(putter)
+        self.assertEqual(q.get_nowait().name, 'second')
+
+    def test_join(self):
+        q = Scheduler(loop=self.loop)
+        q.put_nowait(request('fresh'))
+        q.put_later(request('late'), .01)
+        joiner = asyncio.Task(q.join(), loop=self.loop)
+        self.run_coro(q.get())
+        q.task_done()
+        self.spin()
+        self.assertFalse(joiner.done())
+        self.run_coro(q.get())
+        q.task_done()
+        self.run_coro(joiner)
+        self.assertRaises(ValueError, q.task_done)
@@ -0,0 +1,41 @@
+from iamine.shard import ShardedMiner
+
+from .test_core import MockServerTestCase
+
+
+class ShardedMinerTest(MockServerTestCase):
+
+    def mine_items(self, identifiers, **kwargs):
+        miner, stream = self.miner(ShardedMiner, processes=2, chunk_size=10, max_tasks=5,
+                                   **kwargs)
+        try:
+            self.run_coro(miner.mine_items(identifiers), timeout=30)
+        finally:
+            miner.shutdown()
+        return miner, [r['metadata']['identifier'] for r in self.records(stream)]
+
+    def test_mine_items(self):
+        miner, mined = self.mine_items(self.identifiers())
+        self.assertEqual(sorted(mined), self.identifiers())
+        # Both workers finished, and reported their statistics.
+        self.assertEqual(len(miner.snapshots), 2)
+        self.assertEqual(miner.errors, [])
+
+    def test_ordered(self):
+        self.archive.latency = .01
+        identifiers = self.identifiers()[::-1]
+        miner, mined = self.mine_items(identifiers, ordered=True, window=15)
+        self.assertEqual(mined, identifiers)
+
+    def test_journal_resume(self):
+        journal = self.path('journal')
+        miner, mined = self.mine_items(self.identifiers(20), journal=journal)
+        self.assertEqual(len(mined), 20)
+
+        miner, mined = self.mine_items(self.identifiers(), journal=journal)
+        self.assertEqual(sorted(mined), self.identifiers()[20:])
+
+    def test_dedup(self):
+        miner, mined = self.mine_items(self.identifiers() * 2, dedup=True)
+        self.assertEqual(sorted(mined), self.identifiers())
+        self.assertEqual(miner.dedup.duplicates, self.items)
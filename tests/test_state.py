@@ -0,0 +1,66 @@
+import os
+import shutil
+import tempfile
+import unittest
+
+from iamine.state import StateStore, last_updated, updated_query
+
+
+class StateStoreTest(unittest.TestCase):
+
+    def setUp(self):
+        self.tmpdir = tempfile.mkdtemp()
+        self.path = os.path.join(self.tmpdir, 'state.db')
+
+    def tearDown(self):
+        shutil.rmtree(self.tmpdir)
+
+    def test_changed(self):
+        state = StateStore(self.path)
+        self.assertTrue(state.changed('item', '2015-01-01T00:00:00Z'))
+        state.record('item', '2015-01-01T00:00:00Z')
+        self.assertFalse(state.changed('item', '2015-01-01T00:00:00Z'))
+        self.assertTrue(state.changed('item', '2016-01-01T00:00:00Z'))
+        # Items without an indicator are always mined.
+        self.assertTrue(state.changed('item', None))
+        state.record('other', None)
+        self.assertTrue(state.changed('other', None))
+        state.close()
+
+    def test_persists(self):
+        state = StateStore(self.path, commit_every=1000)
+        state.record('item', '2015-01-01T00:00:00Z')
+        state.close()
+
+        state = StateStore(self.path)
+        self.assertEqual(state.get('item'), '2015-01-01T00:00:00Z')
+        self.assertIsNone(state.get('missing'))
+        state.close()
+
+    def test_since(self):
+        state = StateStore(self.path, overlap=60)
+        self.assertIsNone(state.since('collection:a'))
+        state.finish_run('collection:a', 1000)
+        state.close()
+
+        state = StateStore(self.path, overlap=60)
+        self.assertEqual(state.since('collection:a'), 940)
+        self.assertIsNone(state.since('collection:b'))
+        state.finish_run('collection:a', 2000)
+        self.assertEqual(state.since('collection:a'), 1940)
+        state.close()
+
+
+class HelpersTest(unittest.TestCase):
+
+    def test_last_updated(self):
+        doc = {'oai_updatedate': ['2015-01-01T00:00:00Z', '2016-01-01T00:00:00Z']}
+        self.assertEqual(last_updated(doc), '2016-01-01T00:00:00Z')
+        self.assertEqual(last_updated({'oai_updatedate': '2015-01-01T00:00:00Z'}),
+                         '2015-01-01T00:00:00Z')
+        self.assertIsNone(last_updated({'oai_updatedate': []}))
+        self.assertIsNone(last_updated({'identifier': 'item'}))
+
+    def test_updated_query(self):
+        self.assertEqual(updated_query('collection:a', 86400),
+                         '(collection:a) AND oai_updatedate:[1970-01-02T00:00:00Z TO null]')